@@ -1,16 +1,320 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, g, jsonify, Response
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 import os  # Add this import
+import re
+
+from db import ConnectionPool, Writer
+from directory import DirectoryCache
+from exports import EXPORTS, FORMATS, stream_export
+from httpcache import ConditionalGet, HTMLCache
+from instrumentation import InstrumentedConnection, SQLMetrics, histogram_lines, metric_lines
+from main import SCHEMA_VERSION, parse_publication_year, schema_mismatch, schema_version
+from recommend import count_pending, recommendations
+from scheduling import BookingError, book_event, free_rooms
+from summaries import read_summary
+from templating import FragmentCache
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # Add this line - generates a random secret key
+app.config['DATABASE'] = os.environ.get('LIBRARY_DB', 'library.db')
+app.config['DB_POOL_SIZE'] = int(os.environ.get('LIBRARY_DB_POOL_SIZE', 8))
+app.config['DIRECTORY_CACHE_TTL'] = int(os.environ.get('LIBRARY_DIRECTORY_TTL', 300))
+app.config['SQL_INSTRUMENTATION'] = os.environ.get('LIBRARY_SQL_INSTRUMENTATION', '1') != '0'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('LIBRARY_SLOW_QUERY_MS', 100))
+app.config['HTML_CACHE_SIZE'] = int(os.environ.get('LIBRARY_HTML_CACHE_SIZE', 0))
+# Group commit: up to this many queued writes share one transaction (1 = off)
+app.config['GROUP_COMMIT_ROWS'] = int(os.environ.get('LIBRARY_GROUP_COMMIT_ROWS', 1))
+app.config['GROUP_COMMIT_MS'] = float(os.environ.get('LIBRARY_GROUP_COMMIT_MS', 5))
+# FULL syncs every commit to disk before a write is acknowledged
+app.config['DB_SYNCHRONOUS'] = os.environ.get('LIBRARY_DB_SYNCHRONOUS', 'NORMAL').upper()
+# Compiled templates are kept here (default: a directory under the system temp dir)
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('LIBRARY_TEMPLATE_CACHE_DIR')
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('LIBRARY_FRAGMENT_CACHE_SIZE', 256))
+# Search ranks at most this many matching items (0 = all of them)
+app.config['SEARCH_RANK_LIMIT'] = int(os.environ.get('LIBRARY_SEARCH_RANK_LIMIT', 2000))
+
+# Member/donor lists shared by the borrow, return, donate, events and help pages
+directory_cache = DirectoryCache(ttl=app.config['DIRECTORY_CACHE_TTL'])
+
+# Per-statement and per-route timings, served at /metrics
+sql_metrics = SQLMetrics(slow_query_seconds=app.config['SLOW_QUERY_MS'] / 1000)
+
+# Both are created on first use. The locks stop concurrent first requests
+# from each building one: two Writers would be two writing connections.
+_pool = None
+_pool_lock = threading.Lock()
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_pool():
+    # Read-only connections for the queries every page runs
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # opening the writer switches the file to WAL first, so
+                # readers never wait for it
+                check_schema()
+                _pool = ConnectionPool(app.config['DATABASE'], max_size=app.config['DB_POOL_SIZE'],
+                                       read_only=True)
+    return _pool
+
+def get_writer():
+    # The one read-write connection; all writes are queued onto its thread
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = Writer(app.config['DATABASE'], batch_size=app.config['GROUP_COMMIT_ROWS'],
+                                 batch_wait=app.config['GROUP_COMMIT_MS'] / 1000,
+                                 synchronous=app.config['DB_SYNCHRONOUS'])
+    return _writer
+
+def check_schema():
+    # The app never creates or migrates tables itself (that's `python main.py
+    # init`); it only refuses to serve a database it doesn't match
+    version = get_writer().run(schema_version)
+    if version != SCHEMA_VERSION:
+        raise RuntimeError(schema_mismatch(app.config['DATABASE'], version))
+    return version
+
+def write(fn, *args, group=False):
+    # Run fn(conn, *args) as one transaction on the writer and wait for the
+    # committed result. group=True lets high-volume inserts wait a few ms to
+    # share a commit. Statements are recorded with the request's queries.
+    if not app.config['SQL_INSTRUMENTATION']:
+        return get_writer().run(fn, *args, group=group)
+    records = g.setdefault('queries', [])
+
+    def instrumented(conn, *args):
+        return fn(InstrumentedConnection(conn, sql_metrics, records), *args)
+    return get_writer().run(instrumented, *args, group=group)
 
 def get_db_connection():
-    print("Connecting to database...")
-    conn = sqlite3.connect('library.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # One pooled read-only connection per request, handed back in
+    # close_db_connection. Writes go through write().
+    if 'db' not in g:
+        conn = get_pool().checkout()
+        if app.config['SQL_INSTRUMENTATION']:
+            conn = InstrumentedConnection(conn, sql_metrics, g.setdefault('queries', []))
+        g.db = conn
+    return g.db
+
+@app.teardown_appcontext
+def close_db_connection(exception):
+    conn = g.pop('db', None)
+    if isinstance(conn, InstrumentedConnection):
+        conn = conn.connection
+    if conn is not None:
+        get_pool().checkin(conn)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.queries = []
+
+@app.after_request
+def record_request_timing(response):
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        seconds = time.perf_counter() - g.request_start
+        sql_metrics.observe_request(route, request.method, response.status_code, seconds, g.queries)
+        if app.debug:
+            add_server_timing(response, seconds)
+    return response
+
+# Debug mode only: time each render_template call and report it next to the
+# request's SQL time in a Server-Timing header (shown in the browser's
+# network panel) and the debug log
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    if app.debug:
+        g.setdefault('template_starts', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def stop_template_timer(sender, template, context, **extra):
+    if app.debug and g.get('template_starts'):
+        seconds = time.perf_counter() - g.template_starts.pop()
+        g.setdefault('template_timings', []).append((template.name, seconds))
+
+def add_server_timing(response, seconds):
+    sql_seconds = sum(record.seconds for record in g.queries)
+    timings = g.get('template_timings', [])
+    entries = [f'sql;dur={sql_seconds * 1000:.2f};desc="{len(g.queries)} queries"']
+    entries += [f'tpl;dur={t * 1000:.2f};desc="{name}"' for name, t in timings]
+    entries.append(f'total;dur={seconds * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    app.logger.debug("%s %s: %.1f ms SQL, %s of %.1f ms", request.method, request.path,
+                     sql_seconds * 1000,
+                     ', '.join(f'{name} {t * 1000:.1f} ms' for name, t in timings) or 'no templates',
+                     seconds * 1000)
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text exposition format
+    pool = get_pool().stats()
+    cache = directory_cache.stats()
+    lines = sql_metrics.render()
+    writer = get_writer().stats()
+    lines += metric_lines('library_db_pool_connections', 'gauge', "Open pooled connections.", pool['size'])
+    lines += metric_lines('library_db_pool_max_connections', 'gauge', "Pool size limit.", pool['max_size'])
+    lines += metric_lines('library_db_pool_in_use', 'gauge', "Connections checked out.", pool['in_use'])
+    lines += metric_lines('library_db_pool_checkouts_total', 'counter', "Connection checkouts.",
+                          pool['checkouts'])
+    lines += metric_lines('library_db_pool_waits_total', 'counter', "Checkouts that had to wait.",
+                          pool['waits'])
+    lines += metric_lines('library_db_pool_wait_seconds_total', 'counter', "Time spent waiting for a connection.",
+                          pool['wait_time_total'])
+    lines += metric_lines('library_db_pool_wait_seconds_max', 'gauge', "Longest wait for a connection.",
+                          pool['wait_time_max'])
+    lines += metric_lines('library_db_writes_total', 'counter', "Writes run by the writer.",
+                          writer['writes'])
+    lines += metric_lines('library_db_write_failures_total', 'counter', "Writes that raised.",
+                          writer['failures'])
+    lines += metric_lines('library_db_write_queue_depth', 'gauge', "Writes waiting for the writer.",
+                          writer['queued'])
+    lines += metric_lines('library_db_write_queue_seconds_total', 'counter', "Time writes spent queued.",
+                          writer['queue_time_total'])
+    lines += metric_lines('library_db_write_seconds_total', 'counter', "Time spent running writes.",
+                          writer['busy_time_total'])
+    lines += metric_lines('library_db_write_batches_total', 'counter', "Write transactions committed.",
+                          writer['batches'])
+    lines += histogram_lines('library_db_write_batch_size', "Writes per committed transaction.",
+                             writer['batch_size_buckets'], writer['writes'], writer['batches'])
+    lines += histogram_lines('library_db_write_batch_seconds', "Time to run and commit a write batch.",
+                             writer['batch_seconds_buckets'], writer['busy_time_total'], writer['batches'])
+    lines += metric_lines('library_directory_cache_hits_total', 'counter', "Directory cache hits.",
+                          cache['hits'])
+    lines += metric_lines('library_directory_cache_misses_total', 'counter', "Directory cache misses.",
+                          cache['misses'])
+    lines += metric_lines('library_directory_cache_invalidations_total', 'counter',
+                          "Directory cache invalidations.", cache['invalidations'])
+    lines += metric_lines('library_directory_cache_entries', 'gauge', "Cached directory lists.",
+                          cache['entries'])
+    lines += metric_lines('library_http_not_modified_total', 'counter', "Conditional GETs answered with 304.",
+                          conditional_get.not_modified)
+    if html_cache is not None:
+        pages = html_cache.stats()
+        lines += metric_lines('library_html_cache_hits_total', 'counter', "Rendered pages served from cache.",
+                              pages['hits'])
+        lines += metric_lines('library_html_cache_misses_total', 'counter', "Pages rendered on a cache miss.",
+                              pages['misses'])
+        lines += metric_lines('library_html_cache_entries', 'gauge', "Cached pages.", pages['entries'])
+    if app.jinja_env.fragment_cache is not None:
+        fragments = app.jinja_env.fragment_cache.stats()
+        lines += metric_lines('library_fragment_cache_hits_total', 'counter', "Template fragments served from cache.",
+                              fragments['hits'])
+        lines += metric_lines('library_fragment_cache_misses_total', 'counter', "Template fragments rendered.",
+                              fragments['misses'])
+        lines += metric_lines('library_fragment_cache_entries', 'gauge', "Cached template fragments.",
+                              fragments['entries'])
+    adapter = app.extensions.get('asgi')
+    if adapter is not None:
+        serving = adapter.stats()
+        lines += metric_lines('library_asgi_workers', 'gauge', "Threads running the app.", serving['workers'])
+        lines += metric_lines('library_asgi_admitted', 'gauge', "Requests running or waiting for a thread.",
+                              serving['admitted'])
+        lines += metric_lines('library_asgi_requests_total', 'counter', "Requests admitted.",
+                              serving['requests'])
+        lines += metric_lines('library_asgi_rejected_total', 'counter', "Requests shed with a 503.",
+                              serving['rejected'])
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def template_stamp():
+    # Part of every ETag, so pages cached by browsers before a template or
+    # code change are not reused; the same across worker processes
+    folder = os.path.join(app.root_path, app.template_folder)
+    paths = [__file__] + [os.path.join(folder, name) for name in os.listdir(folder)]
+    return format(int(max(os.path.getmtime(path) for path in paths)), 'x')
+
+# ETag/304 handling for the catalogue and event listings, with an optional
+# cache of the rendered HTML (LIBRARY_HTML_CACHE_SIZE pages, 0 = off)
+html_cache = HTMLCache(app.config['HTML_CACHE_SIZE']) if app.config['HTML_CACHE_SIZE'] else None
+conditional_get = ConditionalGet(get_db_connection, salt=template_stamp(), html_cache=html_cache)
+
+# Templates: compiled bytecode is cached on disk, and {% cache %} blocks
+# (templating.py) reuse rendered table bodies while their data is unchanged
+if app.config['TEMPLATE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+app.jinja_env.add_extension(FragmentCache)
+if app.config['FRAGMENT_CACHE_SIZE']:
+    app.jinja_env.fragment_cache = HTMLCache(app.config['FRAGMENT_CACHE_SIZE'])
+app.jinja_env.fragment_versions = conditional_get.recorded
+
+def snapshot_versions(*names):
+    # Read the DataVersion counters a cached fragment depends on. Call this
+    # before querying its rows.
+    if app.jinja_env.fragment_cache is not None:
+        conditional_get.read(names)
+
+def get_member_name(conn, member_id):
+    if not member_id:
+        return None
+    member = conn.execute("""
+        SELECT p.Name
+        FROM Person p
+        JOIN Member m ON p.PersonID = m.MemberID
+        WHERE p.PersonID = ?
+    """, (member_id,)).fetchone()
+    return member['Name'] if member else None
+
+MEMBER_LOOKUP_LIMIT = 10
+MAX_MEMBER_LOOKUP_LIMIT = 50
+
+def member_id_ranges(prefix, max_id):
+    # IDs starting with "12" are 12, 120-129, 1200-1299, ... so an ID prefix
+    # becomes a handful of primary key range scans
+    low, width = int(prefix), 1
+    while low <= max_id:
+        yield low, low + width
+        low, width = low * 10, width * 10
+
+@app.route('/api/members')
+def member_lookup():
+    # Typeahead for the member pickers: top matches by name or ID prefix
+    conn = get_db_connection()
+    term = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', MEMBER_LOOKUP_LIMIT))
+    except ValueError:
+        limit = MEMBER_LOOKUP_LIMIT
+    limit = max(1, min(limit, MAX_MEMBER_LOOKUP_LIMIT))
+
+    members = []
+    if term.isdigit():
+        if not term.startswith('0'):
+            max_id = conn.execute("SELECT MAX(PersonID) FROM Person").fetchone()[0] or 0
+            for low, high in member_id_ranges(term, max_id):
+                members += conn.execute("""
+                    SELECT p.PersonID, p.Name
+                    FROM Person p
+                    JOIN Member m ON p.PersonID = m.MemberID
+                    WHERE p.PersonID >= ? AND p.PersonID < ? AND p.Role = 'Member'
+                    ORDER BY p.PersonID
+                    LIMIT ?
+                """, (low, high, limit - len(members))).fetchall()
+                if len(members) >= limit:
+                    break
+    else:
+        # Served by the PersonRoleName index (case-insensitive prefix range)
+        pattern = re.sub(r'([\\%_])', r'\\\1', term) + '%'
+        members = conn.execute("""
+            SELECT p.PersonID, p.Name
+            FROM Person p
+            JOIN Member m ON p.PersonID = m.MemberID
+            WHERE p.Role = 'Member' AND p.Name LIKE ? ESCAPE '\\'
+            ORDER BY p.Name COLLATE NOCASE
+            LIMIT ?
+        """, (pattern, limit)).fetchall()
+
+    return jsonify([{'id': m['PersonID'], 'name': m['Name']} for m in members])
 
 @app.route('/')
 def index():
@@ -20,21 +324,186 @@ def index():
 def home():
     return render_template('home.html')
 
+# A last word shorter than this is matched whole, not as a prefix: a
+# one-letter prefix matches most of the catalogue and has no prefix index
+MIN_PREFIX = 2
+
+def fts_query(search_term):
+    # Quote each word so user input can't inject FTS5 syntax; the last word
+    # is matched as a prefix so partially typed terms still find items
+    words = re.findall(r'\w+', search_term)
+    if not words:
+        return None
+    query = ' '.join(f'"{word}"' for word in words)
+    return query + '*' if len(words[-1]) >= MIN_PREFIX else query
+
+ITEM_PAGE_SIZE = 50
+MAX_ITEM_PAGE_SIZE = 200
+
+# Search results are ranked by bm25 (weighted towards title and author);
+# ItemID breaks ties so (score, ItemID) is a stable keyset cursor. bm25 has
+# to score every match before the best can be picked, so only the first
+# SEARCH_RANK_LIMIT matches (in ItemID order) are ranked: a word found in
+# most of a million items would otherwise take over a second.
+ITEM_SEARCH_SQL = """
+    SELECT i.*, m.Score
+    FROM (
+        SELECT rowid, bm25(ItemSearch, 10.0, 5.0, 2.0, 1.0) AS Score
+        FROM ItemSearch
+        WHERE ItemSearch MATCH ?
+        LIMIT ?
+    ) m
+    JOIN Item i ON i.ItemID = m.rowid
+"""
+
+def rank_limit():
+    # LIMIT -1 is no limit
+    return app.config['SEARCH_RANK_LIMIT'] or -1
+
+def search_capped(conn, query):
+    # True if more items match than are ranked
+    limit = app.config['SEARCH_RANK_LIMIT']
+    return bool(limit) and conn.execute("""
+        SELECT 1 FROM ItemSearch WHERE ItemSearch MATCH ? LIMIT 1 OFFSET ?
+    """, (query, limit)).fetchone() is not None
+
+def parse_cursor(value, searching):
+    # Cursors are "ItemID" when browsing and "score:ItemID" for search results
+    if not value:
+        return None
+    try:
+        if searching:
+            score, item_id = value.split(':')
+            return (float(score), int(item_id))
+        return (int(value),)
+    except ValueError:
+        return None
+
+def format_cursor(item, searching):
+    if searching:
+        return f"{item['Score']!r}:{item['ItemID']}"
+    return str(item['ItemID'])
+
+def get_item_page(conn, query, after, before, per_page):
+    # Keyset pagination: each page is an index seek from the cursor, so the
+    # cost doesn't grow with how deep into the catalogue the page is
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    op, direction = ('<', 'DESC') if backwards else ('>', 'ASC')
+
+    if query:
+        sql = ITEM_SEARCH_SQL
+        params = [query, rank_limit()]
+        if cursor:
+            sql += f" WHERE (m.Score, i.ItemID) {op} (?, ?)"
+            params += list(cursor)
+        sql += f" ORDER BY m.Score {direction}, i.ItemID {direction} LIMIT ?"
+    else:
+        sql = "SELECT * FROM Item"
+        params = []
+        if cursor:
+            sql += f" WHERE ItemID {op} ?"
+            params += list(cursor)
+        sql += f" ORDER BY ItemID {direction} LIMIT ?"
+    params.append(per_page + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+    return rows, has_prev and bool(rows), has_next and bool(rows)
+
 # Find Item
 @app.route('/find-item', methods=['GET', 'POST'])
+@conditional_get('Item', 'Loan')
 def find_item():
-    conn = get_db_connection()
     if request.method == 'POST':
-        search_term = request.form['search_term']
-        items = conn.execute(
-            "SELECT * FROM Item WHERE Title LIKE ? OR AuthorPublisher LIKE ?",
-            (f'%{search_term}%', f'%{search_term}%')
-        ).fetchall()
-    else:
-        # Get all items when it's a GET request
-        items = conn.execute("SELECT * FROM Item").fetchall()
-    conn.close()
-    return render_template('find_item.html', items=items)
+        # Searches are plain GETs so result pages can be linked and paged
+        return redirect(url_for('find_item', q=request.form['search_term'],
+                                per_page=request.form.get('per_page')))
+
+    conn = get_db_connection()
+    search_term = request.args.get('q', '').strip()
+    try:
+        per_page = int(request.args.get('per_page', ITEM_PAGE_SIZE))
+    except ValueError:
+        per_page = ITEM_PAGE_SIZE
+    per_page = max(1, min(per_page, MAX_ITEM_PAGE_SIZE))
+
+    query = fts_query(search_term) if search_term else None
+    searching = query is not None
+    items, has_prev, has_next = [], False, False
+    if query or not search_term:
+        after = parse_cursor(request.args.get('after'), searching)
+        before = parse_cursor(request.args.get('before'), searching)
+        items, has_prev, has_next = get_item_page(conn, query, after, before, per_page)
+
+    # "Also borrowed" for the top hit of a search
+    top_hit, also_borrowed, capped = None, [], False
+    if searching and items and not has_prev:
+        top_hit = items[0]
+        also_borrowed = recommendations(conn, top_hit['ItemID'])
+        capped = search_capped(conn, query)
+
+    prev_url = next_url = None
+    if has_prev:
+        prev_url = url_for('find_item', q=search_term or None, per_page=per_page,
+                           before=format_cursor(items[0], searching))
+    if has_next:
+        next_url = url_for('find_item', q=search_term or None, per_page=per_page,
+                           after=format_cursor(items[-1], searching))
+
+    return render_template('find_item.html', items=items, search_term=search_term,
+                           per_page=per_page, prev_url=prev_url, next_url=next_url,
+                           top_hit=top_hit, also_borrowed=also_borrowed, capped=capped,
+                           rank_limit=app.config['SEARCH_RANK_LIMIT'])
+
+def borrow(conn, member_id, item_id):
+    # Single conditional write: the loan is only inserted while the item is
+    # still available (or waiting for this member on a Ready hold), and the
+    # UpdateItemStatusOnBorrow trigger marks it as loaned in the same
+    # statement. Run under BEGIN IMMEDIATE so two requests can't both see the
+    # item as available. Returns False if it wasn't.
+    borrow_date = datetime.now().strftime('%Y-%m-%d')
+    due_date = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
+    cur = conn.execute("""
+        INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate, BorrowDate)
+        SELECT ?, ?, ?, ?
+        WHERE EXISTS (SELECT 1 FROM Item WHERE ItemID = ? AND AvailabilityStatus = 1)
+           OR EXISTS (SELECT 1 FROM Hold WHERE ItemID = ? AND MemberID = ? AND Status = 'Ready')
+    """, (member_id, item_id, due_date, borrow_date, item_id, item_id, member_id))
+    return cur.rowcount == 1
+
+def hold_position(conn, hold_id):
+    # 1 for the head of the queue; counts the waiting holds ahead of this one
+    return conn.execute("""
+        SELECT COUNT(*) FROM Hold h
+        JOIN Hold mine ON mine.HoldID = ?
+        WHERE h.ItemID = mine.ItemID AND h.Status = 'Waiting'
+          AND (h.Priority > mine.Priority OR (h.Priority = mine.Priority AND h.HoldID <= mine.HoldID))
+    """, (hold_id,)).fetchone()[0]
+
+def place_hold(conn, member_id, item_id, priority=0):
+    # Returns (status, place in the queue). Holds are only taken on items
+    # that are out; the HoldOpenByMember index allows one per member.
+    item = conn.execute("SELECT AvailabilityStatus FROM Item WHERE ItemID = ?", (item_id,)).fetchone()
+    if item is None:
+        return 'no such item', None
+    if item[0] == 1:
+        return 'available', None
+    held = conn.execute("""
+        SELECT HoldID, Status FROM Hold
+        WHERE MemberID = ? AND ItemID = ? AND Status IN ('Waiting', 'Ready')
+    """, (member_id, item_id)).fetchone()
+    if held is not None:
+        return ('ready', 0) if held[1] == 'Ready' else ('already held', hold_position(conn, held[0]))
+    cur = conn.execute("INSERT INTO Hold (ItemID, MemberID, Priority) VALUES (?, ?, ?)",
+                       (item_id, member_id, priority))
+    return 'placed', hold_position(conn, cur.lastrowid)
 
 # Borrow Item
 @app.route('/borrow-item', methods=['GET', 'POST'])
@@ -43,70 +512,100 @@ def borrow_item():
 
     # Get all items and members for display
     items = conn.execute("SELECT * FROM Item").fetchall()
-    members = conn.execute("""
-        SELECT p.PersonID, p.Name 
-        FROM Person p
-        JOIN Member m ON p.PersonID = m.MemberID
-        WHERE p.Role = 'Member'
-    """).fetchall()
+    members = directory_cache.members(conn)
+    # Items returned to the hold shelf, waiting for a member to collect them
+    held_items = {row[0] for row in conn.execute("SELECT ItemID FROM Hold WHERE Status = 'Ready'")}
 
     if request.method == 'POST':
         member_id = request.form['member_id']
         item_id = request.form['item_id']
+        if request.form.get('action') == 'hold':
+            try:
+                status, position = write(place_hold, member_id, item_id)
+            except sqlite3.Error as e:
+                status, position = str(e), None
+            if status == 'placed':
+                return redirect(url_for('borrow_item', held=position))
+            errors = {
+                'available': "This item is available now, so you can borrow it straight away.",
+                'ready': "This item is waiting for you on the hold shelf. Borrow it now.",
+                'already held': f"You already have a hold on this item (number {position} in the queue).",
+                'no such item': "Item not found.",
+            }
+            return render_template('borrow_item.html', items=items, members=members,
+                                   held_items=held_items, error=errors.get(status, status))
         try:
-            # Check if item is available
-            item = conn.execute("SELECT AvailabilityStatus FROM Item WHERE ItemID = ?", (item_id,)).fetchone()
-            if not item or not item['AvailabilityStatus']:
-                return render_template('borrow_item.html', 
-                                      items=items, 
-                                      members=members,
-                                      error="Item is not available for borrowing")
-
-            borrow_date = datetime.now().strftime('%Y-%m-%d')
-            due_date = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
-
-            # Create borrowing record
-            conn.execute('INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate, BorrowDate) '
-                        'VALUES (?, ?, ?, ?)',
-                        (member_id, item_id, due_date, borrow_date))
-
-            # Update item availability
-            conn.execute('UPDATE Item SET AvailabilityStatus = 0 WHERE ItemID = ?', (item_id,))
-
-            conn.commit()
-            conn.close()
-            return redirect(url_for('borrow_item', success=True))
+            borrowed = write(borrow, member_id, item_id)
         except sqlite3.Error as e:
             return render_template('borrow_item.html', 
                                  items=items, 
                                  members=members,
+                                 held_items=held_items,
                                  error=str(e))
-
-    conn.close()
-    return render_template('borrow_item.html', items=items, members=members)
+        if not borrowed:
+            return render_template('borrow_item.html', 
+                                  items=items, 
+                                  members=members,
+                                  held_items=held_items,
+                                  error="Item is not available for borrowing. Place a hold to join the queue.")
+        update_recommendations()
+        return redirect(url_for('borrow_item', success=True))
+
+    return render_template('borrow_item.html', items=items, members=members, held_items=held_items,
+                           held=request.args.get('held', type=int))
+
+_counting_queued = threading.Event()
+
+def update_recommendations():
+    # Count the new loan's co-borrows (recommend.py) in a transaction of its
+    # own once the borrow has committed; the response doesn't wait for it.
+    # While one count is waiting on the writer, later borrows leave it to
+    # that one, so under load a single job counts many loans.
+    if _counting_queued.is_set():
+        return
+    _counting_queued.set()
+
+    def count(conn):
+        _counting_queued.clear()
+        return count_pending(conn)
+
+    def log_failure(future):
+        if future.exception() is not None:
+            _counting_queued.clear()
+            app.logger.error("Updating recommendations failed: %s", future.exception())
+    get_writer().submit(count).add_done_callback(log_failure)
+
+def return_loan(conn, record_id):
+    # The UpdateItemStatusOnReturn trigger either makes the item available
+    # or, if members are queued for it, marks the head of the queue Ready, in
+    # the same transaction. Returns the member the item is now held for.
+    cur = conn.execute("""
+        UPDATE BorrowingRecord 
+        SET ReturnDate = DATE('now') 
+        WHERE RecordID = ? AND ReturnDate IS NULL
+    """, (record_id,))
+    if cur.rowcount == 0:
+        return None
+    held = conn.execute("""
+        SELECT h.MemberID FROM Hold h
+        JOIN BorrowingRecord br ON br.ItemID = h.ItemID
+        WHERE br.RecordID = ? AND h.Status = 'Ready'
+    """, (record_id,)).fetchone()
+    return held[0] if held else None
 
 # Return Item
 @app.route('/return-item', methods=['GET', 'POST'])
 def return_item():
+    selected_member = request.form.get('member_id') if request.method == 'POST' else None
     try:
         conn = get_db_connection()
-        
-        # Get all members for display
-        members = conn.execute("""
-            SELECT p.PersonID, p.Name 
-            FROM Person p
-            JOIN Member m ON p.PersonID = m.MemberID
-            WHERE p.Role = 'Member'
-            ORDER BY p.Name
-        """).fetchall()
-        
-        selected_member = request.form.get('member_id') if request.method == 'POST' else None
         borrowed_items = []
         
         if request.method == 'POST':
             # Handle member selection
             if 'select_member' in request.form:
                 selected_member = request.form['member_id']
+                snapshot_versions('Loan', 'Item')
                 borrowed_items = conn.execute("""
                     SELECT br.RecordID, i.Title, i.ItemID, br.BorrowDate, br.DueDate
                     FROM BorrowingRecord br
@@ -119,23 +618,8 @@ def return_item():
                 record_id = request.form['record_id']
                 selected_member = request.form['member_id']
                 
-                # Update borrowing record
-                conn.execute("""
-                    UPDATE BorrowingRecord 
-                    SET ReturnDate = DATE('now') 
-                    WHERE RecordID = ?
-                """, (record_id,))
-                
-                # Update item availability
-                conn.execute("""
-                    UPDATE Item 
-                    SET AvailabilityStatus = 1 
-                    WHERE ItemID = (
-                        SELECT ItemID FROM BorrowingRecord WHERE RecordID = ?
-                    )
-                """, (record_id,))
-                
-                conn.commit()
+                held_for = write(return_loan, record_id)
+                snapshot_versions('Loan', 'Item')
                 
                 # Get updated borrowed items
                 borrowed_items = conn.execute("""
@@ -145,23 +629,38 @@ def return_item():
                     WHERE br.MemberID = ? AND br.ReturnDate IS NULL
                 """, (selected_member,)).fetchall()
                 
-                flash('Item successfully returned!', 'success')
+                if held_for:
+                    flash('Item successfully returned! It is on the hold shelf for the next member in the queue.',
+                          'success')
+                else:
+                    flash('Item successfully returned!', 'success')
         
         return render_template('return_item.html',
-                            members=members,
                             borrowed_items=borrowed_items,
-                            selected_member=selected_member)
+                            selected_member=selected_member,
+                            selected_member_name=get_member_name(conn, selected_member))
     
     except sqlite3.Error as e:
         flash(f'Database error: {str(e)}', 'error')
         return render_template('return_item.html',
-                            members=members,
                             borrowed_items=[],
                             selected_member=selected_member)
-    
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+def record_donation(conn, donor_id, date_received, item):
+    # First add the item to the Item table
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO Item (Title, Type, AuthorPublisher, ISBN, PublicationYear, AvailabilityStatus)
+            VALUES (?, ?, ?, ?, ?, 1)
+        """, item)
+    item_id = cur.lastrowid
+
+    # Then record the donation
+    cur.execute("""
+        INSERT INTO Donation (DonorID, ItemID, DateReceived)
+            VALUES (?, ?, ?)
+        """, (donor_id, item_id, date_received))
+    return item_id
 
 # Donate Item
 @app.route('/donate-item', methods=['GET', 'POST'])
@@ -169,11 +668,7 @@ def donate_item():
     conn = get_db_connection()
 
     # Get all potential donors (people who aren't necessarily members)
-    donors = conn.execute("""
-        SELECT PersonID, Name FROM Person
-            WHERE Role IN ('Member', 'Volunteer', 'Donor')
-            ORDER BY Name
-        """).fetchall()
+    donors = directory_cache.donors(conn)
 
     if request.method == 'POST':
         # Check if the donor selection form was submitted
@@ -195,50 +690,62 @@ def donate_item():
         # Validate publication year
         if publication_year:
             try:
-                publication_year = int(publication_year)
-                if publication_year < 1000 or publication_year > datetime.now().year:
-                    raise ValueError("Invalid publication year")
+                publication_year = parse_publication_year(publication_year)
             except ValueError:
                 return render_template('donate_item.html', donors=donors, selected_donor=donor_id, error="Invalid publication year")
 
         try:
-            # First add the item to the Item table
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO Item (Title, Type, AuthorPublisher, ISBN, PublicationYear, AvailabilityStatus)
-                    VALUES (?, ?, ?, ?, ?, 1)
-                """, (item_title, item_type, author_publisher, isbn, publication_year))
-            item_id = cur.lastrowid
-
-            # Then record the donation
-            cur.execute("""
-                INSERT INTO Donation (DonorID, ItemID, DateReceived)
-                    VALUES (?, ?, ?)
-                """, (donor_id, item_id, date_received))
-
-            conn.commit()
-            conn.close()
+            write(record_donation, donor_id, date_received,
+                  (item_title, item_type, author_publisher, isbn, publication_year))
             return redirect(url_for('donate_item', success=True))
         except sqlite3.Error as e:
             return render_template('donate_item.html', donors=donors, selected_donor=donor_id, error=str(e))
 
-    conn.close()
     return render_template('donate_item.html', donors=donors)
 
+def register_for_event(conn, event_id, member_id):
+    # The place is taken first, by one UPDATE that checks capacity and that
+    # the member isn't already registered (the unique (EventID, MemberID)
+    # index answers that), so concurrent registrations can never push
+    # Attendance past MaxCapacity. A rejected registration writes nothing,
+    # so it doesn't bump the 'Event' version and empty the page caches.
+    cur = conn.execute("""
+        UPDATE Event
+        SET Attendance = Attendance + 1
+        WHERE EventID = ? AND Attendance < MaxCapacity
+          AND NOT EXISTS (SELECT 1 FROM EventRegistration WHERE EventID = ? AND MemberID = ?)
+    """, (event_id, event_id, member_id))
+    if cur.rowcount == 0:
+        event = conn.execute("""
+            SELECT EXISTS (SELECT 1 FROM EventRegistration WHERE EventID = ? AND MemberID = ?)
+            FROM Event WHERE EventID = ?
+        """, (event_id, member_id, event_id)).fetchone()
+        if event is None:
+            return 'no such event'
+        return 'already registered' if event[0] else 'full'
+    conn.execute("INSERT INTO EventRegistration (EventID, MemberID) VALUES (?, ?)", (event_id, member_id))
+    return 'registered'
+
+def unregister_from_event(conn, event_id, member_id):
+    cur = conn.execute("""
+        DELETE FROM EventRegistration
+        WHERE EventID = ? AND MemberID = ?
+    """, (event_id, member_id))
+    if cur.rowcount == 0:
+        return False
+    conn.execute("""
+        UPDATE Event 
+        SET Attendance = Attendance - 1 
+        WHERE EventID = ? AND Attendance > 0
+    """, (event_id,))
+    return True
+
 #Find Event
 @app.route('/find-events', methods=['GET', 'POST'])
+@conditional_get('Event')
 def find_events():
     conn = get_db_connection()
 
-    # Get all members for selection
-    members = conn.execute("""
-        SELECT p.PersonID, p.Name 
-        FROM Person p
-        JOIN Member m ON p.PersonID = m.MemberID
-        WHERE p.Role = 'Member'
-        ORDER BY p.Name
-    """).fetchall()
-
     selected_member = None
     search_term = ''
     events = []
@@ -251,70 +758,29 @@ def find_events():
 
         if action == 'register' and selected_member and event_id:
             try:
-                # Check if event is full
-                event = conn.execute("""
-                    SELECT Attendance, MaxCapacity FROM Event WHERE EventID = ?
-                """, (event_id,)).fetchone()
-
-                if event['Attendance'] >= event['MaxCapacity']:
+                status = write(register_for_event, event_id, selected_member)
+                if status == 'registered':
+                    flash("Successfully registered for the event!", "success")
+                elif status == 'no such event':
+                    flash("Event not found.", "error")
+                elif status == 'full':
                     flash("This event has reached maximum capacity.", "error")
                 else:
-                    # Check if already registered
-                    existing_reg = conn.execute("""
-                        SELECT 1 FROM EventRegistration 
-                        WHERE EventID = ? AND MemberID = ?
-                    """, (event_id, selected_member)).fetchone()
-
-                    if not existing_reg:
-                        # Register for event
-                        conn.execute("""
-                            INSERT INTO EventRegistration (EventID, MemberID)
-                            VALUES (?, ?)
-                        """, (event_id, selected_member))
-
-                        # Update attendance count
-                        conn.execute("""
-                            UPDATE Event 
-                            SET Attendance = Attendance + 1 
-                            WHERE EventID = ?
-                        """, (event_id,))
-
-                        conn.commit()
-                        flash("Successfully registered for the event!", "success")
-                    else:
-                        flash("You are already registered for this event.", "error")
+                    flash("You are already registered for this event.", "error")
             except sqlite3.Error as e:
                 flash(f"Error registering for event: {str(e)}", "error")
 
         elif action == 'unregister' and selected_member and event_id:
             try:
-                # Check if registered
-                existing_reg = conn.execute("""
-                    SELECT 1 FROM EventRegistration 
-                    WHERE EventID = ? AND MemberID = ?
-                """, (event_id, selected_member)).fetchone()
-
-                if existing_reg:
-                    # Unregister from event
-                    conn.execute("""
-                        DELETE FROM EventRegistration
-                        WHERE EventID = ? AND MemberID = ?
-                    """, (event_id, selected_member))
-
-                    # Update attendance count
-                    conn.execute("""
-                        UPDATE Event 
-                        SET Attendance = Attendance - 1 
-                        WHERE EventID = ?
-                    """, (event_id,))
-
-                    conn.commit()
+                if write(unregister_from_event, event_id, selected_member):
                     flash("Successfully unregistered from the event!", "success")
                 else:
                     flash("You are not registered for this event.", "error")
             except sqlite3.Error as e:
                 flash(f"Error unregistering from event: {str(e)}", "error")
 
+        snapshot_versions('Event')
+
         # Modified query to include IsFull for both cases
         if selected_member:
             query = """
@@ -349,13 +815,61 @@ def find_events():
             ORDER BY EventDate
         """).fetchall()
 
-    conn.close()
     return render_template('find_events.html', 
-                         members=members, 
                          events=events, 
                          selected_member=selected_member, 
+                         selected_member_name=get_member_name(conn, selected_member),
                          search_term=search_term)
 
+# Schedule Event
+@app.route('/schedule-event', methods=['GET', 'POST'])
+def schedule_event():
+    conn = get_db_connection()
+    rooms = conn.execute("SELECT RoomID, Capacity, RoomType FROM LibraryRoom ORDER BY RoomID").fetchall()
+    # "Find free rooms" is a GET with the same fields as the booking form
+    form = request.form if request.method == 'POST' else request.args
+    slot = (form.get('event_date', ''), form.get('start_time') or None, form.get('end_time') or None)
+    try:
+        capacity = int(form.get('max_capacity') or 0)
+    except ValueError:
+        capacity = 0
+    error = None
+    suggestions = None
+
+    if request.method == 'POST':
+        name = form.get('event_name', '').strip()
+        if not name:
+            error = "Give the event a name."
+        elif not form.get('room_id', '').isdigit():
+            error = "Pick a room, or one of the free rooms below."
+        else:
+            try:
+                write(book_event, name, *slot, int(form['room_id']), capacity)
+                flash(f"{name} is booked.", 'success')
+                return redirect(url_for('find_events'))
+            except (BookingError, sqlite3.Error) as e:
+                error = str(e)
+
+    # Suggest free rooms for the slot when asked, or when the booking failed
+    if slot[0] and (request.method == 'GET' or error):
+        try:
+            suggestions = free_rooms(conn, *slot, capacity=capacity)
+        except BookingError as e:
+            error = error or str(e)
+
+    return render_template('schedule_event.html', rooms=rooms, form=form, error=error,
+                           suggestions=suggestions)
+
+
+def add_volunteer(conn, name, email, phone):
+    cur = conn.cursor()
+    cur.execute('INSERT INTO Person (Name, Email, PhoneNumber, Role) VALUES (?, ?, ?, "Volunteer")',
+                (name, email, phone))
+    person_id = cur.lastrowid
+    cur.execute('INSERT INTO Volunteer (VolunteerID, JoinDate, MembershipStatus) VALUES (?, ?, ?)',
+                (person_id, datetime.now().strftime('%Y-%m-%d'), 'Pending'))
+    return person_id
+
 # Volunteer
 @app.route('/volunteer', methods=['GET', 'POST'])
 def volunteer():
@@ -374,22 +888,23 @@ def volunteer():
         email = request.form['email']
         phone = request.form['phone']
         try:
-            cur = conn.cursor()
-            cur.execute('INSERT INTO Person (Name, Email, PhoneNumber, Role) VALUES (?, ?, ?, "Volunteer")',
-                        (name, email, phone))
-            person_id = cur.lastrowid
-            cur.execute('INSERT INTO Volunteer (VolunteerID, JoinDate, MembershipStatus) VALUES (?, ?, ?)',
-                        (person_id, datetime.now().strftime('%Y-%m-%d'), 'Pending'))
-            conn.commit()
+            write(add_volunteer, name, email, phone, group=True)
+            directory_cache.invalidate()
             return redirect(url_for('volunteer', success=True))
         except sqlite3.Error as e:
             return render_template('volunteer.html', 
                                  volunteers=volunteers,
                                  error=str(e))
     
-    conn.close()
     return render_template('volunteer.html', volunteers=volunteers)
 
+def add_help_request(conn, member_id, description):
+    cur = conn.execute("""
+        INSERT INTO HelpRequest (MemberID, Description, RequestDate)
+        VALUES (?, ?, ?)
+    """, (member_id, description, datetime.now().strftime('%Y-%m-%d')))
+    return cur.lastrowid
+
 # Ask for Help
 @app.route('/ask-help', methods=['GET', 'POST'])
 def ask_help():
@@ -399,15 +914,6 @@ def ask_help():
     previous_requests = None
     selected_member = None
 
-    # Get all members for selection
-    members = conn.execute("""
-        SELECT p.PersonID, p.Name 
-        FROM Person p
-        JOIN Member m ON p.PersonID = m.MemberID
-        WHERE p.Role = 'Member'
-        ORDER BY p.Name
-    """).fetchall()
-
     if request.method == 'POST':
         member_id = request.form.get('member_id')
         description = request.form.get('description')
@@ -428,11 +934,7 @@ def ask_help():
                     """, (member_id,)).fetchall()
                 else:
                     # New request submission
-                    conn.execute("""
-                        INSERT INTO HelpRequest (MemberID, Description, RequestDate)
-                        VALUES (?, ?, ?)
-                    """, (member_id, description, datetime.now().strftime('%Y-%m-%d')))
-                    conn.commit()
+                    request_id = write(add_help_request, member_id, description, group=True)
                     
                     previous_requests = conn.execute("""
                         SELECT h.RequestID, h.Description, h.RequestDate, p.Name
@@ -442,19 +944,39 @@ def ask_help():
                         ORDER BY h.RequestDate DESC
                     """, (member_id,)).fetchall()
                     
-                    success = "Your request has been submitted!"
+                    success = f"Your request #{request_id} has been submitted!"
 
         except sqlite3.Error as e:
             error = str(e)
 
-    conn.close()
     return render_template('ask_help.html',
-                         members=members,
                          selected_member=selected_member,
-                         selected_member_name=next((m['Name'] for m in members if str(m['PersonID']) == str(selected_member)), None) if selected_member else None,
+                         selected_member_name=get_member_name(conn, selected_member),
                          previous_requests=previous_requests,
                          error=error,
                          success=success)
 
+# Staff dashboard, read from the trigger-maintained summary tables
+@app.route('/dashboard')
+def dashboard():
+    summary = read_summary(get_db_connection())
+    return render_template('dashboard.html', summary=summary)
+
+@app.route('/api/dashboard')
+def dashboard_stats():
+    return jsonify(read_summary(get_db_connection()))
+
+# Streaming exports: /export/loans.csv, /export/items.jsonl?gzip=1, ...
+@app.route('/export/<name>.<fmt>')
+def export(name, fmt):
+    if name not in EXPORTS or fmt not in FORMATS:
+        return Response("Unknown export.", status=404, mimetype='text/plain')
+    compress = request.args.get('gzip') == '1'
+    filename = f"{name}-{datetime.now().strftime('%Y-%m-%d')}.{fmt}" + ('.gz' if compress else '')
+    return Response(stream_export(get_pool(), name, fmt, compress),
+                    mimetype='application/gzip' if compress else FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 if __name__ == '__main__':
+    get_pool()
     app.run(debug=True, port=5001)
\ No newline at end of file
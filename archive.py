@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from db import open_connection, run_transaction
+
+# Moves old loans out of the hot BorrowingRecord table.
+#
+#   python archive.py                      # loans returned over 365 days ago
+#   python archive.py --days 730 --dry-run
+#
+# Borrowing, returning, holds, fines and the dashboard counters all work on
+# open loans, yet BorrowingRecord keeps every loan ever made. Returned loans
+# with no fine whose ReturnDate is more than --days before --as-of are
+# copied to BorrowingRecordArchive (schema migration 11) and deleted from
+# BorrowingRecord, in RecordID ranges of --chunk-size, one transaction per
+# range. A range is either still live or fully archived, and an interrupted
+# run simply continues where it stopped when run again.
+#
+# Fined loans stay put so the FineSummary counter and fines.py still see
+# them. The BorrowingHistory view covers both tables for anything that
+# needs every loan (exports, recommendations).
+
+DAYS = 365
+CHUNK_SIZE = 10000
+
+ARCHIVABLE = """
+    FROM BorrowingRecord
+    WHERE RecordID >= :low AND RecordID < :high
+      AND ReturnDate IS NOT NULL
+      AND julianday(ReturnDate) < julianday(:cutoff)
+      AND COALESCE(FineAmount, 0) = 0
+"""
+
+COLUMNS = 'RecordID, MemberID, ItemID, DueDate, BorrowDate, ReturnDate, FineAmount'
+
+
+def archive_chunk(conn, low, high, cutoff):
+    params = {'low': low, 'high': high, 'cutoff': cutoff}
+    moved = conn.execute(f"INSERT INTO BorrowingRecordArchive ({COLUMNS}) SELECT {COLUMNS} {ARCHIVABLE}",
+                         params).rowcount
+    conn.execute(f"DELETE {ARCHIVABLE}", params)
+    return moved
+
+
+def archive_loans(conn, days=DAYS, today=None, chunk_size=CHUNK_SIZE, dry_run=False):
+    today = date.fromisoformat(today) if today else date.today()
+    cutoff = (today - timedelta(days=days)).isoformat()
+    report = {'cutoff': cutoff, 'moved': 0, 'chunks': 0, 'slowest_chunk': 0.0}
+    low, high = conn.execute("SELECT MIN(RecordID), MAX(RecordID) FROM BorrowingRecord").fetchone()
+    if low is None:
+        return report
+    for start in range(low, high + 1, chunk_size):
+        chunk_start = time.perf_counter()
+        if dry_run:
+            moved = conn.execute(f"SELECT COUNT(*) {ARCHIVABLE}",
+                                 {'low': start, 'high': start + chunk_size, 'cutoff': cutoff}).fetchone()[0]
+        else:
+            moved = run_transaction(conn, archive_chunk, start, start + chunk_size, cutoff)
+        report['chunks'] += 1
+        report['moved'] += moved
+        report['slowest_chunk'] = max(report['slowest_chunk'], time.perf_counter() - chunk_start)
+    return report
+
+
+def table_sizes(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ('BorrowingRecord', 'BorrowingRecordArchive')}
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Move old returned loans to BorrowingRecordArchive.")
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    parser.add_argument('--days', type=int, default=DAYS, help="archive loans returned more than this many days ago")
+    parser.add_argument('--as-of', type=lambda value: date.fromisoformat(value).isoformat(),
+                        help="date the age is counted from (default today)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="count the loans without moving them")
+    args = parser.parse_args(argv)
+    if args.days < 0:
+        parser.error("--days must not be negative")
+
+    conn = open_connection(args.db)
+    try:
+        start = time.perf_counter()
+        report = archive_loans(conn, args.days, args.as_of, args.chunk_size, args.dry_run)
+        elapsed = time.perf_counter() - start
+        sizes = table_sizes(conn)
+    finally:
+        conn.close()
+
+    print(f"Loans returned before {report['cutoff']} without a fine: {report['moved']:,} "
+          f"{'would be archived' if args.dry_run else 'archived'} in {report['chunks']:,} chunks "
+          f"({elapsed:.2f}s, slowest chunk {report['slowest_chunk']:.3f}s)")
+    print(f"BorrowingRecord: {sizes['BorrowingRecord']:,} loans, "
+          f"BorrowingRecordArchive: {sizes['BorrowingRecordArchive']:,} loans")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
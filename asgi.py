@@ -0,0 +1,202 @@
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, get_pool
+from templating import precompile
+
+# ASGI entry point for production serving:
+#
+#   uvicorn asgi:application --port 5001
+#
+# The event loop only accepts connections and moves bytes. Each request runs
+# the Flask app (and so all of its SQLite work) on a bounded thread pool of
+# LIBRARY_ASGI_WORKERS threads. Up to LIBRARY_ASGI_MAX_PENDING more requests
+# may wait for a thread; beyond that the server sheds load with a 503 and
+# Retry-After instead of queueing without limit.
+
+MAX_BODY_SIZE = 10 * 1024 * 1024
+_END = object()
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+
+
+class WSGIAdapter:
+    # Runs a WSGI app under an ASGI server. Not a general-purpose bridge:
+    # request bodies are read fully before the app is called (forms here
+    # are small), responses are streamed chunk by chunk.
+
+    def __init__(self, wsgi_app, max_workers=8, max_pending=256, retry_after=1):
+        self.wsgi_app = wsgi_app
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wsgi')
+        # only touched from the event loop thread
+        self._admitted = 0
+        self._running = 0
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._rejected = 0
+        self._max_admitted = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        if self._admitted >= self.max_workers + self.max_pending:
+            with self._stats_lock:
+                self._rejected += 1
+            await self._error(send, 503, "Server busy, try again shortly.",
+                              [(b'retry-after', str(self.retry_after).encode())])
+            return
+
+        self._admitted += 1
+        with self._stats_lock:
+            self._requests += 1
+            self._max_admitted = max(self._max_admitted, self._admitted)
+        try:
+            try:
+                body = await self._read_body(receive)
+            except Rejected as e:
+                await self._error(send, e.status, str(e))
+                return
+            except ConnectionAbortedError:
+                return
+            await self._run(self._environ(scope, body), send)
+        finally:
+            self._admitted -= 1
+
+    async def _read_body(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionAbortedError()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise Rejected(413, "Request body too large.")
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1] if server[1] is not None else 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _start(self, environ):
+        # Runs on a worker thread: call the app and produce its first chunk,
+        # which is also when a lazy app calls start_response
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+        iterator = iter(result)
+        first = next(iterator, _END)
+        return response, result, iterator, first
+
+    async def _run(self, environ, send):
+        loop = asyncio.get_running_loop()
+        self._running += 1
+        try:
+            response, result, iterator, chunk = await loop.run_in_executor(self.executor, self._start, environ)
+            try:
+                await send({'type': 'http.response.start', 'status': response['status'],
+                            'headers': response['headers']})
+                while chunk is not _END:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    chunk = await loop.run_in_executor(self.executor, next, iterator, _END)
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            finally:
+                if hasattr(result, 'close'):
+                    await loop.run_in_executor(self.executor, result.close)
+        finally:
+            self._running -= 1
+
+    async def _error(self, send, status, message, headers=()):
+        body = message.encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                                (b'content-length', str(len(body)).encode())] + list(headers)})
+        await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'admitted': self._admitted,
+                'running': self._running,
+                'requests': self._requests,
+                'rejected': self._rejected,
+                'max_admitted': self._max_admitted,
+            }
+
+
+application = WSGIAdapter(
+    app,
+    max_workers=int(os.environ.get('LIBRARY_ASGI_WORKERS', app.config['DB_POOL_SIZE'])),
+    max_pending=int(os.environ.get('LIBRARY_ASGI_MAX_PENDING', 256)),
+)
+app.extensions['asgi'] = application
+
+# Compile (or load from the bytecode cache) every template before serving
+precompile(app.jinja_env)
+# Fail at startup, not on the first request, if the schema is out of date
+get_pool()
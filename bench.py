@@ -0,0 +1,1183 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import archive
+import fines
+import main
+import recommend
+import scheduling
+import summaries
+
+# Concurrency and load benchmarks for the library app. Each scenario builds
+# its own throwaway database, so library.db is never touched.
+#
+#   python bench.py borrow --threads 16 --requests 5000
+#   python bench.py events --threads 32 --requests 5000 --capacity 100
+#
+# Route latency: build a fixture once, then drive every page with a mixed
+# read/write workload and keep the results as a JSON baseline.
+#
+#   python bench.py fixture bench-100k.db --scale 100k
+#   python bench.py routes --fixture bench-100k.db --save baseline.json
+#   python bench.py routes --fixture bench-100k.db --compare baseline.json
+#   python bench.py routes --fixture bench-100k.db --url http://127.0.0.1:5001
+#   python bench.py serving --fixture bench-100k.db --clients 256 --workers 8
+#   python bench.py signups --threads 64 --group-rows 64 --group-ms 5
+#   python bench.py season --days 90 --events-per-day 2000 --rooms 500
+#   python bench.py startup --runs 10
+#   python bench.py archive --loans 1000000
+#   python bench.py bulk --items 1000000
+#   python bench.py search --items 1000000
+
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+ITEM_TYPES = ('Book', 'DVD', 'Magazine', 'CD', 'Audiobook')
+
+
+def make_fixture(path, items=1000, members=1000, loans=0, events=0):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    main.create_schema(conn)
+    main.bulk_add_items(conn, ((f'Bench Item {i}', ITEM_TYPES[i % len(ITEM_TYPES)], f'Author {i % 500}',
+                                1, f'978-{i:010d}', 1950 + i % 70)
+                               for i in range(items)), defer_indexes=True)
+    main.bulk_add_persons(conn, ((f'Bench Member {i}', None, None, f'member{i}@bench.test', 'Member')
+                                 for i in range(members)), defer_indexes=True)
+    conn.execute("""
+        INSERT INTO Member (MemberID, JoinDate, MembershipStatus)
+        SELECT PersonID, DATE('now'), 'Active' FROM Person WHERE Role = 'Member'
+    """)
+    conn.commit()
+    if loans:
+        add_loan_history(conn, loans, items, members)
+    if events:
+        rooms = main.bulk_insert(conn, 'LibraryRoom', ('Capacity', 'RoomType'),
+                                 ((20 + 10 * (i % 10), 'Bench Room') for i in range(50)))
+        main.bulk_insert(conn, 'Event', ('EventName', 'EventDate', 'Attendance', 'MaxCapacity', 'RoomID'),
+                         ((f'Bench Event {i}', f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}', 0, 20 + 10 * (i % 10),
+                           1 + i % rooms) for i in range(events)))
+    conn.close()
+
+
+def add_loan_history(conn, loans, items, members):
+    # Mostly returned loans, with about 10% still open on distinct items.
+    # The borrow triggers only allow one loan per available item at a time,
+    # so they are set aside while the history is written and availability
+    # and the loan summaries are recomputed afterwards.
+    saved = conn.execute("""
+        SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'BorrowingRecord'
+    """).fetchall()
+    for name, _ in saved:
+        conn.execute(f"DROP TRIGGER {name}")
+    open_loans = min(loans // 10, items)
+
+    def history():
+        for i in range(loans):
+            year, day = 2020 + i % 5, 1 + i % 28
+            borrowed = f'{year}-{1 + i % 11:02d}-{day:02d}'
+            due = f'{year}-{2 + i % 11:02d}-{day:02d}'
+            if i < open_loans:
+                yield (1 + i % members, 1 + i, due, borrowed, None, 0.0)
+            else:
+                yield (1 + i % members, 1 + random.randrange(items), due, borrowed, due, 0.0)
+
+    main.bulk_insert(conn, 'BorrowingRecord',
+                     ('MemberID', 'ItemID', 'DueDate', 'BorrowDate', 'ReturnDate', 'FineAmount'),
+                     history(), commit=False)
+    conn.execute("""
+        UPDATE Item SET AvailabilityStatus = 0
+        WHERE ItemID IN (SELECT ItemID FROM BorrowingRecord WHERE ReturnDate IS NULL)
+    """)
+    for _, sql in saved:
+        conn.execute(sql)
+    conn.commit()
+    summaries.rebuild(conn)
+    recommend.build(conn)
+
+
+def load_app(db_path, pool_size):
+    # app reads its settings when it is first imported
+    os.environ['LIBRARY_DB'] = db_path
+    os.environ['LIBRARY_DB_POOL_SIZE'] = str(pool_size)
+    import app as library
+    library.app.config['TESTING'] = True
+    # Slow query warnings would drown the report; /metrics still counts them
+    logging.getLogger('library.sql').setLevel(logging.ERROR)
+    return library
+
+
+def run_concurrently(threads, count, fn):
+    # Call fn(i) count times from a pool of threads; returns (results, seconds)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(fn, range(count)))
+    return results, time.perf_counter() - start
+
+
+def bench_borrow(args, db_path):
+    # Many clients borrowing from a small pool of items at once. Every item
+    # may be loaned out at most once, whatever the interleaving.
+    make_fixture(db_path, items=args.items, members=args.members)
+    library = load_app(db_path, args.threads)
+    local = threading.local()
+
+    def borrow(i):
+        if not hasattr(local, 'client'):
+            local.client = library.app.test_client()
+        response = local.client.post('/borrow-item', data={
+            'member_id': random.randint(1, args.members),
+            'item_id': random.randint(1, args.items),
+        })
+        return response.status_code == 302
+
+    results, elapsed = run_concurrently(args.threads, args.requests, borrow)
+    borrowed = sum(results)
+
+    conn = sqlite3.connect(db_path)
+    double_loans = conn.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT ItemID FROM BorrowingRecord WHERE ReturnDate IS NULL
+            GROUP BY ItemID HAVING COUNT(*) > 1
+        )
+    """).fetchone()[0]
+    open_loans = conn.execute("SELECT COUNT(*) FROM BorrowingRecord WHERE ReturnDate IS NULL").fetchone()[0]
+    on_loan = conn.execute("SELECT COUNT(*) FROM Item WHERE AvailabilityStatus = 0").fetchone()[0]
+    stale = summaries.diff(conn)
+    conn.close()
+
+    print(f"{args.requests} borrow requests from {args.threads} threads in {elapsed:.2f}s "
+          f"({args.requests / elapsed:,.0f} requests/s, {borrowed / elapsed:,.0f} borrows/s)")
+    print(f"successful borrows: {borrowed}, open loans: {open_loans}, items on loan: {on_loan}, "
+          f"double loans: {double_loans}, stale summary rows: {len(stale)}")
+    ok = double_loans == 0 and borrowed == open_loans == on_loan and not stale
+    print("OK" if ok else "FAILED: loans, item availability and summaries disagree")
+    return ok
+
+
+def bench_events(args, db_path):
+    # A popular event opening: thousands of registrations (and some
+    # unregistrations) at once. Attendance must never exceed capacity and
+    # must always match the number of registrations.
+    make_fixture(db_path, items=1, members=args.members)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        INSERT INTO Event (EventName, EventDate, Attendance, MaxCapacity, RoomID)
+        VALUES ('Bench Event', DATE('now'), 0, ?, NULL)
+    """, (args.capacity,))
+    conn.commit()
+    event_id = conn.execute("SELECT MAX(EventID) FROM Event").fetchone()[0]
+    conn.close()
+
+    library = load_app(db_path, args.threads)
+    local = threading.local()
+
+    def register(i):
+        if not hasattr(local, 'client'):
+            local.client = library.app.test_client()
+        action = 'unregister' if random.random() < args.unregister_ratio else 'register'
+        local.client.post('/find-events', data={
+            'member_id': random.randint(1, args.members),
+            'event_id': event_id,
+            'action': action,
+        })
+
+    _, elapsed = run_concurrently(args.threads, args.requests, register)
+
+    conn = sqlite3.connect(db_path)
+    attendance, capacity = conn.execute(
+        "SELECT Attendance, MaxCapacity FROM Event WHERE EventID = ?", (event_id,)).fetchone()
+    registrations = conn.execute(
+        "SELECT COUNT(*) FROM EventRegistration WHERE EventID = ?", (event_id,)).fetchone()[0]
+    conn.close()
+
+    print(f"{args.requests} registration requests from {args.threads} threads in {elapsed:.2f}s "
+          f"({args.requests / elapsed:,.0f} requests/s)")
+    print(f"attendance: {attendance}/{capacity}, registrations: {registrations}")
+    ok = attendance <= capacity and attendance == registrations
+    print("OK" if ok else "FAILED: attendance is over capacity or out of step with registrations")
+    return ok
+
+
+# Route workload: (name, weight, method, request builder). The builder gets
+# the fixture description and returns (path, form data).
+def browse_items(fx):
+    return '/find-item', None
+
+
+def search_items(fx):
+    return '/find-item?' + urllib.parse.urlencode({'q': f'Item {random.randrange(fx.items)}'}), None
+
+
+def lookup_members(fx):
+    return '/api/members?' + urllib.parse.urlencode({'q': f'Bench Member {random.randrange(100)}'}), None
+
+
+def borrow_form(fx):
+    return '/borrow-item', {'member_id': fx.member(), 'item_id': random.randint(1, fx.items)}
+
+
+def member_loans(fx):
+    return '/return-item', {'member_id': fx.member(), 'select_member': '1'}
+
+
+def return_form(fx):
+    record_id, member_id = random.choice(fx.open_loans)
+    return '/return-item', {'member_id': member_id, 'record_id': record_id, 'return_item': '1'}
+
+
+def donate_form(fx):
+    return '/donate-item', {'donor_id': fx.member(), 'item_title': f'Donated Item {random.random()}',
+                            'item_type': random.choice(ITEM_TYPES), 'publication_year': '2001'}
+
+
+def event_search(fx):
+    return '/find-events', {'member_id': fx.member(), 'search_term': 'Bench Event 1'}
+
+
+def register_form(fx):
+    return '/find-events', {'member_id': fx.member(), 'event_id': random.randint(1, fx.events),
+                            'action': random.choice(('register', 'register', 'unregister'))}
+
+
+def volunteer_form(fx):
+    n = random.getrandbits(48)
+    return '/volunteer', {'name': f'Bench Volunteer {n}', 'email': f'volunteer{n}@bench.test',
+                          'phone': '555-0100'}
+
+
+def help_history(fx):
+    return '/ask-help', {'member_id': fx.member()}
+
+
+def help_form(fx):
+    return '/ask-help', {'member_id': fx.member(), 'description': 'Bench help request'}
+
+
+def page(path):
+    return lambda fx: (path, None)
+
+
+WORKLOAD = [
+    ('find-item browse', 10, 'GET', browse_items),
+    ('find-item search', 15, 'GET', search_items),
+    ('api/members', 10, 'GET', lookup_members),
+    ('borrow-item page', 3, 'GET', page('/borrow-item')),
+    ('borrow-item', 6, 'POST', borrow_form),
+    ('return-item page', 3, 'GET', page('/return-item')),
+    ('return-item loans', 6, 'POST', member_loans),
+    ('return-item', 4, 'POST', return_form),
+    ('donate-item page', 3, 'GET', page('/donate-item')),
+    ('donate-item', 2, 'POST', donate_form),
+    ('find-events page', 5, 'GET', page('/find-events')),
+    ('find-events search', 5, 'POST', event_search),
+    ('find-events register', 5, 'POST', register_form),
+    ('volunteer page', 3, 'GET', page('/volunteer')),
+    ('volunteer', 1, 'POST', volunteer_form),
+    ('ask-help page', 3, 'GET', page('/ask-help')),
+    ('ask-help history', 4, 'POST', help_history),
+    ('ask-help', 2, 'POST', help_form),
+]
+
+
+class Fixture:
+    # Row counts and ids the request builders pick from
+    def __init__(self, path):
+        conn = sqlite3.connect(path)
+        self.items = conn.execute("SELECT COALESCE(MAX(ItemID), 1) FROM Item").fetchone()[0]
+        self.members = [row[0] for row in conn.execute("SELECT MemberID FROM Member LIMIT 100000")]
+        self.events = conn.execute("SELECT COALESCE(MAX(EventID), 1) FROM Event").fetchone()[0]
+        self.open_loans = conn.execute("""
+            SELECT RecordID, MemberID FROM BorrowingRecord WHERE ReturnDate IS NULL LIMIT 100000
+        """).fetchall() or [(0, 1)]
+        self.counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                       for table in ('Item', 'Member', 'BorrowingRecord', 'Event')}
+        conn.close()
+
+    def member(self):
+        return random.choice(self.members) if self.members else 1
+
+
+class TestClientDriver:
+    def __init__(self, library):
+        self.app = library.app
+        self.local = threading.local()
+
+    def request(self, method, path, data):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        return self.local.client.open(path, method=method, data=data).status_code
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    # Talks to a running server; redirects are not followed so both drivers
+    # time the same single request
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(NoRedirect)
+
+    def request(self, method, path, data):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class ASGIDriver:
+    # Calls an ASGI app in-process on an event loop in a background thread,
+    # so client threads share one loop the way connections share a server's
+    def __init__(self, application):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def _call(self, method, path, data):
+        path, _, query = path.partition('?')
+        body = urllib.parse.urlencode(data).encode() if data is not None else b''
+        headers = [(b'host', b'localhost')]
+        if data is not None:
+            headers.append((b'content-type', b'application/x-www-form-urlencoded'))
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'headers': headers, 'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+        sent = False
+        status = None
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {'type': 'http.disconnect'}
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await self.application(scope, receive, send)
+        return status
+
+    def request(self, method, path, data):
+        return asyncio.run_coroutine_threadsafe(self._call(method, path, data), self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': 1000 * percentile(latencies, 0.50),
+        'p95_ms': 1000 * percentile(latencies, 0.95),
+        'p99_ms': 1000 * percentile(latencies, 0.99),
+        'max_ms': 1000 * latencies[-1] if latencies else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(report):
+    print(f"{'route':<22}{'requests':>9}{'errors':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, row in list(report['routes'].items()) + [('all', report['overall'])]:
+        print(f"{name:<22}{row['requests']:>9}{row['errors']:>7}{row['rps']:>9.0f}"
+              f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+
+
+def compare_reports(report, baseline, tolerance):
+    # A route regresses when its p95 is slower, or the overall throughput
+    # lower, than the baseline by more than tolerance (a fraction)
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} "
+          f"({baseline['meta'].get('created')}):")
+    print(f"{'route':<22}{'p50 ms':>18}{'p95 ms':>18}{'req/s':>16}")
+    regressions = []
+    rows = list(report['routes'].items()) + [('all', report['overall'])]
+    for name, row in rows:
+        old = baseline['overall'] if name == 'all' else baseline['routes'].get(name)
+        if not old:
+            continue
+
+        def change(key):
+            return (row[key] - old[key]) / old[key] if old[key] else 0.0
+
+        print(f"{name:<22}{old['p50_ms']:>8.2f} -> {row['p50_ms']:<7.2f}{old['p95_ms']:>8.2f} -> "
+              f"{row['p95_ms']:<7.2f}{old['rps']:>7.0f} -> {row['rps']:<6.0f}{change('p95_ms'):>+8.0%}")
+        if change('p95_ms') > tolerance:
+            regressions.append(f"{name} p95 {change('p95_ms'):+.0%}")
+        if name == 'all' and change('rps') < -tolerance:
+            regressions.append(f"throughput {change('rps'):+.0%}")
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return not regressions
+
+
+def bench_signups(args, db_path):
+    # A signup campaign: a burst of help requests and volunteer signups,
+    # first with one commit per write, then with group commit, both synced
+    # to disk on commit (--synchronous). Every acknowledged write must be in
+    # the database. The rows are deleted between runs so both start equal.
+    make_fixture(db_path, items=1, members=args.members)
+    library = load_app(db_path, args.threads)
+    from db import Writer
+    local = threading.local()
+    ok = True
+
+    def signup(i):
+        if not hasattr(local, 'client'):
+            local.client = library.app.test_client()
+        start = time.perf_counter()
+        if i % 2:
+            response = local.client.post('/volunteer', data={
+                'name': f'Bench Volunteer {i}', 'email': f'signup{i}-{time.time_ns()}@bench.test',
+                'phone': '555-0100'})
+            acknowledged = response.status_code == 302
+        else:
+            response = local.client.post('/ask-help', data={
+                'member_id': random.randint(1, args.members), 'description': 'Bench help request'})
+            acknowledged = b'has been submitted' in response.data
+        return acknowledged, time.perf_counter() - start
+
+    print(f"{args.requests} signups from {args.threads} threads")
+    print(f"{'mode':<18}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'batches':>9}{'rows/batch':>11}")
+    for label, rows, wait in (('commit per write', 1, 0), (f'group {args.group_rows}/{args.group_ms:g}ms',
+                                                          args.group_rows, args.group_ms / 1000)):
+        before = count_signups(db_path)
+        library._writer = Writer(db_path, batch_size=rows, batch_wait=wait, synchronous=args.synchronous)
+        results, elapsed = run_concurrently(args.threads, args.requests, signup)
+        stats = library._writer.stats()
+        library._writer.close()
+        acknowledged = sum(1 for acked, _ in results if acked)
+        written = count_signups(db_path) - before
+        latencies = sorted(seconds for _, seconds in results)
+        print(f"{label:<18}{args.requests / elapsed:>9.0f}{1000 * percentile(latencies, 0.5):>9.2f}"
+              f"{1000 * percentile(latencies, 0.95):>9.2f}{1000 * percentile(latencies, 0.99):>9.2f}"
+              f"{stats['batches']:>9}{stats['writes'] / max(stats['batches'], 1):>11.1f}")
+        if acknowledged != written or acknowledged != args.requests:
+            print(f"FAILED: {acknowledged} acknowledged, {written} written")
+            ok = False
+        remove_signups(db_path)
+        library.directory_cache.invalidate()
+    library._writer = None
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def bench_holds(args, db_path):
+    # Returns with deep waitlists: every item is on loan with --depth holds
+    # queued behind it. Each return hands the item to the head of its queue
+    # inside the return transaction, and that member then collects it, for
+    # --rounds rounds. Return latency should barely move with queue depth
+    # (one HoldQueue index seek), and the queue must be served in
+    # (Priority DESC, HoldID) order.
+    library = None
+    ok = True
+    print(f"{args.items} items on loan, {args.rounds} rounds of return + collect, "
+          f"{args.threads} threads; latencies are for the return")
+    print(f"{'depth':>8}{'cycles/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'collect ms':>12}{'out of order':>14}")
+    for depth in args.depths:
+        path = f'{db_path}-{depth}'
+        make_fixture(path, items=args.items, members=max(depth, 1) + 1)
+        conn = sqlite3.connect(path)
+        # member 1 holds every item; the queue is members 2..depth+1, with a
+        # few priority levels so the order isn't just insertion order
+        conn.executemany("INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate) VALUES (1, ?, '2099-01-01')",
+                         ((item,) for item in range(1, args.items + 1)))
+        main.bulk_insert(conn, 'Hold', ('ItemID', 'MemberID', 'Priority'),
+                         ((item, member, random.randrange(3))
+                          for item in range(1, args.items + 1) for member in range(2, depth + 2)))
+        conn.commit()
+        conn.close()
+
+        if library is None:
+            library = load_app(path, args.threads)
+        from db import Writer
+        writer = Writer(path)
+        local = threading.local()
+
+        def cycle(item):
+            if not hasattr(local, 'conn'):
+                local.conn = sqlite3.connect(path)
+            record_id = local.conn.execute("""
+                SELECT RecordID FROM BorrowingRecord WHERE ItemID = ? AND ReturnDate IS NULL
+            """, (item,)).fetchone()[0]
+            start = time.perf_counter()
+            holder = writer.run(library.return_loan, record_id)
+            returned = time.perf_counter() - start
+            if holder is None:
+                return returned, 0.0
+            start = time.perf_counter()
+            collected = writer.run(library.borrow, holder, item)
+            return returned, (time.perf_counter() - start) if collected else None
+
+        results, elapsed = [], 0.0
+        for _ in range(args.rounds if depth else 1):
+            batch, seconds = run_concurrently(args.threads, args.items, lambda i: cycle(i + 1))
+            results += batch
+            elapsed += seconds
+        writer.close()
+
+        conn = sqlite3.connect(path)
+        out_of_order = conn.execute("""
+            SELECT COUNT(*) FROM Hold served
+            JOIN Hold waiting ON waiting.ItemID = served.ItemID AND waiting.Status = 'Waiting'
+            WHERE served.Status = 'Fulfilled'
+              AND (waiting.Priority > served.Priority
+                   OR (waiting.Priority = served.Priority AND waiting.HoldID < served.HoldID))
+        """).fetchone()[0]
+        served = conn.execute("SELECT COUNT(*) FROM Hold WHERE Status = 'Fulfilled'").fetchone()[0]
+        available = conn.execute("SELECT COUNT(*) FROM Item WHERE AvailabilityStatus = 1").fetchone()[0]
+        conn.close()
+        returns = sorted(returned for returned, _ in results)
+        collects = [collected for _, collected in results if collected]
+        failed_collects = sum(1 for _, collected in results if collected is None)
+        print(f"{depth:>8,}{len(returns) / elapsed:>11,.0f}{1000 * percentile(returns, 0.5):>9.2f}"
+              f"{1000 * percentile(returns, 0.99):>9.2f}"
+              f"{1000 * sum(collects) / len(collects) if collects else 0:>12.2f}{out_of_order:>14}")
+        expected_served = len(results) if depth else 0
+        expected_available = 0 if depth else args.items
+        if out_of_order or failed_collects or served != expected_served or available != expected_available:
+            print(f"FAILED: {served} holds served (expected {expected_served}), {failed_collects} failed "
+                  f"collections, {available} items available (expected {expected_available})")
+            ok = False
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def bench_recommend(args, db_path):
+    # Build time of the recommendation table, the cost of a lookup (what
+    # /find-item adds to a search), the cost of the incremental trigger on
+    # new loans, and how far the trigger's table drifts from a fresh build.
+    make_fixture(db_path, items=args.items, members=args.members, loans=args.loans)
+    conn = sqlite3.connect(db_path)
+    # every item free to borrow again
+    conn.execute("UPDATE BorrowingRecord SET ReturnDate = DueDate WHERE ReturnDate IS NULL")
+    conn.commit()
+
+    start = time.perf_counter()
+    rows = recommend.build(conn)
+    built = time.perf_counter() - start
+    print(f"{args.loans:,} loans by {args.members:,} members over {args.items:,} items: "
+          f"built {rows:,} neighbour rows in {built:.2f}s")
+
+    from db import open_read_only
+    reader = open_read_only(db_path)
+    lookups = []
+    for _ in range(args.lookups):
+        item = random.randint(1, args.items)
+        start = time.perf_counter()
+        recommend.recommendations(reader, item)
+        lookups.append(time.perf_counter() - start)
+    reader.close()
+    lookups.sort()
+    print(f"lookup: p50 {1e6 * percentile(lookups, 0.5):.0f} us, p99 {1e6 * percentile(lookups, 0.99):.0f} us")
+
+    def new_loans(n):
+        # each returned straight away so every item stays available
+        for _ in range(n):
+            cur = conn.execute("INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate) VALUES (?, ?, '2099-01-01')",
+                               (random.randint(1, args.members), random.randint(1, args.items)))
+            conn.execute("UPDATE BorrowingRecord SET ReturnDate = DATE('now') WHERE RecordID = ?", (cur.lastrowid,))
+            conn.commit()
+
+    trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'ItemNeighborQueue'").fetchone()[0]
+    conn.execute("DROP TRIGGER ItemNeighborQueue")
+    start = time.perf_counter()
+    new_loans(args.new_loans)
+    without = time.perf_counter() - start
+    conn.execute(trigger)
+    conn.commit()
+    # as in the app: each loan's co-borrows are counted in a transaction of
+    # their own after the borrow commits
+    borrowing = counting = 0.0
+    for _ in range(args.new_loans):
+        start = time.perf_counter()
+        new_loans(1)
+        borrowing += time.perf_counter() - start
+        start = time.perf_counter()
+        recommend.apply_pending(conn)
+        counting += time.perf_counter() - start
+    print(f"new loan + return: {1000 * without / args.new_loans:.2f} ms without the queue trigger, "
+          f"{1000 * borrowing / args.new_loans:.2f} ms with it; counting the co-borrows afterwards: "
+          f"{1000 * counting / args.new_loans:.2f} ms per loan")
+
+    def neighbour_sets():
+        table = {}
+        for item, neighbor in conn.execute("SELECT ItemID, NeighborID FROM ItemNeighbor"):
+            table.setdefault(item, set()).add(neighbor)
+        return table
+
+    incremental = neighbour_sets()
+    recommend.build(conn)
+    exact = neighbour_sets()
+    # counts of 1 and 2 tie a lot, so compare overlap rather than exact lists
+    overlap = sum(len(incremental.get(item, set()) & neighbors) for item, neighbors in exact.items())
+    print(f"after {2 * args.new_loans:,} more loans, the incrementally maintained table shares "
+          f"{overlap / max(sum(map(len, exact.values())), 1):.0%} of its neighbours with a fresh build")
+    conn.close()
+    ok = percentile(lookups, 0.99) < 0.001
+    print("OK" if ok else "FAILED: lookups slower than 1 ms")
+    return ok
+
+
+def bench_bulk(args, db_path):
+    # Bulk loading through main.bulk_add_* into a database with every
+    # trigger in place, row by row (defer_indexes=False) and with the
+    # indexes and the search, summary and version triggers deferred. Loans
+    # go to distinct items, since the availability trigger refuses a second
+    # loan of an item out on loan.
+    ok = True
+    print(f"{'':<24}{'rows':>10}{'seconds':>10}{'rows/s':>10}")
+    for defer in (False, True):
+        path = f'{db_path}-{"deferred" if defer else "plain"}'
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        main.create_schema(conn)
+        steps = (
+            ('items', lambda: main.bulk_add_items(
+                conn, ((f'Bulk Item {i}', ITEM_TYPES[i % len(ITEM_TYPES)], f'Author {i % 500}', 1,
+                        f'978-{i:010d}', 1950 + i % 70) for i in range(args.items)), defer_indexes=defer)),
+            ('persons', lambda: main.bulk_add_persons(
+                conn, ((f'Bulk Member {i}', None, None, f'member{i}@bulk.test', 'Member')
+                       for i in range(args.members)), defer_indexes=defer)),
+            ('members', lambda: main.bulk_add_members(
+                conn, ((i, '2024-01-01', 'Active') for i in range(1, args.members + 1)), defer_indexes=defer)),
+            ('loans', lambda: main.bulk_add_borrowing_records(
+                conn, ((1 + i % args.members, 1 + i, '2099-01-01', '2024-01-01', 0.0)
+                       for i in range(min(args.loans, args.items))), defer_indexes=defer)),
+        )
+        for name, load in steps:
+            start = time.perf_counter()
+            rows = load()
+            elapsed = time.perf_counter() - start
+            print(f"{name + (' (deferred)' if defer else ''):<24}{rows:>10,}{elapsed:>10.2f}"
+                  f"{rows / elapsed if elapsed else 0:>10,.0f}")
+        drift = summaries.diff(conn)
+        if drift:
+            print(f"FAILED: {len(drift)} summary rows out of date after the load")
+            ok = False
+        conn.close()
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def bench_search(args, db_path):
+    # First-page /find-item searches over a large catalogue, ranking every
+    # match and ranking only the first SEARCH_RANK_LIMIT. Fixture titles are
+    # "Bench Item N" by "Author N % 500", so "bench" and "item" match every
+    # item, "be" is a short prefix of them, and "author 42" is selective.
+    from db import open_read_only
+    make_fixture(db_path, items=args.items, members=10)
+    library = load_app(db_path, 1)
+    conn = open_read_only(db_path)
+    terms = ('bench', 'item', 'be', 'author', 'author 42', 'item 123456')
+    print(f"{'search':<16}{'limit':>8}{'p50 ms':>10}{'p99 ms':>10}{'rows':>6}")
+    for limit in (0, args.rank_limit):
+        library.app.config['SEARCH_RANK_LIMIT'] = limit
+        for term in terms:
+            query = library.fts_query(term)
+            latencies = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                items, _, _ = library.get_item_page(conn, query, None, None, library.ITEM_PAGE_SIZE)
+                library.search_capped(conn, query)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            print(f"{term:<16}{limit or 'all':>8}{1000 * percentile(latencies, 0.5):>10.1f}"
+                  f"{1000 * percentile(latencies, 0.99):>10.1f}{len(items):>6}")
+    conn.close()
+    print("OK")
+    return True
+
+
+def bench_season(args, db_path):
+    # Book a season's calendar one event at a time through book_event, the
+    # way /schedule-event does: random slots in random rooms, and on a clash
+    # the smallest free room big enough. Booking time should stay flat as
+    # the calendar fills (each check is an EventSlot search, not a scan of
+    # the day), and no room may end up booked twice.
+    make_fixture(db_path, items=0, members=0)
+    conn = sqlite3.connect(db_path)
+    main.bulk_insert(conn, 'LibraryRoom', ('Capacity', 'RoomType'),
+                     ((10 * (1 + i % 20), 'Bench Room') for i in range(args.rooms)))
+    conn.row_factory = sqlite3.Row
+    from db import run_transaction
+    first = datetime(2025, 9, 1).toordinal()
+    booked = moved = refused = 0
+    bookings, lookups = [], []
+    start = time.perf_counter()
+    for n in range(args.days * args.events_per_day):
+        day = datetime.fromordinal(first + n // args.events_per_day).strftime('%Y-%m-%d')
+        begin = random.randrange(8 * 60, 20 * 60, 15)
+        length = random.choice((30, 60, 90, 120))
+        slot = (f'{begin // 60:02d}:{begin % 60:02d}', f'{(begin + length) // 60:02d}:{(begin + length) % 60:02d}')
+        places = random.randrange(1, 200)
+        room = random.randint(1, args.rooms)
+        started = time.perf_counter()
+        try:
+            run_transaction(conn, scheduling.book_event, f'Season Event {n}', day, *slot, room, places)
+            booked += 1
+        except scheduling.BookingError:
+            looked = time.perf_counter()
+            free = scheduling.free_rooms(conn, day, *slot, capacity=places, limit=1)
+            lookups.append(time.perf_counter() - looked)
+            if free:
+                run_transaction(conn, scheduling.book_event, f'Season Event {n}', day, *slot,
+                                free[0]['RoomID'], places)
+                moved += 1
+            else:
+                refused += 1
+        bookings.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - start
+    clashes = scheduling.double_bookings(conn)
+    conn.close()
+
+    bookings.sort()
+    lookups.sort()
+    total = len(bookings)
+    print(f"{args.days} days x {args.events_per_day:,} events over {args.rooms:,} rooms: "
+          f"{total / elapsed:,.0f} bookings/s ({elapsed:.1f}s)")
+    print(f"{booked:,} booked as asked, {moved:,} moved to a free room, {refused:,} refused (no room free)")
+    print(f"booking: p50 {1000 * percentile(bookings, 0.5):.2f} ms, p99 {1000 * percentile(bookings, 0.99):.2f} ms")
+    if lookups:
+        print(f"free room search: p50 {1000 * percentile(lookups, 0.5):.2f} ms, "
+              f"p99 {1000 * percentile(lookups, 0.99):.2f} ms")
+    ok = not clashes
+    print("OK" if ok else f"FAILED: {len(clashes)} double bookings")
+    return ok
+
+
+# Run in a fresh interpreter by bench_startup: time to import the app, and
+# from there to the first response (which opens the writer, checks the
+# schema version and opens the read pool)
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+from app import app
+imported = time.perf_counter()
+status = app.test_client().get(sys.argv[1]).status_code
+print(json.dumps({{'import': imported - start, 'first': time.perf_counter() - imported, 'status': status}}))
+"""
+
+
+def bench_startup(args, db_path):
+    # Cold starts, each in a new process: interpreter start-up alone, then
+    # importing app.py (or asgi.py) and serving the first request. The first
+    # run compiles the templates into an empty cache directory, the rest
+    # load them from it. Also times `main.py init` on a current database,
+    # which should return without touching the schema, against re-running
+    # every CREATE statement the way each start used to.
+    make_fixture(db_path, items=args.items, members=args.items, loans=args.items, events=100)
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, LIBRARY_DB=db_path,
+               LIBRARY_TEMPLATE_CACHE_DIR=os.path.join(os.path.dirname(db_path), 'templates'))
+
+    def wall(command):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=here, env=env, capture_output=True, text=True, check=True)
+        return time.perf_counter() - start, result.stdout
+
+    interpreter = sorted(wall([sys.executable, '-c', 'pass'])[0] for _ in range(args.runs))
+    print(f"python -c pass: median {1000 * percentile(interpreter, 0.5):.0f} ms")
+    ok = True
+    print(f"{'entry point':<14}{'run':>5}{'import ms':>11}{'first request ms':>18}{'process ms':>12}")
+    for module in ('app', 'asgi'):
+        for run in range(1, args.runs + 1):
+            seconds, out = wall([sys.executable, '-c', STARTUP_PROBE.format(module=module), args.path])
+            probe = json.loads(out.strip().splitlines()[-1])
+            ok = ok and probe['status'] < 400
+            print(f"{module + '.py':<14}{run:>5}{1000 * probe['import']:>11.1f}"
+                  f"{1000 * probe['first']:>18.1f}{1000 * seconds:>12.0f}")
+
+    init = sorted(wall([sys.executable, 'main.py', 'init', '--db', db_path])[0] for _ in range(args.runs))
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        main.create_schema(conn)
+    create = (time.perf_counter() - start) / args.runs
+    conn.close()
+    print(f"main.py init on a current database: median {1000 * percentile(init, 0.5):.0f} ms per process; "
+          f"re-running every CREATE statement: {1000 * create:.1f} ms")
+    print("OK" if ok else f"FAILED: {args.path} returned an error")
+    return ok
+
+
+def bench_archive(args, db_path):
+    # Years of returned loans (and one open loan per ten, which --items must
+    # leave room for), then the archive job. Compares the jobs that
+    # walk BorrowingRecord (the nightly open-loan fine run, the summary
+    # check) and a borrow + return before and after, and checks that the
+    # history view and the dashboard counters are unchanged by the move.
+    make_fixture(db_path, items=args.items, members=args.members, loans=args.loans)
+    conn = sqlite3.connect(db_path)
+    history = conn.execute("SELECT COUNT(*) FROM BorrowingHistory").fetchone()[0]
+    schedule = fines.load_schedule()
+
+    def measure():
+        start = time.perf_counter()
+        fines.compute_fines(conn, schedule, open_only=True, dry_run=True)
+        fine_run = time.perf_counter() - start
+        start = time.perf_counter()
+        drift = summaries.diff(conn)
+        check = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.new_loans):
+            item = conn.execute("SELECT ItemID FROM Item WHERE AvailabilityStatus = 1 LIMIT 1").fetchone()[0]
+            cur = conn.execute("INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate) VALUES (?, ?, '2099-01-01')",
+                               (random.randint(1, args.members), item))
+            conn.execute("UPDATE BorrowingRecord SET ReturnDate = DATE('now') WHERE RecordID = ?", (cur.lastrowid,))
+            conn.commit()
+        loan = (time.perf_counter() - start) / args.new_loans
+        return fine_run, check, loan, drift
+
+    before = measure()
+    start = time.perf_counter()
+    report = archive.archive_loans(conn, args.days, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    sizes = archive.table_sizes(conn)
+    after = measure()
+    history_after = conn.execute("SELECT COUNT(*) FROM BorrowingHistory").fetchone()[0]
+    conn.close()
+
+    print(f"archived {report['moved']:,} of {args.loans:,} loans in {elapsed:.2f}s "
+          f"({report['moved'] / elapsed if elapsed else 0:,.0f} loans/s, slowest chunk "
+          f"{report['slowest_chunk'] * 1000:.0f} ms); {sizes['BorrowingRecord']:,} left in BorrowingRecord")
+    print(f"{'':<28}{'before':>10}{'after':>10}")
+    for label, index, scale, unit in (('open-loan fine run', 0, 1000, 'ms'), ('summary check', 1, 1000, 'ms'),
+                                      ('borrow + return', 2, 1000, 'ms')):
+        print(f"{label + ' (' + unit + ')':<28}{before[index] * scale:>10.2f}{after[index] * scale:>10.2f}")
+    expected = history + 2 * args.new_loans
+    ok = history_after == expected and not before[3] and not after[3]
+    print("OK" if ok else f"FAILED: {history_after:,} loans in BorrowingHistory (expected {expected:,}), "
+                          f"{len(after[3])} summary rows out of date")
+    return ok
+
+
+def count_signups(db_path):
+    conn = sqlite3.connect(db_path)
+    count = conn.execute("SELECT (SELECT COUNT(*) FROM HelpRequest) + (SELECT COUNT(*) FROM Volunteer)").fetchone()[0]
+    conn.close()
+    return count
+
+
+def remove_signups(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM HelpRequest")
+    conn.execute("DELETE FROM Volunteer")
+    conn.execute("DELETE FROM Person WHERE Role = 'Volunteer'")
+    conn.commit()
+    conn.close()
+
+
+def prepare_fixture(args, db_path):
+    # The fixture is copied so that repeated runs start from the same data
+    if args.fixture:
+        shutil.copyfile(args.fixture, db_path)
+    else:
+        scale = SCALES[args.scale]
+        make_fixture(db_path, items=scale, members=scale, loans=scale, events=args.events)
+    fx = Fixture(db_path)
+    if fx.events <= 1:
+        make_events(db_path, args.events)
+        fx = Fixture(db_path)
+    return fx
+
+
+def run_workload(driver, fx, threads, requests, warmup, read_only=False):
+    workload = [entry for entry in WORKLOAD if not read_only or entry[2] == 'GET']
+    weights = [entry[1] for entry in workload]
+    lock = threading.Lock()
+    latencies = {entry[0]: [] for entry in workload}
+    errors = {entry[0]: 0 for entry in workload}
+    rejected = {entry[0]: 0 for entry in workload}
+
+    def one_request(i):
+        name, _, method, build = random.choices(workload, weights)[0]
+        path, data = build(fx)
+        start = time.perf_counter()
+        status = driver.request(method, path, data)
+        elapsed = time.perf_counter() - start
+        with lock:
+            if status == 503:
+                rejected[name] += 1
+                return
+            latencies[name].append(elapsed)
+            if status >= 400:
+                errors[name] += 1
+
+    # Warm up caches and connections before measuring
+    run_concurrently(threads, min(warmup, requests), one_request)
+    for name in latencies:
+        latencies[name].clear()
+        errors[name] = rejected[name] = 0
+    _, elapsed = run_concurrently(threads, requests, one_request)
+
+    overall = summarize([t for values in latencies.values() for t in values], sum(errors.values()), elapsed)
+    overall['rejected'] = sum(rejected.values())
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'threads': threads,
+            'requests': requests,
+            'fixture': fx.counts,
+        },
+        'overall': overall,
+        'routes': {name: summarize(values, errors[name], elapsed)
+                   for name, values in latencies.items() if values},
+    }, elapsed
+
+
+def bench_routes(args, db_path):
+    # Mixed read/write traffic over every page
+    if args.url:
+        # the server has its own copy of the fixture; ids are read from ours
+        fx = Fixture(args.fixture) if args.fixture else prepare_fixture(args, db_path)
+        driver = HTTPDriver(args.url)
+    else:
+        fx = prepare_fixture(args, db_path)
+        driver = TestClientDriver(load_app(db_path, args.threads))
+
+    report, elapsed = run_workload(driver, fx, args.threads, args.requests, args.warmup, args.read_only)
+    report['meta']['driver'] = args.url or 'test-client'
+    print(f"{args.requests} requests from {args.threads} threads in {elapsed:.2f}s "
+          f"against {fx.counts['Item']:,} items, {fx.counts['Member']:,} members, "
+          f"{fx.counts['BorrowingRecord']:,} loans")
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    ok = report['overall']['errors'] == 0 and not report['overall']['rejected']
+    if not ok:
+        print("FAILED: some requests returned an error status")
+    if args.compare:
+        with open(args.compare) as f:
+            ok = compare_reports(report, json.load(f), args.tolerance) and ok
+    return ok
+
+
+def bench_serving(args, db_path):
+    # The same workload through the plain WSGI app (one thread per client)
+    # and through the ASGI adapter (clients multiplexed onto a bounded pool
+    # of app threads, with load shedding). Both runs share one database.
+    fx = prepare_fixture(args, db_path)
+    os.environ['LIBRARY_ASGI_WORKERS'] = str(args.workers)
+    os.environ['LIBRARY_ASGI_MAX_PENDING'] = str(args.max_pending)
+    library = load_app(db_path, args.workers)
+    import asgi
+
+    results = {}
+    drivers = [('wsgi', TestClientDriver(library)), ('asgi', ASGIDriver(asgi.application))]
+    for name, driver in drivers:
+        report, elapsed = run_workload(driver, fx, args.clients, args.requests, args.warmup, args.read_only)
+        results[name] = report['overall']
+        print(f"\n{name}: {args.requests} requests from {args.clients} clients in {elapsed:.2f}s")
+        print_report(report)
+    drivers[1][1].close()
+
+    wsgi, asgi_ = results['wsgi'], results['asgi']
+    print(f"\n{'':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'shed':>7}")
+    for name, row in results.items():
+        print(f"{name:<8}{row['rps']:>9.0f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}{row['rejected']:>7}")
+    print(f"asgi/wsgi throughput: {asgi_['rps'] / wsgi['rps'] if wsgi['rps'] else 0:.2f}x "
+          f"({args.workers} app threads, {args.max_pending} pending)")
+    return wsgi['errors'] == 0 and asgi_['errors'] == 0
+
+
+def make_events(db_path, events):
+    conn = sqlite3.connect(db_path)
+    main.bulk_insert(conn, 'Event', ('EventName', 'EventDate', 'Attendance', 'MaxCapacity', 'RoomID'),
+                     ((f'Bench Event {i}', f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}', 0, 50, None)
+                      for i in range(events)))
+    conn.close()
+
+
+def build_fixture(args):
+    scale = SCALES[args.scale]
+    items = args.items or scale
+    members = args.members or scale
+    loans = scale if args.loans is None else args.loans
+    if os.path.exists(args.path):
+        raise SystemExit(f"{args.path} already exists")
+    start = time.perf_counter()
+    make_fixture(args.path, items=items, members=members, loans=loans, events=args.events)
+    print(f"Built {args.path}: {items:,} items, {members:,} members, {loans:,} loans, "
+          f"{args.events:,} events in {time.perf_counter() - start:.1f}s")
+    return True
+
+
+SCENARIOS = {
+    'archive': bench_archive,
+    'borrow': bench_borrow,
+    'bulk': bench_bulk,
+    'events': bench_events,
+    'holds': bench_holds,
+    'recommend': bench_recommend,
+    'routes': bench_routes,
+    'search': bench_search,
+    'season': bench_season,
+    'serving': bench_serving,
+    'signups': bench_signups,
+    'startup': bench_startup,
+}
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the library app.")
+    subparsers = parser.add_subparsers(dest='scenario', required=True)
+
+    archiving = subparsers.add_parser('archive', help="archive old loans: job speed and hot-table jobs before/after")
+    archiving.add_argument('--items', type=int, default=100000)
+    archiving.add_argument('--members', type=int, default=5000)
+    archiving.add_argument('--loans', type=int, default=500000)
+    archiving.add_argument('--days', type=int, default=archive.DAYS)
+    archiving.add_argument('--chunk-size', type=int, default=archive.CHUNK_SIZE)
+    archiving.add_argument('--new-loans', type=int, default=500)
+
+    bulk = subparsers.add_parser('bulk', help="bulk loading rates with every trigger in place")
+    bulk.add_argument('--items', type=int, default=100000)
+    bulk.add_argument('--members', type=int, default=20000)
+    bulk.add_argument('--loans', type=int, default=20000)
+
+    borrow = subparsers.add_parser('borrow', help="concurrent borrows: no double loans, borrows/s")
+    borrow.add_argument('--threads', type=int, default=16)
+    borrow.add_argument('--requests', type=int, default=5000)
+    borrow.add_argument('--items', type=int, default=500)
+    borrow.add_argument('--members', type=int, default=200)
+
+    events = subparsers.add_parser('events', help="concurrent event registrations against one event's capacity")
+    events.add_argument('--threads', type=int, default=32)
+    events.add_argument('--requests', type=int, default=5000)
+    events.add_argument('--members', type=int, default=2000)
+    events.add_argument('--capacity', type=int, default=100)
+    events.add_argument('--unregister-ratio', type=float, default=0.1)
+
+    holds = subparsers.add_parser('holds', help="return throughput with deep hold queues")
+    holds.add_argument('--threads', type=int, default=8)
+    holds.add_argument('--items', type=int, default=200)
+    holds.add_argument('--rounds', type=int, default=5)
+    holds.add_argument('--depths', type=lambda value: [int(d) for d in value.split(',')], default=[0, 100, 5000],
+                       help="comma-separated queue depths per item")
+
+    recommendations = subparsers.add_parser('recommend', help="recommendation build time, lookup latency and "
+                                                              "trigger cost")
+    recommendations.add_argument('--items', type=int, default=5000)
+    recommendations.add_argument('--members', type=int, default=2000)
+    recommendations.add_argument('--loans', type=int, default=100000)
+    recommendations.add_argument('--lookups', type=int, default=5000)
+    recommendations.add_argument('--new-loans', type=int, default=2000)
+
+    search = subparsers.add_parser('search', help="search latency with and without the rank limit")
+    search.add_argument('--items', type=int, default=1000000)
+    search.add_argument('--runs', type=int, default=20)
+    search.add_argument('--rank-limit', type=int, default=2000)
+
+    season = subparsers.add_parser('season', help="book a season's events: bookings/s and free room search")
+    season.add_argument('--days', type=int, default=90)
+    season.add_argument('--events-per-day', type=int, default=200)
+    season.add_argument('--rooms', type=int, default=100)
+
+    fixture = subparsers.add_parser('fixture', help="build a synthetic database for the routes benchmark")
+    fixture.add_argument('path')
+    fixture.add_argument('--scale', choices=sorted(SCALES), default='10k',
+                         help="items, members and loans (each overridable below)")
+    fixture.add_argument('--items', type=int)
+    fixture.add_argument('--members', type=int)
+    fixture.add_argument('--loans', type=int)
+    fixture.add_argument('--events', type=int, default=500)
+
+    routes = subparsers.add_parser('routes', help="latency percentiles for a mixed workload over every route")
+    routes.add_argument('--fixture', help="database built with 'bench.py fixture' (copied, never modified)")
+    routes.add_argument('--scale', choices=sorted(SCALES), default='10k', help="fixture to build without --fixture")
+    routes.add_argument('--events', type=int, default=500)
+    routes.add_argument('--url', help="drive a running server instead of the test client")
+    routes.add_argument('--threads', type=int, default=8)
+    routes.add_argument('--requests', type=int, default=2000)
+    routes.add_argument('--warmup', type=int, default=200)
+    routes.add_argument('--read-only', action='store_true', help="GET requests only")
+    routes.add_argument('--save', help="write the results to this JSON file")
+    routes.add_argument('--compare', help="compare with a JSON file written by --save")
+    routes.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown before a route counts as a regression")
+
+    serving = subparsers.add_parser('serving', help="the same workload through WSGI and the ASGI adapter")
+    serving.add_argument('--fixture', help="database built with 'bench.py fixture' (copied, never modified)")
+    serving.add_argument('--scale', choices=sorted(SCALES), default='10k', help="fixture to build without --fixture")
+    serving.add_argument('--events', type=int, default=500)
+    serving.add_argument('--clients', type=int, default=64, help="concurrent clients")
+    serving.add_argument('--workers', type=int, default=8, help="ASGI app threads (and pool size for both)")
+    serving.add_argument('--max-pending', type=int, default=256, help="ASGI requests allowed to queue")
+    serving.add_argument('--requests', type=int, default=2000)
+    serving.add_argument('--warmup', type=int, default=200)
+    serving.add_argument('--read-only', action='store_true', help="GET requests only")
+
+    signups = subparsers.add_parser('signups', help="burst of help requests and volunteer signups, with and "
+                                                     "without group commit")
+    signups.add_argument('--threads', type=int, default=32)
+    signups.add_argument('--requests', type=int, default=3000)
+    signups.add_argument('--members', type=int, default=1000)
+    signups.add_argument('--group-rows', type=int, default=64)
+    signups.add_argument('--group-ms', type=float, default=5)
+    signups.add_argument('--synchronous', choices=['OFF', 'NORMAL', 'FULL'], default='FULL')
+
+    startup = subparsers.add_parser('startup', help="import time and time to the first request, in new processes")
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--items', type=int, default=10000, help="items, members and loans in the database")
+    startup.add_argument('--path', default='/find-item', help="page requested first")
+
+    args = parser.parse_args(argv)
+    if args.scenario == 'fixture':
+        raise SystemExit(0 if build_fixture(args) else 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = SCENARIOS[args.scenario](args, os.path.join(tmp, 'bench.db'))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,314 @@
+import pathlib
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Pragmas applied once when a pooled connection is opened
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",      # ~20 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+]
+
+# journal_mode can't be changed through a read-only connection; WAL is a
+# property of the database file, set by the first read-write connection
+READ_ONLY_PRAGMAS = [pragma for pragma in PRAGMAS if 'journal_mode' not in pragma]
+
+
+# Bounded retry for transactions that lose the race for the write lock
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.01
+
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def run_transaction(conn, fn, *args, retries=BUSY_RETRIES, backoff=BUSY_BACKOFF):
+    # Run fn(conn, *args) inside BEGIN IMMEDIATE and commit. Taking the write
+    # lock up front means the transaction can't fail halfway through on a
+    # lock upgrade; if the lock stays busy the whole transaction is retried
+    # with exponential backoff and jitter.
+    for attempt in range(retries + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy_error(e) or attempt == retries:
+                raise
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        time.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+def open_connection(path, pragmas=PRAGMAS, **kwargs):
+    conn = sqlite3.connect(path, check_same_thread=False, **kwargs)
+    conn.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+def open_read_only(path):
+    # mode=ro: any write fails with "attempt to write a readonly database".
+    # Under WAL, readers never wait for the writer.
+    uri = pathlib.Path(path).absolute().as_uri() + '?mode=ro'
+    return open_connection(uri, READ_ONLY_PRAGMAS, uri=True)
+
+
+class ConnectionPool:
+    # Reusable SQLite connections shared by the worker threads. Connections
+    # are opened lazily up to max_size; after that, checkout waits for one
+    # to be returned (up to timeout seconds).
+
+    def __init__(self, path, max_size=8, timeout=30.0, read_only=False):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.read_only = read_only
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+
+    def _open(self):
+        return open_read_only(self.path) if self.read_only else open_connection(self.path)
+
+    def checkout(self):
+        waited = 0.0
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._size < self.max_size:
+                    self._size += 1
+                    grow = True
+                else:
+                    grow = False
+            if grow:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Timed out waiting for a database connection")
+                waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_time += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def checkin(self, conn):
+        # Never hand a connection with an open transaction to the next request
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._size -= 1
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'max_size': self.max_size,
+                'idle': self._idle.qsize(),
+                'in_use': self._size - self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_total': self._wait_time,
+                'wait_time_max': self._max_wait,
+            }
+
+
+# Histogram buckets for the writer's batches. Size buckets are powers of
+# two up to the first one that holds a full batch (batch_size_buckets).
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+BATCH_SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def batch_size_buckets(batch_size):
+    buckets = list(BATCH_SIZE_BUCKETS)
+    while buckets[-1] < batch_size:
+        buckets.append(buckets[-1] * 2)
+    return tuple(buckets)
+
+
+def run_batch(conn, jobs):
+    # Each write gets its own savepoint, so one failing write is undone
+    # without taking the rest of the batch with it
+    outcomes = []
+    for fn, args in jobs:
+        conn.execute("SAVEPOINT write")
+        try:
+            result = fn(conn, *args)
+        except Exception as e:
+            conn.execute("ROLLBACK TO write")
+            conn.execute("RELEASE write")
+            outcomes.append((False, e))
+        else:
+            conn.execute("RELEASE write")
+            outcomes.append((True, result))
+    return outcomes
+
+
+class Writer:
+    # The single writer: one thread owns one read-write connection and runs
+    # submitted write functions one after another. Callers get a Future, so
+    # writes from many request threads queue here instead of competing for
+    # SQLite's write lock.
+    #
+    # Group commit: with batch_size > 1, writes already waiting are run in
+    # the same transaction (up to batch_size of them), and a write submitted
+    # with group=True holds its batch open for up to batch_wait seconds for
+    # more to arrive. Futures are only resolved after the COMMIT, so a result
+    # (for inserts, the new row id) always means the write is committed; with
+    # synchronous='FULL' it has also been synced to disk, which is where
+    # sharing one commit between many writes pays off.
+
+    def __init__(self, path, batch_size=1, batch_wait=0.005, synchronous='NORMAL'):
+        self.path = path
+        self.synchronous = synchronous
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._failures = 0
+        self._batches = 0
+        self._queue_time = 0.0
+        self._busy_time = 0.0
+        self._max_depth = 0
+        self.size_buckets = batch_size_buckets(self.batch_size)
+        self._size_buckets = [0] * len(self.size_buckets)
+        self._seconds_buckets = [0] * len(BATCH_SECONDS_BUCKETS)
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, group=False):
+        future = Future()
+        self._queue.put((fn, args, future, time.perf_counter(), group))
+        with self._lock:
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return future
+
+    def run(self, fn, *args, group=False, timeout=30.0):
+        # submit and wait; the result (or exception) of fn(conn, *args)
+        return self.submit(fn, *args, group=group).result(timeout)
+
+    def _collect(self, first):
+        # The first job plus whatever joins it; None in the batch means stop
+        batch = [first]
+        deadline = time.perf_counter() + (self.batch_wait if first[4] else 0)
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+            if job is None:
+                break
+        return batch
+
+    def _run(self):
+        conn = open_connection(self.path)
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                batch = self._collect(job)
+                stop = batch[-1] is None
+                jobs = [job for job in batch if job is not None and job[2].set_running_or_notify_cancel()]
+                if jobs:
+                    self._commit(conn, jobs)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _commit(self, conn, jobs):
+        start = time.perf_counter()
+        try:
+            outcomes = run_transaction(conn, run_batch, [(fn, args) for fn, args, _, _, _ in jobs])
+        except BaseException as e:
+            outcomes = [(False, e)] * len(jobs)
+        elapsed = time.perf_counter() - start
+        for (_, _, future, _, _), (ok, value) in zip(jobs, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        with self._lock:
+            self._batches += 1
+            self._writes += len(jobs)
+            self._failures += sum(1 for ok, _ in outcomes if not ok)
+            self._queue_time += sum(start - queued for _, _, _, queued, _ in jobs)
+            self._busy_time += elapsed
+            for i, bound in enumerate(self.size_buckets):
+                if len(jobs) <= bound:
+                    self._size_buckets[i] += 1
+            for i, bound in enumerate(BATCH_SECONDS_BUCKETS):
+                if elapsed <= bound:
+                    self._seconds_buckets[i] += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'writes': self._writes,
+                'failures': self._failures,
+                'batches': self._batches,
+                'queued': self._queue.qsize(),
+                'max_queue_depth': self._max_depth,
+                'queue_time_total': self._queue_time,
+                'busy_time_total': self._busy_time,
+                'batch_size_buckets': list(zip(self.size_buckets, self._size_buckets)),
+                'batch_seconds_buckets': list(zip(BATCH_SECONDS_BUCKETS, self._seconds_buckets)),
+            }
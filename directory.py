@@ -0,0 +1,73 @@
+import threading
+import time
+
+MEMBERS_SQL = """
+    SELECT p.PersonID, p.Name
+    FROM Person p
+    JOIN Member m ON p.PersonID = m.MemberID
+    WHERE p.Role = 'Member'
+    ORDER BY p.Name
+"""
+
+# People who can be recorded as donors (not only members)
+DONORS_SQL = """
+    SELECT PersonID, Name FROM Person
+    WHERE Role IN ('Member', 'Volunteer', 'Donor')
+    ORDER BY Name
+"""
+
+
+class DirectoryCache:
+    # In-process cache of the member/donor lists shared by all routes.
+    # Entries expire after ttl seconds; writes to Person, Member or
+    # Volunteer in this process should call invalidate() straight away.
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def _get(self, conn, key, sql):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            with self._lock:
+                self._hits += 1
+            return entry[1]
+
+        # Load under the lock so concurrent misses run the query only once
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            rows = tuple(conn.execute(sql).fetchall())
+            self._entries[key] = (time.monotonic() + self.ttl, rows)
+            return rows
+
+    def members(self, conn):
+        return self._get(conn, 'members', MEMBERS_SQL)
+
+    def donors(self, conn):
+        return self._get(conn, 'donors', DONORS_SQL)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': self._hits / lookups if lookups else 0.0,
+                'invalidations': self._invalidations,
+                'entries': len(self._entries),
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import zlib
+
+# Staff exports, streamed: one SELECT per export walks its table in primary
+# key order (joins are primary key lookups, so there is no sort), and rows
+# are fetched, formatted and sent CHUNK_SIZE at a time. Memory stays the
+# same whatever the size of the table. Loans come from the BorrowingHistory
+# view, which merges the live and archived loans, both in RecordID order.
+
+CHUNK_SIZE = 1000
+
+EXPORTS = {
+    'items': """
+        SELECT ItemID, Title, Type, AuthorPublisher, ISBN, PublicationYear, AvailabilityStatus
+        FROM Item
+        ORDER BY ItemID
+    """,
+    'loans': """
+        SELECT b.RecordID, b.MemberID, p.Name AS MemberName, b.ItemID, i.Title, i.Type,
+               b.BorrowDate, b.DueDate, b.ReturnDate, b.FineAmount
+        FROM BorrowingHistory b
+        LEFT JOIN Person p ON p.PersonID = b.MemberID
+        LEFT JOIN Item i ON i.ItemID = b.ItemID
+        ORDER BY b.RecordID
+    """,
+    'events': """
+        SELECT e.EventID, e.EventName, e.EventDate, e.StartTime, e.EndTime, e.RoomID, r.RoomType,
+               e.Attendance, e.MaxCapacity
+        FROM Event e
+        LEFT JOIN LibraryRoom r ON r.RoomID = e.RoomID
+        ORDER BY e.EventID
+    """,
+    'registrations': """
+        SELECT er.RegistrationID, er.EventID, e.EventName, e.EventDate, er.MemberID, p.Name AS MemberName
+        FROM EventRegistration er
+        LEFT JOIN Event e ON e.EventID = er.EventID
+        LEFT JOIN Person p ON p.PersonID = er.MemberID
+        ORDER BY er.RegistrationID
+    """,
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def csv_chunks(cursor, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column[0] for column in cursor.description)
+    rows = True
+    while rows:
+        rows = cursor.fetchmany(chunk_size)
+        writer.writerows(rows)
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def jsonl_chunks(cursor, chunk_size):
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8')
+
+
+def gzipped(chunks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(pool, name, fmt, compress=False, chunk_size=CHUNK_SIZE):
+    # The response body outlives the request (and its pooled connection), so
+    # the export checks out a connection of its own once the body starts and
+    # returns it when the body is finished or the client goes away
+    conn = pool.checkout()
+    cursor = None
+    try:
+        cursor = conn.execute(EXPORTS[name])
+        chunks = csv_chunks(cursor, chunk_size) if fmt == 'csv' else jsonl_chunks(cursor, chunk_size)
+        yield from gzipped(chunks) if compress else chunks
+    finally:
+        # an unfinished SELECT would keep its read snapshot open
+        if cursor is not None:
+            cursor.close()
+        pool.checkin(conn)
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+
+from db import open_connection, run_transaction
+from summaries import read_summary
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Nightly overdue-fine job.
+#
+#   python fines.py
+#   python fines.py --open-only --as-of 2025-06-30
+#   python fines.py --schedule fees.json --type-rate DVD=1.00 --dry-run
+#
+# Loans are read in RecordID ranges of --chunk-size. For each range one query
+# works out every fine with julianday() arithmetic and returns only the loans
+# whose FineAmount changes; those are written with a single executemany and
+# the range is committed. Memory is bounded by the chunk size, whatever the
+# size of BorrowingRecord.
+#
+# fine = min(max_fine, days late beyond grace_days * daily rate), where the
+# daily rate is the item's entry in type_rates or daily_rate. Open loans are
+# late up to --as-of (today), returned loans up to their ReturnDate.
+
+DEFAULT_SCHEDULE = {
+    'grace_days': 3,
+    'daily_rate': 0.25,
+    'max_fine': 10.00,
+    'type_rates': {
+        'DVD': 1.00,
+        'CD': 0.50,
+    },
+}
+
+CHUNK_SIZE = 50000
+
+FINES_SQL = """
+    SELECT RecordID, MIN(Fine, COALESCE(:max_fine, Fine)) FROM (
+        SELECT b.RecordID, b.FineAmount,
+               ROUND(MAX(0, CAST(julianday(COALESCE(b.ReturnDate, :today)) - julianday(b.DueDate) AS INTEGER)
+                            - :grace_days)
+                     * COALESCE(r.Rate, :daily_rate), 2) AS Fine
+        FROM BorrowingRecord b
+        LEFT JOIN Item i ON i.ItemID = b.ItemID
+        LEFT JOIN temp.FineRate r ON r.Type = i.Type
+        WHERE b.RecordID >= :low AND b.RecordID < :high
+          AND julianday(b.DueDate) IS NOT NULL
+          AND julianday(COALESCE(b.ReturnDate, :today)) IS NOT NULL
+          {scope}
+    )
+    WHERE FineAmount IS NOT MIN(Fine, COALESCE(:max_fine, Fine))
+"""
+
+
+def load_schedule(path=None, overrides=None):
+    schedule = dict(DEFAULT_SCHEDULE, type_rates=dict(DEFAULT_SCHEDULE['type_rates']))
+    if path:
+        with open(path) as f:
+            loaded = json.load(f)
+        schedule['type_rates'].update(loaded.pop('type_rates', {}))
+        schedule.update(loaded)
+    for key, value in (overrides or {}).items():
+        if key == 'type_rates':
+            schedule['type_rates'].update(value)
+        elif value is not None:
+            schedule[key] = value
+    if schedule['grace_days'] < 0 or schedule['daily_rate'] < 0:
+        raise ValueError("grace_days and daily_rate must not be negative")
+    return schedule
+
+
+def parse_type_rate(value):
+    item_type, _, rate = value.partition('=')
+    if not item_type or not rate:
+        raise argparse.ArgumentTypeError(f"expected TYPE=RATE, got {value!r}")
+    return item_type, float(rate)
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive number, got {value!r}")
+    return number
+
+
+def compute_fines(conn, schedule, today=None, open_only=False, chunk_size=CHUNK_SIZE, dry_run=False):
+    today = today or date.today().isoformat()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS FineRate (Type TEXT PRIMARY KEY, Rate REAL NOT NULL)")
+    conn.execute("DELETE FROM temp.FineRate")
+    conn.executemany("INSERT INTO temp.FineRate (Type, Rate) VALUES (?, ?)", schedule['type_rates'].items())
+    conn.commit()
+
+    sql = FINES_SQL.format(scope="AND b.ReturnDate IS NULL" if open_only else "")
+    params = {
+        'today': today,
+        'grace_days': schedule['grace_days'],
+        'daily_rate': schedule['daily_rate'],
+        'max_fine': schedule['max_fine'],
+    }
+    low, high = conn.execute("SELECT MIN(RecordID), MAX(RecordID) FROM BorrowingRecord").fetchone()
+    report = {'today': today, 'scanned_ids': 0, 'changed': 0, 'chunks': 0, 'slowest_chunk': 0.0}
+    if low is None:
+        return report
+
+    def update_chunk(conn, low):
+        changes = conn.execute(sql, dict(params, low=low, high=low + chunk_size)).fetchall()
+        if not dry_run:
+            conn.executemany("UPDATE BorrowingRecord SET FineAmount = ? WHERE RecordID = ?",
+                             [(fine, record_id) for record_id, fine in changes])
+        return len(changes)
+
+    for start in range(low, high + 1, chunk_size):
+        chunk_start = time.perf_counter()
+        if dry_run:
+            changed = update_chunk(conn, start)
+        else:
+            changed = run_transaction(conn, update_chunk, start)
+        report['chunks'] += 1
+        report['changed'] += changed
+        report['scanned_ids'] += min(chunk_size, high + 1 - start)
+        report['slowest_chunk'] = max(report['slowest_chunk'], time.perf_counter() - chunk_start)
+    return report
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Compute overdue fines on BorrowingRecord.")
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    parser.add_argument('--schedule', help="JSON fee schedule (keys as in DEFAULT_SCHEDULE)")
+    parser.add_argument('--grace-days', type=int)
+    parser.add_argument('--daily-rate', type=float)
+    parser.add_argument('--max-fine', type=float)
+    parser.add_argument('--no-cap', action='store_true', help="no maximum fine")
+    parser.add_argument('--type-rate', type=parse_type_rate, action='append', default=[],
+                        metavar='TYPE=RATE', help="daily rate for one item type (repeatable)")
+    parser.add_argument('--as-of', type=lambda value: date.fromisoformat(value).isoformat(),
+                        help="date open loans are charged up to (default today)")
+    parser.add_argument('--open-only', action='store_true', help="skip returned loans")
+    parser.add_argument('--chunk-size', type=positive_int, default=CHUNK_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="count the changes without writing them")
+    args = parser.parse_args(argv)
+
+    try:
+        schedule = load_schedule(args.schedule, {
+            'grace_days': args.grace_days,
+            'daily_rate': args.daily_rate,
+            'max_fine': args.max_fine,
+            'type_rates': dict(args.type_rate),
+        })
+    except (OSError, ValueError) as e:
+        print(f"Error: bad fee schedule: {e}", file=sys.stderr)
+        return 1
+    if args.no_cap:
+        schedule['max_fine'] = None
+
+    try:
+        conn = open_connection(args.db)
+    except sqlite3.Error as e:
+        print(f"Error: cannot open {args.db}: {e}", file=sys.stderr)
+        return 1
+    try:
+        before = read_summary(conn)['fines_total']
+        start = time.perf_counter()
+        report = compute_fines(conn, schedule, args.as_of, args.open_only, args.chunk_size, args.dry_run)
+        elapsed = time.perf_counter() - start
+        after = read_summary(conn)['fines_total']
+    except sqlite3.Error as e:
+        print(f"Error: fines not computed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+    cap = 'no cap' if schedule['max_fine'] is None else f"cap {schedule['max_fine']:.2f}"
+    rates = ', '.join(f"{t} {r:.2f}/day" for t, r in sorted(schedule['type_rates'].items()))
+    print(f"Fines as of {report['today']}: grace {schedule['grace_days']} days, "
+          f"{schedule['daily_rate']:.2f}/day, {cap}" + (f"; {rates}" if rates else ""))
+    print(f"Scanned {report['scanned_ids']:,} record ids in {report['chunks']:,} chunks "
+          f"({'open loans' if args.open_only else 'all loans'}): "
+          f"{report['changed']:,} fines {'would change' if args.dry_run else 'changed'}")
+    print(f"Fines outstanding: {after:,.2f} ({after - before:+,.2f})")
+    memory = peak_memory_mb()
+    print(f"Time: {elapsed:.2f}s, {report['scanned_ids'] / elapsed if elapsed else 0:,.0f} records/s, "
+          f"slowest chunk {report['slowest_chunk']:.3f}s"
+          + (f", peak memory {memory:.0f} MB" if memory is not None else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
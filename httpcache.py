@@ -0,0 +1,123 @@
+import functools
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import g, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+
+def read_versions(conn, names):
+    # (versions, last modified) for the DataVersion counters in names
+    rows = conn.execute(f"""
+        SELECT Name, Version, UpdatedAt FROM DataVersion
+        WHERE Name IN ({', '.join('?' * len(names))})
+    """, names).fetchall()
+    found = {row[0]: row for row in rows}
+    versions = tuple(found[name][1] if name in found else 0 for name in names)
+    stamps = [found[name][2] for name in names if name in found]
+    modified = None
+    if stamps:
+        modified = datetime.strptime(max(stamps), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return versions, modified
+
+
+class HTMLCache:
+    # Small LRU of rendered pages. Keys include the data versions, so an
+    # entry is never served after the data under it changes; old entries
+    # simply age out.
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+class ConditionalGet:
+    # Decorator for read-only pages whose HTML depends only on the URL and
+    # the named DataVersion counters. GETs get an ETag and Last-Modified and
+    # a bodiless 304 when the client's copy is current; with an HTMLCache the
+    # rendered page is reused as well. Requests with pending flash messages
+    # bypass all of it, since those are rendered into the page once.
+
+    def __init__(self, get_connection, salt='', html_cache=None):
+        self.get_connection = get_connection
+        self.salt = salt
+        self.html_cache = html_cache
+        self._lock = threading.Lock()
+        self.not_modified = 0
+
+    def __call__(self, *names):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                versions, modified = self.read(names)
+                etag = '-'.join([self.salt] + [str(version) for version in versions])
+                if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+                    with self._lock:
+                        self.not_modified += 1
+                    return self._headers(make_response('', 304), etag, modified)
+
+                key = (request.path, request.query_string, versions)
+                body = self.html_cache.get(key) if self.html_cache else None
+                if body is not None:
+                    response = make_response(body)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if self.html_cache and response.status_code == 200:
+                        self.html_cache.put(key, response.get_data())
+                return self._headers(response, etag, modified)
+            return wrapper
+        return decorator
+
+    def read(self, names):
+        # read_versions, once per request for each set of names; the views
+        # and fragment caches in the same request share the result
+        seen = g.setdefault('data_versions', {})
+        if names not in seen:
+            seen[names] = read_versions(self.get_connection(), names)
+        return seen[names]
+
+    def recorded(self, names):
+        # Versions already read in this request, or None
+        seen = g.get('data_versions', {})
+        return seen[names][0] if names in seen else None
+
+    def _headers(self, response, etag, modified):
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+        # Revalidate every time; the 304 is the cheap path
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
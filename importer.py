@@ -0,0 +1,252 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+from itertools import islice
+
+import main
+from db import open_connection
+
+# Streaming importer for Items, Persons and borrowing history.
+#
+#   python importer.py items catalogue.csv
+#   python importer.py persons people.jsonl --db library.db
+#   python importer.py loans history.csv --resume
+#
+# Files are read one row at a time and written in chunked transactions, so
+# memory use does not depend on the file size. Progress is saved in the
+# ImportCheckpoint table in the same transaction as each chunk; --resume
+# skips the rows that were already committed.
+
+ROLES = ('Member', 'Librarian', 'Volunteer')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+
+
+def read_rows(path, fmt):
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    # rejected by the validator, like any other bad row
+                    yield e
+
+
+def field(record, name, required=False):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"missing {name}")
+    return value or None
+
+
+def date_field(record, name, required=False):
+    value = field(record, name, required)
+    return date.fromisoformat(value).isoformat() if value else None
+
+
+def item_row(record):
+    year = field(record, 'PublicationYear')
+    available = (field(record, 'AvailabilityStatus') or '1').lower()
+    if available not in TRUE_VALUES + FALSE_VALUES:
+        raise ValueError(f"invalid AvailabilityStatus {available!r}")
+    return (
+        field(record, 'Title', required=True),
+        field(record, 'Type', required=True),
+        field(record, 'AuthorPublisher'),
+        1 if available in TRUE_VALUES else 0,
+        field(record, 'ISBN'),
+        main.parse_publication_year(year) if year else None,
+    )
+
+
+def person_row(record):
+    role = field(record, 'Role', required=True)
+    if role not in ROLES:
+        raise ValueError(f"invalid Role {role!r}")
+    today = date.today().isoformat()
+    person = (
+        field(record, 'Name', required=True),
+        field(record, 'Address'),
+        field(record, 'PhoneNumber'),
+        field(record, 'Email'),
+        role,
+    )
+    if role == 'Librarian':
+        details = (date_field(record, 'HireDate') or today, int(field(record, 'Salary', required=True)))
+    else:
+        details = (date_field(record, 'JoinDate') or today, field(record, 'MembershipStatus') or 'Active')
+    return person, details
+
+
+def loan_row(record):
+    fine = field(record, 'FineAmount')
+    return (
+        int(field(record, 'MemberID', required=True)),
+        int(field(record, 'ItemID', required=True)),
+        date_field(record, 'DueDate', required=True),
+        date_field(record, 'BorrowDate') or date.today().isoformat(),
+        float(fine) if fine else 0.0,
+    ), date_field(record, 'ReturnDate')
+
+
+def write_items(conn, rows):
+    return main.bulk_insert(conn, 'Item', main.ITEM_COLUMNS, rows, commit=False)
+
+
+def write_persons(conn, rows):
+    add_details = {
+        'Member': main.add_member,
+        'Volunteer': main.add_volunteer,
+        'Librarian': main.add_librarian,
+    }
+    written = 0
+    for person, details in rows:
+        person_id = main.add_person(conn, person, commit=False)
+        if person_id is None:
+            continue
+        add_details[person[4]](conn, (person_id,) + details, commit=False)
+        written += 1
+    return written
+
+
+def write_loans(conn, rows):
+    written = 0
+    for loan, return_date in rows:
+        if not conn.execute("SELECT 1 FROM Item WHERE ItemID = ?", (loan[1],)).fetchone():
+            print(f"Error: item {loan[1]} does not exist.", file=sys.stderr)
+            continue
+        try:
+            # Insert as an open loan and then close it, so the availability
+            # triggers leave the item in the right state
+            record_id = main.add_borrowing_record(conn, loan, commit=False)
+            if return_date:
+                conn.execute("UPDATE BorrowingRecord SET ReturnDate = ? WHERE RecordID = ?",
+                             (return_date, record_id))
+            written += 1
+        except sqlite3.IntegrityError as e:
+            print(f"Error: loan of item {loan[1]} rejected: {e}", file=sys.stderr)
+    return written
+
+
+KINDS = {
+    'items': ('Item', item_row, write_items),
+    'persons': ('Person', person_row, write_persons),
+    'loans': ('BorrowingRecord', loan_row, write_loans),
+}
+
+
+def save_checkpoint(conn, source, kind, rows_done):
+    conn.execute("""
+        INSERT INTO ImportCheckpoint (Source, Kind, RowsDone, UpdatedAt)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (Source, Kind) DO UPDATE
+        SET RowsDone = excluded.RowsDone, UpdatedAt = excluded.UpdatedAt
+    """, (source, kind, rows_done))
+
+
+def load_checkpoint(conn, source, kind):
+    row = conn.execute("SELECT RowsDone FROM ImportCheckpoint WHERE Source = ? AND Kind = ?",
+                       (source, kind)).fetchone()
+    return row[0] if row else 0
+
+
+def run_import(conn, kind, path, fmt, batch_size=main.BULK_BATCH_SIZE, resume=False,
+               defer_indexes=False, max_errors=20):
+    table, validate, write = KINDS[kind]
+    source = os.path.abspath(path)
+    done = load_checkpoint(conn, source, kind) if resume else 0
+    rows = read_rows(path, fmt)
+    if done:
+        print(f"Resuming {path} after row {done:,}.")
+        for _ in islice(rows, done):
+            pass
+
+    imported = rejected = 0
+    start = time.perf_counter()
+
+    def import_chunks():
+        nonlocal done, imported, rejected
+        for chunk in main.chunked(rows, batch_size):
+            valid = []
+            for number, record in enumerate(chunk, start=done + 1):
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    valid.append(validate(record))
+                except (ValueError, TypeError, AttributeError) as e:
+                    rejected += 1
+                    if rejected <= max_errors:
+                        print(f"Row {number}: {e}", file=sys.stderr)
+            written = write(conn, valid)
+            rejected += len(valid) - written
+            imported += written
+            done += len(chunk)
+            save_checkpoint(conn, source, kind, done)
+            if not defer_indexes:
+                conn.commit()
+            elapsed = time.perf_counter() - start
+            print(f"{done:,} rows read, {imported:,} imported, {rejected:,} rejected "
+                  f"({done / elapsed:,.0f} rows/s)")
+
+    if defer_indexes:
+        # One transaction for the whole file; indexes are rebuilt at the end
+        with main.deferred_indexes(conn, table):
+            import_chunks()
+    else:
+        import_chunks()
+
+    elapsed = time.perf_counter() - start
+    print(f"Imported {imported:,} {kind} ({rejected:,} rejected) in {elapsed:.2f}s "
+          f"- {imported / elapsed if elapsed else 0:,.0f} rows/s")
+    return imported, rejected
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Import a CSV or JSON-lines file into the library database.")
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('path')
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help="defaults to the file extension (.csv, otherwise JSON lines)")
+    parser.add_argument('--batch-size', type=int, default=main.BULK_BATCH_SIZE)
+    parser.add_argument('--resume', action='store_true', help="skip rows committed by a previous run")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="rebuild indexes once at the end (the whole file becomes one transaction)")
+    parser.add_argument('--max-errors', type=int, default=20, help="rejected rows to print")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.path.lower().endswith('.csv') else 'jsonl')
+    try:
+        conn = open_connection(args.db)
+    except sqlite3.Error as e:
+        print(f"Error: cannot open {args.db}: {e}", file=sys.stderr)
+        return 1
+    try:
+        # Like the app, never create or migrate the schema here
+        version = main.schema_version(conn)
+        if version != main.SCHEMA_VERSION:
+            print(f"Error: {main.schema_mismatch(args.db, version)}", file=sys.stderr)
+            return 1
+        run_import(conn, args.kind, args.path, fmt, args.batch_size, args.resume,
+                   args.defer_indexes, args.max_errors)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error: import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
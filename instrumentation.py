@@ -0,0 +1,245 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('library.sql')
+
+# Request latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements worth asking EXPLAIN QUERY PLAN about
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'replace')
+
+
+def normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class QueryRecord:
+    __slots__ = ('sql', 'seconds', 'rows')
+
+    def __init__(self, sql, seconds):
+        self.sql = sql
+        self.seconds = seconds
+        self.rows = 0
+
+
+class InstrumentedCursor:
+    # Times execute and every fetch, and counts the rows handed out, on the
+    # QueryRecord of the statement last run on this cursor
+
+    def __init__(self, cursor, owner):
+        self._cursor = cursor
+        self._owner = owner
+        self.record = None
+
+    def execute(self, sql, params=()):
+        self.record = self._owner._run(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, rows):
+        self.record = self._owner._run(self._cursor.executemany, sql, rows, explain=False)
+        return self
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self.record is not None:
+            self.record.seconds += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None and self.record is not None:
+            self.record.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+        if self.record is not None:
+            self.record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        if self.record is not None:
+            self.record.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    # Stands in for a sqlite3 connection and appends a QueryRecord to records
+    # for every statement; everything else goes to the real connection
+
+    def __init__(self, connection, metrics, records):
+        self.connection = connection
+        self.metrics = metrics
+        self.records = records
+
+    def _run(self, method, sql, params, explain=True):
+        key = normalize(sql)
+        if explain:
+            self.metrics.explain(self.connection, key, sql, params)
+        start = time.perf_counter()
+        method(sql, params)
+        record = QueryRecord(key, time.perf_counter() - start)
+        self.records.append(record)
+        return record
+
+    def cursor(self):
+        return InstrumentedCursor(self.connection.cursor(), self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        return self.cursor().executemany(sql, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def metric_lines(name, kind, help_text, samples):
+    # samples is a plain value or a list of (labels, value) pairs
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    if not isinstance(samples, list):
+        samples = [((), samples)]
+    for labels, value in samples:
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    return lines
+
+
+def histogram_samples(name, labels, buckets, total, count):
+    # buckets is [(upper bound, cumulative count)]
+    labels = list(labels)
+    lines = [f'{name}_bucket{format_labels(labels + [("le", bound)])} {value}' for bound, value in buckets]
+    lines.append(f'{name}_bucket{format_labels(labels + [("le", "+Inf")])} {count}')
+    lines.append(f'{name}_sum{format_labels(labels)} {total}')
+    lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return lines
+
+
+def histogram_lines(name, help_text, buckets, total, count):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} histogram'] + \
+        histogram_samples(name, (), buckets, total, count)
+
+
+class SQLMetrics:
+    # Process-wide aggregates of the per-request query records, plus request
+    # latency histograms per route. slow_query_seconds is the threshold for
+    # logging a statement (execute plus fetch time).
+
+    def __init__(self, slow_query_seconds=0.1, explain=True):
+        self.slow_query_seconds = slow_query_seconds
+        self.explain_plans = explain
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._statements = {}
+        self._slow = 0
+        self._requests = {}
+        self._statuses = {}
+        self._route_sql = {}
+
+    def explain(self, conn, key, sql, params):
+        if not self.explain_plans or key in self._plans:
+            return
+        if not key.lower().startswith(EXPLAINABLE):
+            return
+        try:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+            plan = '\n'.join(row[3] for row in rows)
+        except sqlite3.Error:
+            plan = None
+        with self._lock:
+            self._plans[key] = plan
+        logger.debug("Query plan for %s\n%s", key, plan)
+
+    def plan(self, sql):
+        return self._plans.get(normalize(sql))
+
+    def observe_request(self, route, method, status, seconds, records):
+        sql_seconds = sum(record.seconds for record in records)
+        slow = [record for record in records if record.seconds >= self.slow_query_seconds]
+        with self._lock:
+            histogram = self._requests.setdefault((route, method), [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            key = (route, method, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+            totals = self._route_sql.setdefault(route, [0.0, 0])
+            totals[0] += sql_seconds
+            totals[1] += len(records)
+            for record in records:
+                stats = self._statements.setdefault(record.sql, [0, 0.0, 0, 0.0])
+                stats[0] += 1
+                stats[1] += record.seconds
+                stats[2] += record.rows
+                stats[3] = max(stats[3], record.seconds)
+            self._slow += len(slow)
+        for record in slow:
+            logger.warning("Slow query on %s %s: %.1f ms, %d rows: %s\n%s", method, route,
+                           record.seconds * 1000, record.rows, record.sql,
+                           self._plans.get(record.sql) or '(no plan)')
+        logger.debug("%s %s: %d queries, %.1f ms SQL of %.1f ms", method, route, len(records),
+                     sql_seconds * 1000, seconds * 1000)
+
+    def render(self):
+        with self._lock:
+            requests = sorted(self._requests.items())
+            statuses = sorted(self._statuses.items())
+            route_sql = sorted(self._route_sql.items())
+            statements = sorted(self._statements.items())
+            slow = self._slow
+
+        lines = [
+            '# HELP library_request_duration_seconds Time spent handling a request.',
+            '# TYPE library_request_duration_seconds histogram',
+        ]
+        for (route, method), (buckets, total, count) in requests:
+            lines += histogram_samples('library_request_duration_seconds', [('route', route), ('method', method)],
+                                       zip(BUCKETS, buckets), total, count)
+        lines += metric_lines('library_requests_total', 'counter', "Requests handled, by status.",
+                              [((('route', route), ('method', method), ('status', status)), count)
+                               for (route, method, status), count in statuses])
+        lines += metric_lines('library_request_sql_seconds_total', 'counter', "SQL time spent per route.",
+                              [((('route', route),), seconds) for route, (seconds, _) in route_sql])
+        lines += metric_lines('library_request_sql_statements_total', 'counter',
+                              "SQL statements run per route.",
+                              [((('route', route),), count) for route, (_, count) in route_sql])
+        lines += metric_lines('library_sql_statements_total', 'counter', "Executions of each statement.",
+                              [((('statement', sql),), stats[0]) for sql, stats in statements])
+        lines += metric_lines('library_sql_statement_seconds_total', 'counter',
+                              "Time spent in each statement, including fetching.",
+                              [((('statement', sql),), stats[1]) for sql, stats in statements])
+        lines += metric_lines('library_sql_statement_rows_total', 'counter', "Rows returned by each statement.",
+                              [((('statement', sql),), stats[2]) for sql, stats in statements])
+        lines += metric_lines('library_sql_statement_seconds_max', 'gauge', "Slowest run of each statement.",
+                              [((('statement', sql),), stats[3]) for sql, stats in statements])
+        lines += metric_lines('library_sql_slow_statements_total', 'counter',
+                              "Statements slower than the slow query threshold.", slow)
+        return lines
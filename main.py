@@ -1,5 +1,13 @@
+import argparse
+import os
+import re
 import sqlite3
+import sys
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
+
+import summaries
 
 sql_statements = [ 
     """CREATE TABLE IF NOT EXISTS Item (
@@ -137,19 +145,586 @@ triggers = [
        END;"""
 ]
 
-def add_item(conn, Item):
+# Schema changes made after the initial tables/triggers above. Each entry is
+# one version: its statements run in a single transaction and the version
+# number is recorded in PRAGMA user_version. Only ever append new versions.
+migrations = [
+    # 1: full-text index over the catalogue, kept in sync by the ItemSearch* triggers
+    [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS ItemSearch USING fts5(
+                Title,
+                AuthorPublisher,
+                ISBN,
+                Type,
+                content='Item',
+                content_rowid='ItemID',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+        );""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemSearchInsert
+           AFTER INSERT ON Item
+           FOR EACH ROW
+           BEGIN
+               INSERT INTO ItemSearch (rowid, Title, AuthorPublisher, ISBN, Type)
+               VALUES (NEW.ItemID, NEW.Title, NEW.AuthorPublisher, NEW.ISBN, NEW.Type);
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemSearchDelete
+           AFTER DELETE ON Item
+           FOR EACH ROW
+           BEGIN
+               INSERT INTO ItemSearch (ItemSearch, rowid, Title, AuthorPublisher, ISBN, Type)
+               VALUES ('delete', OLD.ItemID, OLD.Title, OLD.AuthorPublisher, OLD.ISBN, OLD.Type);
+           END;""",
+
+        # Only fires for the indexed columns, so availability changes don't touch the index
+        """CREATE TRIGGER IF NOT EXISTS ItemSearchUpdate
+           AFTER UPDATE OF Title, AuthorPublisher, ISBN, Type ON Item
+           FOR EACH ROW
+           BEGIN
+               INSERT INTO ItemSearch (ItemSearch, rowid, Title, AuthorPublisher, ISBN, Type)
+               VALUES ('delete', OLD.ItemID, OLD.Title, OLD.AuthorPublisher, OLD.ISBN, OLD.Type);
+               INSERT INTO ItemSearch (rowid, Title, AuthorPublisher, ISBN, Type)
+               VALUES (NEW.ItemID, NEW.Title, NEW.AuthorPublisher, NEW.ISBN, NEW.Type);
+           END;""",
+
+        # index any items that were added before the search index existed
+        """INSERT INTO ItemSearch (ItemSearch) VALUES ('rebuild');"""
+    ],
+
+    # 2: member lookup/autocomplete - role filter plus case-insensitive name prefix
+    [
+        """CREATE INDEX IF NOT EXISTS PersonRoleName ON Person (Role, Name COLLATE NOCASE);"""
+    ],
+
+    # 3: secondary indexes for the hot lookups in app.py
+    [
+        # open loans only: return_item listing and the availability checks
+        """CREATE INDEX IF NOT EXISTS BorrowingRecordOpenByMember
+           ON BorrowingRecord (MemberID) WHERE ReturnDate IS NULL;""",
+
+        """CREATE INDEX IF NOT EXISTS BorrowingRecordOpenByItem
+           ON BorrowingRecord (ItemID) WHERE ReturnDate IS NULL;""",
+
+        # keep the first registration of any duplicates so the unique index can
+        # be built; each duplicate also counted once towards Attendance
+        """UPDATE Event
+           SET Attendance = MAX(0, Attendance - (
+               SELECT COUNT(*) - COUNT(DISTINCT MemberID) FROM EventRegistration r
+               WHERE r.EventID = Event.EventID
+           ))
+           WHERE EventID IN (
+               SELECT EventID FROM EventRegistration GROUP BY EventID, MemberID HAVING COUNT(*) > 1
+           );""",
+
+        """DELETE FROM EventRegistration
+           WHERE RegistrationID NOT IN (
+               SELECT MIN(RegistrationID) FROM EventRegistration GROUP BY EventID, MemberID
+           );""",
+
+        # a member can register for an event only once
+        """CREATE UNIQUE INDEX IF NOT EXISTS EventRegistrationEventMember
+           ON EventRegistration (EventID, MemberID);""",
+
+        """CREATE INDEX IF NOT EXISTS EventRegistrationMember ON EventRegistration (MemberID);""",
+
+        # previous requests for a member, newest first
+        """CREATE INDEX IF NOT EXISTS HelpRequestMemberDate ON HelpRequest (MemberID, RequestDate);""",
+
+        """CREATE INDEX IF NOT EXISTS EventByDate ON Event (EventDate);"""
+    ],
+
+    # 4: progress of resumable imports (importer.py), committed with each chunk
+    [
+        """CREATE TABLE IF NOT EXISTS ImportCheckpoint (
+                Source TEXT NOT NULL,
+                Kind TEXT NOT NULL,
+                RowsDone INTEGER NOT NULL DEFAULT 0,
+                UpdatedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (Source, Kind)
+        );"""
+    ],
+
+    # 5: dashboard counters kept current by triggers (see summaries.py)
+    [
+        """CREATE TABLE IF NOT EXISTS ItemTypeSummary (
+                Type TEXT PRIMARY KEY,
+                Available INTEGER NOT NULL DEFAULT 0,
+                OnLoan INTEGER NOT NULL DEFAULT 0
+        );""",
+
+        # open loans per due date, so overdue counts read one row per date
+        """CREATE TABLE IF NOT EXISTS LoanDueSummary (
+                DueDate DATE PRIMARY KEY,
+                OpenLoans INTEGER NOT NULL DEFAULT 0
+        );""",
+
+        """CREATE TABLE IF NOT EXISTS FineSummary (
+                SummaryID INTEGER PRIMARY KEY CHECK (SummaryID = 1),
+                FinesTotal REAL NOT NULL DEFAULT 0,
+                FinedLoans INTEGER NOT NULL DEFAULT 0
+        );""",
+
+        # availability changes come from UpdateItemStatusOnBorrow/OnReturn
+        """CREATE TRIGGER IF NOT EXISTS ItemTypeSummaryInsert
+           AFTER INSERT ON Item
+           FOR EACH ROW
+           BEGIN
+               INSERT INTO ItemTypeSummary (Type, Available, OnLoan)
+               VALUES (NEW.Type, NEW.AvailabilityStatus IS 1, NEW.AvailabilityStatus IS NOT 1)
+               ON CONFLICT (Type) DO UPDATE
+               SET Available = Available + excluded.Available, OnLoan = OnLoan + excluded.OnLoan;
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemTypeSummaryDelete
+           AFTER DELETE ON Item
+           FOR EACH ROW
+           BEGIN
+               UPDATE ItemTypeSummary
+               SET Available = Available - (OLD.AvailabilityStatus IS 1),
+                   OnLoan = OnLoan - (OLD.AvailabilityStatus IS NOT 1)
+               WHERE Type = OLD.Type;
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemTypeSummaryUpdate
+           AFTER UPDATE OF Type, AvailabilityStatus ON Item
+           FOR EACH ROW
+           WHEN OLD.Type IS NOT NEW.Type OR OLD.AvailabilityStatus IS NOT NEW.AvailabilityStatus
+           BEGIN
+               UPDATE ItemTypeSummary
+               SET Available = Available - (OLD.AvailabilityStatus IS 1),
+                   OnLoan = OnLoan - (OLD.AvailabilityStatus IS NOT 1)
+               WHERE Type = OLD.Type;
+               INSERT INTO ItemTypeSummary (Type, Available, OnLoan)
+               VALUES (NEW.Type, NEW.AvailabilityStatus IS 1, NEW.AvailabilityStatus IS NOT 1)
+               ON CONFLICT (Type) DO UPDATE
+               SET Available = Available + excluded.Available, OnLoan = OnLoan + excluded.OnLoan;
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS LoanSummaryInsert
+           AFTER INSERT ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               INSERT INTO LoanDueSummary (DueDate, OpenLoans)
+               SELECT NEW.DueDate, 1 WHERE NEW.ReturnDate IS NULL
+               ON CONFLICT (DueDate) DO UPDATE SET OpenLoans = OpenLoans + 1;
+               UPDATE FineSummary
+               SET FinesTotal = FinesTotal + COALESCE(NEW.FineAmount, 0),
+                   FinedLoans = FinedLoans + (COALESCE(NEW.FineAmount, 0) > 0);
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS LoanSummaryUpdate
+           AFTER UPDATE OF DueDate, ReturnDate, FineAmount ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               UPDATE LoanDueSummary SET OpenLoans = OpenLoans - 1
+               WHERE DueDate = OLD.DueDate AND OLD.ReturnDate IS NULL;
+               DELETE FROM LoanDueSummary WHERE DueDate = OLD.DueDate AND OpenLoans <= 0;
+               INSERT INTO LoanDueSummary (DueDate, OpenLoans)
+               SELECT NEW.DueDate, 1 WHERE NEW.ReturnDate IS NULL
+               ON CONFLICT (DueDate) DO UPDATE SET OpenLoans = OpenLoans + 1;
+               UPDATE FineSummary
+               SET FinesTotal = FinesTotal - COALESCE(OLD.FineAmount, 0) + COALESCE(NEW.FineAmount, 0),
+                   FinedLoans = FinedLoans - (COALESCE(OLD.FineAmount, 0) > 0)
+                                           + (COALESCE(NEW.FineAmount, 0) > 0);
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS LoanSummaryDelete
+           AFTER DELETE ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               UPDATE LoanDueSummary SET OpenLoans = OpenLoans - 1
+               WHERE DueDate = OLD.DueDate AND OLD.ReturnDate IS NULL;
+               DELETE FROM LoanDueSummary WHERE DueDate = OLD.DueDate AND OpenLoans <= 0;
+               UPDATE FineSummary
+               SET FinesTotal = FinesTotal - COALESCE(OLD.FineAmount, 0),
+                   FinedLoans = FinedLoans - (COALESCE(OLD.FineAmount, 0) > 0);
+           END;""",
+
+        # fill in the counters for the rows that already exist
+        """INSERT OR REPLACE INTO ItemTypeSummary (Type, Available, OnLoan)
+           SELECT Type, SUM(AvailabilityStatus IS 1), SUM(AvailabilityStatus IS NOT 1)
+           FROM Item GROUP BY Type;""",
+
+        """INSERT OR REPLACE INTO LoanDueSummary (DueDate, OpenLoans)
+           SELECT DueDate, COUNT(*) FROM BorrowingRecord
+           WHERE ReturnDate IS NULL GROUP BY DueDate;""",
+
+        """INSERT OR REPLACE INTO FineSummary (SummaryID, FinesTotal, FinedLoans)
+           SELECT 1, COALESCE(SUM(FineAmount), 0), COALESCE(SUM(FineAmount > 0), 0)
+           FROM BorrowingRecord;"""
+    ],
+
+    # 6: change counters behind the ETag/Last-Modified headers (httpcache.py).
+    # 'Item' covers the catalogue, 'Event' covers events and registrations.
+    [
+        """CREATE TABLE IF NOT EXISTS DataVersion (
+                Name TEXT PRIMARY KEY,
+                Version INTEGER NOT NULL DEFAULT 0,
+                UpdatedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );""",
+
+        """INSERT OR IGNORE INTO DataVersion (Name) VALUES ('Item'), ('Event');""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemVersionInsert
+           AFTER INSERT ON Item
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Item';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemVersionUpdate
+           AFTER UPDATE ON Item
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Item';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemVersionDelete
+           AFTER DELETE ON Item
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Item';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventVersionInsert
+           AFTER INSERT ON Event
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Event';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventVersionUpdate
+           AFTER UPDATE ON Event
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Event';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventVersionDelete
+           AFTER DELETE ON Event
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Event';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventRegistrationVersionInsert
+           AFTER INSERT ON EventRegistration
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Event';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventRegistrationVersionUpdate
+           AFTER UPDATE ON EventRegistration
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Event';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventRegistrationVersionDelete
+           AFTER DELETE ON EventRegistration
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Event';
+           END;"""
+    ],
+
+    # 7: 'Loan' change counter for the cached loan tables (templating.py).
+    # Fine updates don't show in those tables, so they don't bump it.
+    [
+        """INSERT OR IGNORE INTO DataVersion (Name) VALUES ('Loan');""",
+
+        """CREATE TRIGGER IF NOT EXISTS LoanVersionInsert
+           AFTER INSERT ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Loan';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS LoanVersionUpdate
+           AFTER UPDATE OF MemberID, ItemID, BorrowDate, DueDate, ReturnDate ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Loan';
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS LoanVersionDelete
+           AFTER DELETE ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+               WHERE Name = 'Loan';
+           END;"""
+    ],
+
+    # 8: holds. Waiting holds on an item queue by Priority (highest first),
+    # then HoldID. A return hands the item to the head of the queue (its hold
+    # becomes Ready, and only that member may borrow it) instead of making it
+    # available; so does cancelling a Ready hold.
+    [
+        """CREATE TABLE IF NOT EXISTS Hold (
+                HoldID INTEGER PRIMARY KEY AUTOINCREMENT,
+                ItemID INTEGER NOT NULL,
+                MemberID INTEGER NOT NULL,
+                Priority INTEGER NOT NULL DEFAULT 0,
+                Status TEXT NOT NULL DEFAULT 'Waiting',
+                PlacedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                ReadyAt TEXT,
+                FOREIGN KEY (ItemID) REFERENCES Item(ItemID),
+                FOREIGN KEY (MemberID) REFERENCES Member(MemberID)
+        );""",
+
+        # the queue itself: its head is the first entry for the item
+        """CREATE INDEX IF NOT EXISTS HoldQueue
+           ON Hold (ItemID, Priority DESC, HoldID) WHERE Status = 'Waiting';""",
+
+        # one open hold per member and item, and one Ready hold per item
+        """CREATE UNIQUE INDEX IF NOT EXISTS HoldOpenByMember
+           ON Hold (MemberID, ItemID) WHERE Status IN ('Waiting', 'Ready');""",
+
+        """CREATE UNIQUE INDEX IF NOT EXISTS HoldReady
+           ON Hold (ItemID) WHERE Status = 'Ready';""",
+
+        # the member a Ready hold is for may borrow the (unavailable) item
+        """DROP TRIGGER IF EXISTS ItemAvailabilityTrigger;""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemAvailabilityTrigger
+           BEFORE INSERT ON BorrowingRecord
+           FOR EACH ROW
+           WHEN (SELECT AvailabilityStatus FROM Item WHERE ItemID = NEW.ItemID) != 1
+            AND NOT EXISTS (SELECT 1 FROM Hold
+                            WHERE ItemID = NEW.ItemID AND MemberID = NEW.MemberID AND Status = 'Ready')
+           BEGIN
+               SELECT RAISE(ABORT, 'Item is not available for borrowing.');
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS HoldFulfilledOnBorrow
+           AFTER INSERT ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               UPDATE Hold SET Status = 'Fulfilled'
+               WHERE MemberID = NEW.MemberID AND ItemID = NEW.ItemID AND Status IN ('Waiting', 'Ready');
+           END;""",
+
+        # Only fires when a loan is actually returned; before this it also
+        # fired on fine updates and made re-borrowed items available
+        """DROP TRIGGER IF EXISTS UpdateItemStatusOnReturn;""",
+
+        """CREATE TRIGGER IF NOT EXISTS UpdateItemStatusOnReturn
+           AFTER UPDATE OF ReturnDate ON BorrowingRecord
+           FOR EACH ROW
+           WHEN OLD.ReturnDate IS NULL AND NEW.ReturnDate IS NOT NULL
+           BEGIN
+               UPDATE Hold SET Status = 'Ready', ReadyAt = CURRENT_TIMESTAMP
+               WHERE HoldID = (SELECT HoldID FROM Hold
+                               WHERE ItemID = NEW.ItemID AND Status = 'Waiting'
+                               ORDER BY Priority DESC, HoldID LIMIT 1);
+               UPDATE Item SET AvailabilityStatus = 1
+               WHERE ItemID = NEW.ItemID
+                 AND NOT EXISTS (SELECT 1 FROM Hold WHERE ItemID = NEW.ItemID AND Status = 'Ready');
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS HoldReleased
+           AFTER UPDATE OF Status ON Hold
+           FOR EACH ROW
+           WHEN OLD.Status = 'Ready' AND NEW.Status = 'Cancelled'
+           BEGIN
+               UPDATE Hold SET Status = 'Ready', ReadyAt = CURRENT_TIMESTAMP
+               WHERE HoldID = (SELECT HoldID FROM Hold
+                               WHERE ItemID = NEW.ItemID AND Status = 'Waiting'
+                               ORDER BY Priority DESC, HoldID LIMIT 1);
+               UPDATE Item SET AvailabilityStatus = 1
+               WHERE ItemID = NEW.ItemID
+                 AND NOT EXISTS (SELECT 1 FROM Hold WHERE ItemID = NEW.ItemID AND Status = 'Ready');
+           END;"""
+    ],
+
+    # 9: "also borrowed" recommendations (recommend.py). ItemNeighbor keeps
+    # the top 10 (recommend.NEIGHBORS) co-borrowed items per item; it is
+    # built in bulk by 'python recommend.py build'. Between builds a new
+    # loan only queues its RecordID in ItemNeighborPending, and
+    # recommend.apply_pending counts the queued loans in batches outside the
+    # borrow transaction (the app runs it after each borrow, and
+    # 'python recommend.py apply' or 'build' catch up after bulk loads).
+    [
+        """CREATE TABLE IF NOT EXISTS ItemNeighbor (
+                ItemID INTEGER NOT NULL,
+                NeighborID INTEGER NOT NULL,
+                CoBorrows INTEGER NOT NULL,
+                PRIMARY KEY (ItemID, NeighborID)
+        ) WITHOUT ROWID;""",
+
+        # a member's borrowing history
+        """CREATE INDEX IF NOT EXISTS BorrowingRecordMemberItem ON BorrowingRecord (MemberID, ItemID);""",
+
+        """CREATE TABLE IF NOT EXISTS ItemNeighborPending (
+                RecordID INTEGER PRIMARY KEY
+        );""",
+
+        """CREATE TRIGGER IF NOT EXISTS ItemNeighborQueue
+           AFTER INSERT ON BorrowingRecord
+           FOR EACH ROW
+           BEGIN
+               INSERT OR IGNORE INTO ItemNeighborPending (RecordID) VALUES (NEW.RecordID);
+           END;"""
+    ],
+
+    # 10: event times and the EventSlot interval index (scheduling.py).
+    # Each event held in a room is a box in an integer R*Tree: the room on
+    # one axis (a point) and its time on the other, in minutes since 1970
+    # UTC. Events without times take the whole day. The EventSlot* triggers
+    # keep it in step with Event.
+    [
+        """ALTER TABLE Event ADD COLUMN StartTime TEXT;""",
+
+        """ALTER TABLE Event ADD COLUMN EndTime TEXT;""",
+
+        """CREATE VIRTUAL TABLE IF NOT EXISTS EventSlot USING rtree_i32(
+                EventID,
+                MinRoom, MaxRoom,
+                StartMinute, EndMinute
+        );""",
+
+        """INSERT INTO EventSlot (EventID, MinRoom, MaxRoom, StartMinute, EndMinute)
+           SELECT EventID, RoomID, RoomID,
+                  CAST(strftime('%s', EventDate) AS INTEGER) / 60,
+                  CAST(strftime('%s', EventDate) AS INTEGER) / 60 + 1440
+           FROM Event
+           WHERE RoomID IS NOT NULL AND strftime('%s', EventDate) IS NOT NULL;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventSlotInsert
+           AFTER INSERT ON Event
+           FOR EACH ROW
+           WHEN NEW.RoomID IS NOT NULL AND strftime('%s', NEW.EventDate) IS NOT NULL
+           BEGIN
+               INSERT INTO EventSlot (EventID, MinRoom, MaxRoom, StartMinute, EndMinute)
+               VALUES (NEW.EventID, NEW.RoomID, NEW.RoomID,
+                       CAST(strftime('%s', NEW.EventDate || ' ' || COALESCE(NEW.StartTime, '00:00')) AS INTEGER) / 60,
+                       COALESCE(CAST(strftime('%s', NEW.EventDate || ' ' || NEW.EndTime) AS INTEGER) / 60,
+                                CAST(strftime('%s', NEW.EventDate) AS INTEGER) / 60 + 1440));
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventSlotUpdate
+           AFTER UPDATE OF EventDate, StartTime, EndTime, RoomID ON Event
+           FOR EACH ROW
+           BEGIN
+               DELETE FROM EventSlot WHERE EventID = OLD.EventID;
+               INSERT INTO EventSlot (EventID, MinRoom, MaxRoom, StartMinute, EndMinute)
+               SELECT NEW.EventID, NEW.RoomID, NEW.RoomID,
+                      CAST(strftime('%s', NEW.EventDate || ' ' || COALESCE(NEW.StartTime, '00:00')) AS INTEGER) / 60,
+                      COALESCE(CAST(strftime('%s', NEW.EventDate || ' ' || NEW.EndTime) AS INTEGER) / 60,
+                               CAST(strftime('%s', NEW.EventDate) AS INTEGER) / 60 + 1440)
+               WHERE NEW.RoomID IS NOT NULL AND strftime('%s', NEW.EventDate) IS NOT NULL;
+           END;""",
+
+        """CREATE TRIGGER IF NOT EXISTS EventSlotDelete
+           AFTER DELETE ON Event
+           FOR EACH ROW
+           BEGIN
+               DELETE FROM EventSlot WHERE EventID = OLD.EventID;
+           END;"""
+    ],
+
+    # 11: cold storage for old loans (archive.py). Returned, unfined loans
+    # past a cut-off move to BorrowingRecordArchive with their RecordIDs, so
+    # BorrowingRecord holds what is open or still owed plus recent history.
+    # BorrowingHistory reads both; history queries use it.
+    [
+        """CREATE TABLE IF NOT EXISTS BorrowingRecordArchive (
+                RecordID INTEGER PRIMARY KEY,
+                MemberID INTEGER NOT NULL,
+                ItemID INTEGER NOT NULL,
+                DueDate DATE NOT NULL,
+                BorrowDate DATE,
+                ReturnDate DATE NOT NULL,
+                FineAmount REAL DEFAULT 0,
+                FOREIGN KEY (MemberID) REFERENCES Member(MemberID),
+                FOREIGN KEY (ItemID) REFERENCES Item(ItemID)
+        );""",
+
+        """CREATE INDEX IF NOT EXISTS BorrowingRecordArchiveMemberItem
+           ON BorrowingRecordArchive (MemberID, ItemID);""",
+
+        """CREATE VIEW IF NOT EXISTS BorrowingHistory AS
+           SELECT RecordID, MemberID, ItemID, DueDate, BorrowDate, ReturnDate, FineAmount
+           FROM BorrowingRecord
+           UNION ALL
+           SELECT RecordID, MemberID, ItemID, DueDate, BorrowDate, ReturnDate, FineAmount
+           FROM BorrowingRecordArchive;"""
+    ],
+
+    # 12: UpdateMemberStatusOnReturn fired on every update of a returned
+    # loan, so fines.py marked members Inactive while they had loans out.
+    # It now fires only when a loan is returned, and only once the member
+    # has nothing else on loan (UpdateItemStatusOnReturn got the same fix
+    # in migration 8).
+    [
+        """DROP TRIGGER IF EXISTS UpdateMemberStatusOnReturn;""",
+
+        """CREATE TRIGGER IF NOT EXISTS UpdateMemberStatusOnReturn
+           AFTER UPDATE OF ReturnDate ON BorrowingRecord
+           FOR EACH ROW
+           WHEN OLD.ReturnDate IS NULL AND NEW.ReturnDate IS NOT NULL
+           BEGIN
+               UPDATE Member SET MembershipStatus = 'Inactive'
+               WHERE MemberID = NEW.MemberID
+                 AND NOT EXISTS (SELECT 1 FROM BorrowingRecord
+                                 WHERE MemberID = NEW.MemberID AND ReturnDate IS NULL);
+           END;"""
+    ]
+]
+
+SCHEMA_VERSION = len(migrations)
+
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(migrations[version:], start=version + 1):
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        print(f"Applied schema migration {number}.")
+    return max(version, SCHEMA_VERSION)
+
+def parse_publication_year(value):
+    # Raises ValueError unless value is a year between 1000 and this year
+    year = int(value)
+    if year < 1000 or year > datetime.now().year:
+        raise ValueError("Invalid publication year")
+    return year
+
+def add_item(conn, Item, commit=True):
     try:
         sql = '''INSERT INTO Item (Title, Type, AuthorPublisher, AvailabilityStatus, ISBN, PublicationYear)
                  VALUES (?, ?, ?, ?, ?, ?)''' 
         cur = conn.cursor()
         cur.execute(sql, Item)
-        conn.commit()
+        if commit:
+            conn.commit()
         return cur.lastrowid  
     except sqlite3.Error as e:
         print(f"Error inserting item: {e}")
         return None
 
-def add_person(conn, Person):
+def add_person(conn, Person, commit=True):
     sql_check_email = '''SELECT 1 FROM Person WHERE Email = ?'''
     cur = conn.cursor()
     cur.execute(sql_check_email, (Person[3],))
@@ -158,81 +733,195 @@ def add_person(conn, Person):
         return None
     sql = '''INSERT INTO Person (Name, Address, PhoneNumber, Email, Role) VALUES (?, ?, ?, ?, ?)'''
     cur.execute(sql, Person)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_member(conn, Member):
+def add_member(conn, Member, commit=True):
     sql = '''INSERT INTO Member (MemberID, JoinDate, MembershipStatus) VALUES (?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, Member)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_librarian(conn, Librarian):
+def add_librarian(conn, Librarian, commit=True):
     sql = '''INSERT INTO Librarian (LibrarianID, HireDate, Salary) VALUES (?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, Librarian)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_volunteer(conn, Volunteer):
+def add_volunteer(conn, Volunteer, commit=True):
     sql = '''INSERT INTO Volunteer (VolunteerID, JoinDate, MembershipStatus) VALUES (?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, Volunteer)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_event(conn, Event):
+def add_event(conn, Event, commit=True):
     sql = '''INSERT INTO Event (EventName, EventDate, Attendance, MaxCapacity, RoomID) VALUES (?, ?, ?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, Event)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_library_room(conn, LibraryRoom):
+def add_library_room(conn, LibraryRoom, commit=True):
     sql = '''INSERT INTO LibraryRoom (Capacity, RoomType) VALUES (?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, LibraryRoom)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_borrowing_record(conn, BorrowingRecord):
+def add_borrowing_record(conn, BorrowingRecord, commit=True):
     sql = '''INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate, BorrowDate, FineAmount) VALUES (?, ?, ?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, BorrowingRecord)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_event_registration(conn, EventRegistration): 
+def add_event_registration(conn, EventRegistration, commit=True): 
     sql = '''INSERT INTO EventRegistration (EventID, MemberID) VALUES (?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, EventRegistration)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_donation(conn, Donation):
+def add_donation(conn, Donation, commit=True):
     sql = '''INSERT INTO Donation (DonorID, ItemID, DateReceived) VALUES (?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, Donation)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
-def add_donation_with_current_date(conn, donor_id, item_id):
+def add_donation_with_current_date(conn, donor_id, item_id, commit=True):
     cur = conn.cursor()
     cur.execute("""
             INSERT INTO Donation (DonorID, ItemID, DateReceived)
                 VALUES (?, ?, ?)
         """, (donor_id, item_id, datetime.now().strftime('%Y-%m-%d')))
-    conn.commit()
+    if commit:
+        conn.commit()
 
-def add_help_request(conn, HelpRequest):
+def add_help_request(conn, HelpRequest, commit=True):
     sql = '''INSERT INTO HelpRequest (MemberID, LibrarianID, RequestDate, Description, Status) VALUES (?, ?, ?, ?, ?)'''
     cur = conn.cursor()
     cur.execute(sql, HelpRequest)
-    conn.commit()
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
+# Bulk loading. Rows are inserted with executemany in batches of batch_size
+# (which bounds memory for generators) inside a single transaction, so a
+# whole import pays for one commit instead of one per row.
+BULK_BATCH_SIZE = 10000
+
+ITEM_COLUMNS = ('Title', 'Type', 'AuthorPublisher', 'AvailabilityStatus', 'ISBN', 'PublicationYear')
+PERSON_COLUMNS = ('Name', 'Address', 'PhoneNumber', 'Email', 'Role')
+MEMBER_COLUMNS = ('MemberID', 'JoinDate', 'MembershipStatus')
+BORROWING_RECORD_COLUMNS = ('MemberID', 'ItemID', 'DueDate', 'BorrowDate', 'FineAmount')
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def bulk_insert(conn, table, columns, rows, batch_size=BULK_BATCH_SIZE, commit=True):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    cur = conn.cursor()
+    count = 0
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    try:
+        for batch in chunked(rows, batch_size):
+            cur.executemany(sql, batch)
+            count += len(batch)
+        if commit:
+            conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return count
+
+@contextmanager
+def deferred_indexes(conn, table):
+    # Drop the secondary indexes on table, and the triggers that only keep
+    # derived data current (ItemSearch, the summaries and the DataVersion
+    # counters), for the duration of a bulk load. Afterwards the indexes are
+    # built in one pass, the new rows are added to ItemSearch, the summaries
+    # are recounted and each counter is bumped once: much cheaper than doing
+    # it row by row. Triggers that enforce rules (availability, member
+    # status) stay. Everything, the rebuild included, runs in one
+    # transaction, so a failed load or rebuild rolls back to the original
+    # schema.
+    saved = conn.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = ? AND sql IS NOT NULL
+          AND (type = 'index' OR (type = 'trigger' AND (name LIKE 'ItemSearch%'
+                                                        OR name LIKE '%Summary%'
+                                                        OR name LIKE '%Version%')))
+    """, (table,)).fetchall()
+    triggers = [name for kind, name, _ in saved if kind == 'trigger']
+    # the DataVersion rows the dropped version triggers bump
+    counters = sorted({counter for kind, name, sql in saved if kind == 'trigger' and 'Version' in name
+                       for counter in re.findall(r"WHERE Name = '(\w+)'", sql)})
+    last_id = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    for kind, name, _ in saved:
+        conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+    try:
+        yield
+        for _, _, sql in saved:
+            conn.execute(sql)
+        if any(name.startswith('ItemSearch') for name in triggers):
+            # index only the rows added by this load
+            conn.execute("""
+                INSERT INTO ItemSearch (rowid, Title, AuthorPublisher, ISBN, Type)
+                SELECT ItemID, Title, AuthorPublisher, ISBN, Type FROM Item WHERE ItemID > ?
+            """, (last_id,))
+        if any('Summary' in name for name in triggers):
+            summaries.recount(conn, table)
+        for counter in counters:
+            conn.execute("""
+                UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+                WHERE Name = ?
+            """, (counter,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def bulk_load(conn, table, columns, rows, batch_size=BULK_BATCH_SIZE, defer_indexes=False):
+    if not defer_indexes:
+        return bulk_insert(conn, table, columns, rows, batch_size)
+    with deferred_indexes(conn, table):
+        return bulk_insert(conn, table, columns, rows, batch_size, commit=False)
+
+def bulk_add_items(conn, items, batch_size=BULK_BATCH_SIZE, defer_indexes=False):
+    return bulk_load(conn, 'Item', ITEM_COLUMNS, items, batch_size, defer_indexes)
+
+def bulk_add_persons(conn, persons, batch_size=BULK_BATCH_SIZE, defer_indexes=False):
+    return bulk_load(conn, 'Person', PERSON_COLUMNS, persons, batch_size, defer_indexes)
+
+def bulk_add_members(conn, members, batch_size=BULK_BATCH_SIZE, defer_indexes=False):
+    return bulk_load(conn, 'Member', MEMBER_COLUMNS, members, batch_size, defer_indexes)
+
+def bulk_add_borrowing_records(conn, records, batch_size=BULK_BATCH_SIZE, defer_indexes=False):
+    return bulk_load(conn, 'BorrowingRecord', BORROWING_RECORD_COLUMNS, records, batch_size, defer_indexes)
+
 def populate_sample_data(conn):
+    # Everything below is written in one transaction and committed at the end
     # Sample LibraryRoom data
     rooms = [
         (30, 'Study Room'),
@@ -248,7 +937,7 @@ def populate_sample_data(conn):
     ]
 
     for room in rooms:
-        add_library_room(conn, room)
+        add_library_room(conn, room, commit=False)
 
     # Sample Person/Member data
     persons = [
@@ -295,16 +984,16 @@ def populate_sample_data(conn):
 
     for person in persons:
         name, address, phone, email, role = person
-        person_id = add_person(conn, (name, address, phone, email, role))
+        person_id = add_person(conn, (name, address, phone, email, role), commit=False)
         if person_id is None:
             print(f"Failed to add person {name}")
             continue
         if role == 'Member':
-            add_member(conn, (person_id, member_join_date, 'Active'))
+            add_member(conn, (person_id, member_join_date, 'Active'), commit=False)
         elif role == 'Volunteer':
-            add_volunteer(conn, (person_id, volunteer_join_date, 'Active'))
+            add_volunteer(conn, (person_id, volunteer_join_date, 'Active'), commit=False)
         elif role == 'Librarian':
-            add_librarian(conn, (person_id, librarian_hire_date, librarian_salary))
+            add_librarian(conn, (person_id, librarian_hire_date, librarian_salary), commit=False)
 
     # Sample Items
     items = [
@@ -342,7 +1031,7 @@ def populate_sample_data(conn):
     ]
 
     for item in items:
-        add_item(conn, item)
+        add_item(conn, item, commit=False)
     
     # Sample Events
     events = [
@@ -359,7 +1048,7 @@ def populate_sample_data(conn):
     ]
 
     for event in events:
-        add_event(conn, event)
+        add_event(conn, event, commit=False)
 
     event_registrations = [
         (1, 1),  # Member 1 registers for Book Club Meeting
@@ -375,7 +1064,7 @@ def populate_sample_data(conn):
     ]
 
     for event_registration in event_registrations:
-        add_event_registration(conn, event_registration)
+        add_event_registration(conn, event_registration, commit=False)
     
     donation = [
         (1, 1, '2025-01-01'),
@@ -391,7 +1080,7 @@ def populate_sample_data(conn):
     ]
     
     for donation_record in donation:
-        add_donation(conn, donation_record)
+        add_donation(conn, donation_record, commit=False)
 
     borrow = [
         (1, 1, '2024-03-01', '2024-03-31', 0.0),  
@@ -407,7 +1096,7 @@ def populate_sample_data(conn):
     ]
 
     for borrow_record in borrow:
-        add_borrowing_record(conn, borrow_record)
+        add_borrowing_record(conn, borrow_record, commit=False)
 
     help_requests = [
         (1, None, "2025-03-28", "Need help finding research papers on AI.", "Pending"),
@@ -423,41 +1112,80 @@ def populate_sample_data(conn):
     ]
     
     for help_request in help_requests:
-        add_help_request(conn, help_request)
-
-try:
-    with sqlite3.connect('library.db') as conn:
-        cursor = conn.cursor()
-
-        # execute table creation statements
-        for statement in sql_statements:
-            try:
-                cursor.execute(statement)
-            except sqlite3.OperationalError as e:
-                print(f"Warning: Could not execute statement - {e}")
-
-        # execute trigger creation statements
-        for trigger in triggers:
-            try:
-                cursor.execute(trigger)
-            except sqlite3.OperationalError as e:
-                print(f"Warning: Could not create trigger - {e}")
+        add_help_request(conn, help_request, commit=False)
 
-        conn.commit()
-        print("Database schema created successfully with tables and triggers.")
-except sqlite3.Error as e:
-    print("Failed to initialize database:", e)
+    conn.commit()
+
+def create_schema(conn):
+    cursor = conn.cursor()
+
+    # execute table creation statements
+    for statement in sql_statements:
+        try:
+            cursor.execute(statement)
+        except sqlite3.OperationalError as e:
+            print(f"Warning: Could not execute statement - {e}")
+
+    # execute trigger creation statements
+    for trigger in triggers:
+        try:
+            cursor.execute(trigger)
+        except sqlite3.OperationalError as e:
+            print(f"Warning: Could not create trigger - {e}")
+
+    conn.commit()
+    return migrate(conn)
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
 
-try:
-    with sqlite3.connect('library.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM Item")
-        item_count = cursor.fetchone()[0]
+def schema_mismatch(path, version):
+    # What the app and importer.py say about a database they won't use
+    return (f"{path} is at schema version {version}, but this code needs {SCHEMA_VERSION}. "
+            f"Run `python main.py init` to create or upgrade it.")
 
-        if item_count == 0:
+def init_db(path='library.db', sample_data=True):
+    # Create or upgrade the schema, and fill a new database with the sample
+    # data. Returns the version it found; a database that is already at
+    # SCHEMA_VERSION is left alone without reading or printing anything.
+    conn = sqlite3.connect(path)
+    try:
+        version = schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            return version
+        create_schema(conn)
+        print(f"Database schema is at version {SCHEMA_VERSION}.")
+        # Only a new database (or one from before versioning) can be empty
+        if sample_data and version == 0 and conn.execute("SELECT COUNT(*) FROM Item").fetchone()[0] == 0:
             populate_sample_data(conn)
             print("Sample data inserted successfully.")
-        else:
-            print("Database already contains data - skipping sample data insertion.")
-except sqlite3.Error as e:
-    print("Error working with sample data:", e)
\ No newline at end of file
+        return version
+    finally:
+        conn.close()
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Set up or upgrade the library database.")
+    parser.add_argument('command', nargs='?', choices=['init', 'migrate', 'version'], default='init',
+                        help="init: create or upgrade the schema, with sample data for a new database; "
+                             "migrate: the same without sample data; "
+                             "version: report the schema version (exit 1 if out of date)")
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'version':
+        conn = sqlite3.connect(args.db)
+        try:
+            version = schema_version(conn)
+        finally:
+            conn.close()
+        print(f"{args.db}: schema version {version} (this code expects {SCHEMA_VERSION})")
+        return 0 if version == SCHEMA_VERSION else 1
+    try:
+        init_db(args.db, sample_data=args.command == 'init')
+    except sqlite3.Error as e:
+        print("Failed to initialize database:", e)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,202 @@
+import argparse
+import heapq
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from itertools import groupby, islice
+
+from db import open_connection, run_transaction
+
+# "Members who borrowed this also borrowed" (shown on /find-item).
+#
+#   python recommend.py build        # recompute ItemNeighbor from all loans
+#   python recommend.py apply        # count loans queued since the last build
+#   python recommend.py show 42      # recommendations for item 42
+#
+# Two items are co-borrowed once for every member who borrowed both, looking
+# at each member's last HISTORY loans. build() counts every pair into
+# a sparse matrix (one Counter of neighbours per item, only non-zero cells)
+# and keeps the NEIGHBORS most co-borrowed neighbours of each item in
+# ItemNeighbor, ties broken by lower NeighborID.
+#
+# Between builds, the ItemNeighborQueue trigger (schema migration 9) only
+# queues each new loan in ItemNeighborPending, so borrowing and bulk loads
+# don't pay for the counting. apply_pending() adds the pairs of up to
+# `limit` queued loans in one transaction and trims the items it touched
+# back to the top NEIGHBORS; the app runs it on the writer after each
+# borrow. A pair that was trimmed away starts counting again from 1, so the
+# table drifts slowly from the exact counts; run the build nightly to reset
+# it. 'apply' with more than BUILD_THRESHOLD loans queued (after an import)
+# runs the build instead.
+
+NEIGHBORS = 10
+HISTORY = 100
+APPLY_LIMIT = 500
+BUILD_THRESHOLD = 20000
+
+NEIGHBORS_SQL = """
+    SELECT i.ItemID, i.Title, i.Type, i.AuthorPublisher, i.AvailabilityStatus, n.CoBorrows
+    FROM ItemNeighbor n
+    JOIN Item i ON i.ItemID = n.NeighborID
+    WHERE n.ItemID = ?
+    ORDER BY n.CoBorrows DESC, n.NeighborID
+    LIMIT ?
+"""
+
+
+def recommendations(conn, item_id, limit=5):
+    # One primary key range read of at most NEIGHBORS rows
+    return conn.execute(NEIGHBORS_SQL, (item_id, limit)).fetchall()
+
+
+def member_histories(conn, history=HISTORY):
+    # (member, distinct items of their last `history` loans, newest first)
+    rows = conn.execute("""
+        SELECT MemberID, ItemID FROM BorrowingHistory
+        ORDER BY MemberID, RecordID DESC
+    """)
+    for member, loans in groupby(rows, key=lambda row: row[0]):
+        yield member, list(dict.fromkeys(item for _, item in islice(loans, history)))
+
+
+def co_borrows(conn, history=HISTORY):
+    matrix = defaultdict(Counter)
+    for _, items in member_histories(conn, history):
+        for item in items:
+            row = matrix[item]
+            for other in items:
+                if other != item:
+                    row[other] += 1
+    return matrix
+
+
+def top_neighbors(matrix, k=NEIGHBORS):
+    for item, row in matrix.items():
+        for neighbor, count in heapq.nsmallest(k, row.items(), key=lambda cell: (-cell[1], cell[0])):
+            yield item, neighbor, count
+
+
+def _bump_version(conn):
+    # cached /find-item pages show recommendations
+    conn.execute("""
+        UPDATE DataVersion SET Version = Version + 1, UpdatedAt = CURRENT_TIMESTAMP
+        WHERE Name = 'Loan'
+    """)
+
+
+def _replace(conn, rows, counted):
+    conn.execute("DELETE FROM ItemNeighbor")
+    conn.executemany("INSERT INTO ItemNeighbor (ItemID, NeighborID, CoBorrows) VALUES (?, ?, ?)", rows)
+    conn.execute("DELETE FROM ItemNeighborPending WHERE RecordID <= ?", (counted,))
+    _bump_version(conn)
+    return conn.execute("SELECT COUNT(*) FROM ItemNeighbor").fetchone()[0]
+
+
+def build(conn, k=NEIGHBORS, history=HISTORY):
+    # The loans are counted from one read snapshot; the queued loans it
+    # covers are dropped with the old table, later ones stay queued
+    conn.execute("BEGIN")
+    try:
+        counted = conn.execute("SELECT COALESCE(MAX(RecordID), 0) FROM BorrowingHistory").fetchone()[0]
+        matrix = co_borrows(conn, history)
+    finally:
+        conn.rollback()
+    return run_transaction(conn, _replace, list(top_neighbors(matrix, k)), counted)
+
+
+def count_pending(conn, limit=APPLY_LIMIT):
+    # Adds the co-borrows of up to `limit` queued loans, oldest first, in
+    # the caller's transaction. A loan counts only if it is the member's
+    # first of that item, against the items of their previous `HISTORY`
+    # loans. Returns the number of loans taken off the queue.
+    queued = conn.execute("""
+        SELECT p.RecordID, b.MemberID, b.ItemID
+        FROM ItemNeighborPending p
+        LEFT JOIN BorrowingRecord b ON b.RecordID = p.RecordID
+        ORDER BY p.RecordID
+        LIMIT ?
+    """, (limit,)).fetchall()
+    pairs = Counter()
+    for record_id, member, item in queued:
+        if member is None or conn.execute("""
+            SELECT 1 FROM BorrowingHistory WHERE MemberID = ? AND ItemID = ? AND RecordID < ?
+        """, (member, item, record_id)).fetchone():
+            continue
+        previous = {row[0] for row in conn.execute("""
+            SELECT ItemID FROM BorrowingHistory
+            WHERE MemberID = ? AND RecordID < ?
+            ORDER BY RecordID DESC LIMIT ?
+        """, (member, record_id, HISTORY))}
+        previous.discard(item)
+        for other in previous:
+            pairs[item, other] += 1
+            pairs[other, item] += 1
+    conn.executemany("""
+        INSERT INTO ItemNeighbor (ItemID, NeighborID, CoBorrows) VALUES (?, ?, ?)
+        ON CONFLICT (ItemID, NeighborID) DO UPDATE SET CoBorrows = CoBorrows + excluded.CoBorrows
+    """, ((item, other, count) for (item, other), count in pairs.items()))
+    # each touched item back to its top NEIGHBORS (a primary key range each)
+    conn.executemany("""
+        DELETE FROM ItemNeighbor
+        WHERE ItemID = :item AND NeighborID NOT IN (
+            SELECT NeighborID FROM ItemNeighbor WHERE ItemID = :item
+            ORDER BY CoBorrows DESC, NeighborID LIMIT :keep
+        )
+    """, ({'item': item, 'keep': NEIGHBORS} for item in {item for item, _ in pairs}))
+    if queued:
+        conn.execute("DELETE FROM ItemNeighborPending WHERE RecordID <= ?", (queued[-1][0],))
+    if pairs:
+        _bump_version(conn)
+    return len(queued)
+
+
+def apply_pending(conn, limit=APPLY_LIMIT):
+    return run_transaction(conn, count_pending, limit)
+
+
+def pending(conn):
+    return conn.execute("SELECT COUNT(*) FROM ItemNeighborPending").fetchone()[0]
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Build and inspect the item recommendation table.")
+    parser.add_argument('command', choices=['build', 'apply', 'show'])
+    parser.add_argument('item_id', nargs='?', type=int)
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.db)
+    try:
+        if args.command == 'build':
+            start = time.perf_counter()
+            rows = build(conn)
+            print(f"ItemNeighbor rebuilt: {rows:,} rows in {time.perf_counter() - start:.2f}s")
+            return 0
+        if args.command == 'apply':
+            start = time.perf_counter()
+            queued = pending(conn)
+            if queued > BUILD_THRESHOLD:
+                rows = build(conn)
+                print(f"{queued:,} loans queued, ItemNeighbor rebuilt instead: {rows:,} rows "
+                      f"in {time.perf_counter() - start:.2f}s")
+                return 0
+            counted = 0
+            while True:
+                done = apply_pending(conn)
+                if not done:
+                    break
+                counted += done
+            print(f"Counted {counted:,} queued loans in {time.perf_counter() - start:.2f}s")
+            return 0
+        if args.item_id is None:
+            parser.error("show needs an item id")
+        for row in recommendations(conn, args.item_id, NEIGHBORS):
+            print(f"{row['ItemID']:>8}  {row['CoBorrows']:>5}  {row['Title']}")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
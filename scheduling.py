@@ -0,0 +1,152 @@
+import argparse
+import calendar
+import os
+import re
+import sys
+from datetime import datetime
+
+from db import open_connection
+
+# Room bookings for events.
+#
+#   python scheduling.py free 2025-06-01 10:00 12:00 --capacity 30
+#   python scheduling.py check
+#
+# Every event held in a room has a box in the EventSlot R*Tree (schema
+# migration 10): its room on one axis, its time in minutes on the other.
+# Finding what overlaps a slot is then an index search that only visits the
+# events near it, however many are booked that day. book_event() checks the
+# room's capacity and that the slot is free before inserting; run it in a
+# write transaction (write() in app.py) so two bookings can't both pass.
+
+TIME = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+OVERLAP_SQL = """
+    SELECT e.EventID, e.EventName, e.EventDate, e.StartTime, e.EndTime, e.RoomID
+    FROM EventSlot s
+    JOIN Event e ON e.EventID = s.EventID
+    WHERE s.MinRoom <= :room AND s.MaxRoom >= :room
+      AND s.StartMinute < :end AND s.EndMinute > :start
+    ORDER BY s.StartMinute
+"""
+
+FREE_ROOMS_SQL = """
+    SELECT RoomID, Capacity, RoomType FROM LibraryRoom
+    WHERE Capacity >= :capacity
+      AND RoomID NOT IN (SELECT MinRoom FROM EventSlot WHERE StartMinute < :end AND EndMinute > :start)
+    ORDER BY Capacity, RoomID
+    LIMIT :limit
+"""
+
+
+class BookingError(ValueError):
+    def __init__(self, message, conflicts=()):
+        super().__init__(message)
+        self.conflicts = list(conflicts)
+
+
+def minutes(day, time='00:00'):
+    # Same clock as the EventSlot triggers: strftime('%s', ...) / 60
+    return calendar.timegm(datetime.strptime(f'{day} {time}', '%Y-%m-%d %H:%M').timetuple()) // 60
+
+
+def slot(day, start=None, end=None):
+    # (start, end) minutes for a booking; no times means the whole day.
+    # Times are checked first so a bad one isn't reported as a bad date.
+    for value in (start, end):
+        if value is not None and not TIME.match(value):
+            raise BookingError(f"Invalid time {value!r}; use HH:MM.")
+    try:
+        begin = minutes(day, start or '00:00')
+    except ValueError:
+        raise BookingError(f"Invalid date {day!r}; use YYYY-MM-DD.")
+    if start is None and end is None:
+        return begin, begin + 1440
+    if start is None or end is None:
+        raise BookingError("Give both a start and an end time, or neither for an all-day event.")
+    if end <= start:
+        raise BookingError("The event must end after it starts.")
+    return begin, minutes(day, end)
+
+
+def conflicts(conn, room_id, day, start=None, end=None):
+    begin, finish = slot(day, start, end)
+    return conn.execute(OVERLAP_SQL, {'room': room_id, 'start': begin, 'end': finish}).fetchall()
+
+
+def free_rooms(conn, day, start=None, end=None, capacity=0, limit=10):
+    # Rooms big enough and free for the whole slot, smallest first
+    begin, finish = slot(day, start, end)
+    return conn.execute(FREE_ROOMS_SQL, {'capacity': capacity, 'start': begin, 'end': finish,
+                                         'limit': limit}).fetchall()
+
+
+def book_event(conn, name, day, start, end, room_id, max_capacity):
+    # Returns the new EventID, or raises BookingError
+    begin, finish = slot(day, start, end)
+    if max_capacity < 1:
+        raise BookingError("An event needs at least one place.")
+    room = conn.execute("SELECT Capacity FROM LibraryRoom WHERE RoomID = ?", (room_id,)).fetchone()
+    if room is None:
+        raise BookingError(f"Room {room_id} does not exist.")
+    if max_capacity > room[0]:
+        raise BookingError(f"Room {room_id} holds {room[0]}, fewer than the {max_capacity} places requested.")
+    clashes = conn.execute(OVERLAP_SQL, {'room': room_id, 'start': begin, 'end': finish}).fetchall()
+    if clashes:
+        raise BookingError(f"Room {room_id} is booked then for {clashes[0][1]}"
+                           + (f" and {len(clashes) - 1} more" if len(clashes) > 1 else "") + ".", clashes)
+    cur = conn.execute("""
+        INSERT INTO Event (EventName, EventDate, StartTime, EndTime, Attendance, MaxCapacity, RoomID)
+        VALUES (?, ?, ?, ?, 0, ?, ?)
+    """, (name, day, start, end, max_capacity, room_id))
+    return cur.lastrowid
+
+
+def double_bookings(conn):
+    # [(room, event, event)] for every pair of overlapping events in a room,
+    # e.g. ones added before bookings were checked
+    return conn.execute("""
+        SELECT a.MinRoom, a.EventID, b.EventID
+        FROM EventSlot a
+        JOIN EventSlot b ON b.MinRoom <= a.MaxRoom AND b.MaxRoom >= a.MinRoom
+                        AND b.StartMinute < a.EndMinute AND b.EndMinute > a.StartMinute
+        WHERE b.EventID > a.EventID
+        ORDER BY a.MinRoom, a.EventID
+    """).fetchall()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Room availability for events.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    free = subparsers.add_parser('free', help="rooms free for a slot")
+    free.add_argument('date')
+    free.add_argument('start', nargs='?')
+    free.add_argument('end', nargs='?')
+    free.add_argument('--capacity', type=int, default=0)
+    subparsers.add_parser('check', help="list rooms booked twice at once")
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.db)
+    try:
+        if args.command == 'free':
+            try:
+                rooms = free_rooms(conn, args.date, args.start, args.end, args.capacity)
+            except BookingError as e:
+                parser.error(str(e))
+            for room in rooms:
+                print(f"Room {room['RoomID']}: {room['RoomType']} (capacity {room['Capacity']})")
+            if not rooms:
+                print("No free room.")
+            return 0
+        clashes = double_bookings(conn)
+        for room, first, second in clashes:
+            print(f"Room {room}: events {first} and {second} overlap")
+        print(f"{len(clashes)} double bookings." if clashes else "No double bookings.")
+        return 1 if clashes else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,52 @@
+// Member typeahead used by the member pickers (templates/_member_picker.html)
+document.querySelectorAll('.member-lookup').forEach(lookup => {
+    const search = lookup.querySelector('.member-search');
+    const memberId = lookup.querySelector('input[name="member_id"]');
+    const results = lookup.querySelector('.member-results');
+    let timer = null;
+    let latest = 0;
+
+    function choose(member) {
+        memberId.value = member.id;
+        search.value = `${member.name} (ID: ${member.id})`;
+        results.innerHTML = '';
+        if (lookup.dataset.autosubmit === 'true') {
+            lookup.closest('form').submit();
+        }
+    }
+
+    function showResults(members) {
+        results.innerHTML = '';
+        members.forEach(member => {
+            const option = document.createElement('li');
+            option.textContent = `${member.name} (ID: ${member.id})`;
+            option.addEventListener('click', () => choose(member));
+            results.appendChild(option);
+        });
+    }
+
+    search.addEventListener('input', () => {
+        memberId.value = '';
+        clearTimeout(timer);
+        // Wait for a short pause in typing before asking the server
+        timer = setTimeout(() => {
+            const request = ++latest;
+            const url = `${lookup.dataset.lookupUrl}?q=${encodeURIComponent(search.value.trim())}`;
+            fetch(url)
+                .then(response => response.json())
+                .then(members => {
+                    // Ignore responses that arrive after a newer search
+                    if (request === latest) {
+                        showResults(members);
+                    }
+                });
+        }, 150);
+    });
+
+    lookup.closest('form').addEventListener('submit', e => {
+        if (!memberId.value) {
+            e.preventDefault();
+            alert('Please select your member profile first');
+        }
+    });
+});
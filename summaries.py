@@ -0,0 +1,152 @@
+import argparse
+import os
+import sys
+from datetime import date
+
+from db import open_connection, run_transaction
+
+# Dashboard counters. ItemTypeSummary, LoanDueSummary and FineSummary are
+# kept current by the *Summary triggers (schema migration 5), so reading them
+# costs one row per item type and per distinct due date, not a scan of Item
+# and BorrowingRecord.
+#
+#   python summaries.py check            # recount and diff against the tables
+#   python summaries.py check --repair   # ...and rebuild them if they drifted
+
+# The same counts computed from scratch
+ACTUAL_SQL = {
+    'ItemTypeSummary': """
+        SELECT Type, SUM(AvailabilityStatus IS 1), SUM(AvailabilityStatus IS NOT 1)
+        FROM Item GROUP BY Type
+    """,
+    'LoanDueSummary': """
+        SELECT DueDate, COUNT(*) FROM BorrowingRecord
+        WHERE ReturnDate IS NULL GROUP BY DueDate
+    """,
+    'FineSummary': """
+        SELECT 1, COALESCE(SUM(FineAmount), 0), COALESCE(SUM(FineAmount > 0), 0)
+        FROM BorrowingRecord
+    """,
+}
+
+STORED_SQL = {
+    'ItemTypeSummary': "SELECT Type, Available, OnLoan FROM ItemTypeSummary",
+    'LoanDueSummary': "SELECT DueDate, OpenLoans FROM LoanDueSummary",
+    'FineSummary': "SELECT SummaryID, FinesTotal, FinedLoans FROM FineSummary",
+}
+
+# Rows with nothing left in them are the same as missing rows
+EMPTY = {
+    'ItemTypeSummary': (0, 0),
+    'LoanDueSummary': (0,),
+    'FineSummary': (0, 0),
+}
+
+
+def read_summary(conn, today=None):
+    today = today or date.today().isoformat()
+    types = [dict(type=row[0], available=row[1], on_loan=row[2]) for row in conn.execute("""
+        SELECT Type, Available, OnLoan FROM ItemTypeSummary
+        WHERE Available > 0 OR OnLoan > 0
+        ORDER BY Type
+    """)]
+    open_loans, overdue = conn.execute("""
+        SELECT COALESCE(SUM(OpenLoans), 0),
+               COALESCE(SUM(CASE WHEN DueDate < ? THEN OpenLoans END), 0)
+        FROM LoanDueSummary
+    """, (today,)).fetchone()
+    fines = conn.execute("SELECT FinesTotal, FinedLoans FROM FineSummary").fetchone() or (0, 0)
+    return {
+        'date': today,
+        'types': types,
+        'available': sum(t['available'] for t in types),
+        'on_loan': sum(t['on_loan'] for t in types),
+        'open_loans': open_loans,
+        'overdue_loans': overdue,
+        'fines_total': round(fines[0], 2),
+        'fined_loans': fines[1],
+    }
+
+
+def _rows(conn, sql):
+    return {row[0]: tuple(row[1:]) for row in conn.execute(sql)}
+
+
+def _same(stored, actual):
+    # Fines are REAL sums updated one loan at a time, so allow rounding drift
+    return all(round(a - b, 6) == 0 for a, b in zip(stored, actual))
+
+
+def diff(conn):
+    # [(table, key, stored, actual)] for every counter that disagrees with a
+    # recount of the live tables
+    differences = []
+    for table, sql in ACTUAL_SQL.items():
+        stored = _rows(conn, STORED_SQL[table])
+        actual = _rows(conn, sql)
+        for key in sorted(set(stored) | set(actual), key=str):
+            expected = actual.get(key, EMPTY[table])
+            found = stored.get(key, EMPTY[table])
+            if not _same(found, expected):
+                differences.append((table, key, stored.get(key), actual.get(key)))
+    return differences
+
+
+# The summaries kept current by triggers on each table
+SOURCES = {
+    'Item': ('ItemTypeSummary',),
+    'BorrowingRecord': ('LoanDueSummary', 'FineSummary'),
+}
+
+
+def _rebuild(conn, tables=tuple(ACTUAL_SQL)):
+    for table in tables:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} {ACTUAL_SQL[table]}")
+
+
+def recount(conn, source):
+    # Rebuild the summaries counted from source in the caller's transaction,
+    # after a bulk load into source with the summary triggers dropped
+    _rebuild(conn, SOURCES.get(source, ()))
+
+
+def rebuild(conn):
+    run_transaction(conn, _rebuild)
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Check the dashboard summary tables against the live data.")
+    parser.add_argument('command', choices=['check', 'rebuild', 'show'])
+    parser.add_argument('--db', default=os.environ.get('LIBRARY_DB', 'library.db'))
+    parser.add_argument('--repair', action='store_true', help="rebuild the summaries if the check fails")
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.db)
+    try:
+        if args.command == 'show':
+            for name, value in read_summary(conn).items():
+                print(f"{name}: {value}")
+            return 0
+        if args.command == 'rebuild':
+            rebuild(conn)
+            print("Summaries rebuilt.")
+            return 0
+        differences = diff(conn)
+        for table, key, stored, actual in differences:
+            print(f"{table} [{key}]: stored {stored}, actual {actual}")
+        if not differences:
+            print("Summaries match the live tables.")
+            return 0
+        print(f"{len(differences)} summary rows out of date.")
+        if args.repair:
+            rebuild(conn)
+            print("Summaries rebuilt.")
+            return 0
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,56 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCache(Extension):
+    # {% cache 'Item', search_term, per_page %}...{% endcache %}
+    #
+    # The first argument names the DataVersion counter(s) the fragment is
+    # built from, the rest is whatever else it depends on. Rendered output is
+    # kept in environment.fragment_cache (an HTMLCache, or None to turn
+    # caching off) under the template, the tag's line, the key and the
+    # versions, so a change to the data is a miss rather than a stale hit.
+    #
+    # environment.fragment_versions(names) returns the versions the view read
+    # *before* querying the rows, or None if it didn't (the fragment is then
+    # rendered uncached). Reading them afterwards could file rows from before
+    # a concurrent write under the version after it.
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_versions=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(f'{parser.name}:{lineno}'), parser.parse_expression()]
+        key = []
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        args.append(nodes.List(key))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, location, names, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        names = (names,) if isinstance(names, str) else tuple(names)
+        versions = self.environment.fragment_versions(names)
+        if versions is None:
+            return caller()
+        cache_key = (location, tuple(key), versions)
+        body = cache.get(cache_key)
+        if body is None:
+            body = caller()
+            cache.put(cache_key, body)
+        return Markup(body)
+
+
+def precompile(environment):
+    # Load every template once, which compiles it into the bytecode cache if
+    # it isn't there already; later loads (and other workers) skip the parse
+    for name in environment.list_templates():
+        environment.get_template(name)
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+# app.py reads its settings when it is first imported, so point it at a
+# fresh database before any test imports it
+_tmp = tempfile.mkdtemp(prefix='library-tests-')
+DB_PATH = os.path.join(_tmp, 'library.db')
+os.environ['LIBRARY_DB'] = DB_PATH
+os.environ['LIBRARY_TEMPLATE_CACHE_DIR'] = os.path.join(_tmp, 'templates')
+
+import main  # noqa: E402
+
+main.init_db(DB_PATH)
+
+
+@pytest.fixture(scope='session')
+def library():
+    import app as library
+    library.app.config['TESTING'] = True
+    return library
+
+
+@pytest.fixture
+def client(library):
+    return library.app.test_client()
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A separate database with the schema and sample data, for jobs run
+    # directly against a connection
+    path = str(tmp_path / 'library.db')
+    main.init_db(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    # The schema with five items and three members, no loans
+    path = str(tmp_path / 'library.db')
+    main.init_db(path, sample_data=False)
+    conn = sqlite3.connect(path)
+    main.bulk_add_items(conn, ((f'Item {i}', 'Book', 'Author', 1, f'isbn-{i}', 2000) for i in range(1, 6)))
+    main.bulk_add_persons(conn, ((f'Member {i}', None, None, f'm{i}@test', 'Member') for i in range(1, 4)))
+    main.bulk_add_members(conn, ((i, '2024-01-01', 'Active') for i in range(1, 4)))
+    yield conn
+    conn.close()
+
+
+def lend(conn, member_id, item_id, due='2099-01-01', returned='now'):
+    # A loan, returned straight away unless returned is None
+    cur = conn.execute("INSERT INTO BorrowingRecord (MemberID, ItemID, DueDate) VALUES (?, ?, ?)",
+                       (member_id, item_id, due))
+    if returned is not None:
+        conn.execute("UPDATE BorrowingRecord SET ReturnDate = DATE(?) WHERE RecordID = ?", (returned, cur.lastrowid))
+    conn.commit()
+    return cur.lastrowid
@@ -0,0 +1,31 @@
+import threading
+import time
+
+
+def test_concurrent_first_requests_share_one_writer(library, monkeypatch):
+    real_writer, created = library.Writer, []
+
+    def slow_writer(*args, **kwargs):
+        # widen the window between the None check and the assignment
+        time.sleep(0.05)
+        created.append(real_writer(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(library, 'Writer', slow_writer)
+    monkeypatch.setattr(library, '_writer', None)
+    start = threading.Barrier(8)
+    writers = []
+
+    def first_request():
+        start.wait()
+        writers.append(library.get_writer())
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for writer in created:
+        writer.close()
+    assert len(created) == 1
+    assert all(writer is created[0] for writer in writers)
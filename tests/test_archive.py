@@ -0,0 +1,27 @@
+from conftest import lend
+
+import archive
+
+
+def loans(conn, table):
+    return {row[0] for row in conn.execute(f"SELECT RecordID FROM {table}")}
+
+
+def test_old_returned_loans_move_and_stay_in_history(empty_db):
+    old = [lend(empty_db, 1, item, due='2020-01-01', returned='2020-01-01') for item in (1, 2, 3)]
+    fined = lend(empty_db, 2, 4, due='2020-01-01', returned='2020-02-01')
+    empty_db.execute("UPDATE BorrowingRecord SET FineAmount = 3.0 WHERE RecordID = ?", (fined,))
+    recent = lend(empty_db, 2, 5, returned='2024-12-01')
+    out = lend(empty_db, 3, 1, returned=None)
+    empty_db.commit()
+    everything = loans(empty_db, 'BorrowingHistory')
+
+    report = archive.archive_loans(empty_db, days=365, today='2025-01-01', chunk_size=2)
+
+    assert report['moved'] == 3
+    assert loans(empty_db, 'BorrowingRecordArchive') == set(old)
+    assert loans(empty_db, 'BorrowingRecord') == {fined, recent, out}
+    assert loans(empty_db, 'BorrowingHistory') == everything
+    assert empty_db.execute("SELECT COUNT(*) FROM BorrowingHistory").fetchone()[0] == 6
+    # a second run finds nothing left to move
+    assert archive.archive_loans(empty_db, days=365, today='2025-01-01')['moved'] == 0
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+import main
+import summaries
+
+
+def versions(conn):
+    return dict(conn.execute("SELECT Name, Version FROM DataVersion"))
+
+
+def triggers(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+def test_deferred_load_recounts_summaries_and_bumps_versions_once(empty_db):
+    before, names = versions(empty_db), triggers(empty_db)
+    main.bulk_add_items(empty_db, ((f'Bulk {i}', 'DVD', 'Author', 1, f'bulk-{i}', 2000) for i in range(100)),
+                        defer_indexes=True)
+    assert versions(empty_db)['Item'] == before['Item'] + 1
+    main.bulk_add_borrowing_records(empty_db, ((1, item, '2099-01-01', '2024-01-01', 1.5) for item in range(6, 16)),
+                                    defer_indexes=True)
+    after = versions(empty_db)
+    assert summaries.diff(empty_db) == []
+    assert after['Loan'] == before['Loan'] + 1
+    assert triggers(empty_db) == names
+    assert empty_db.execute("SELECT COUNT(*) FROM ItemSearch WHERE ItemSearch MATCH 'bulk'").fetchone()[0] == 100
+
+
+def test_deferred_registration_load_bumps_event_version(empty_db):
+    before = versions(empty_db)
+    main.bulk_load(empty_db, 'EventRegistration', ('EventID', 'MemberID'), [(1, 1), (1, 2)], defer_indexes=True)
+    after = versions(empty_db)
+    assert after['Event'] == before['Event'] + 1
+    assert 'EventRegistration' not in after
+
+
+def test_failed_rebuild_restores_schema(empty_db, monkeypatch):
+    def fail(conn, source):
+        raise sqlite3.OperationalError("recount failed")
+
+    names, items = triggers(empty_db), empty_db.execute("SELECT COUNT(*) FROM Item").fetchone()[0]
+    indexes = empty_db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0]
+    monkeypatch.setattr(summaries, 'recount', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        main.bulk_add_items(empty_db, [('Lost', 'Book', 'Author', 1, 'lost', 2000)], defer_indexes=True)
+    assert not empty_db.in_transaction
+    assert triggers(empty_db) == names
+    assert empty_db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0] == indexes
+    assert empty_db.execute("SELECT COUNT(*) FROM Item").fetchone()[0] == items
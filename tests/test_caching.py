@@ -0,0 +1,26 @@
+def test_repeated_search_hits_fragment_cache(library, client):
+    cache = library.app.jinja_env.fragment_cache
+    assert client.get('/find-item?q=gatsby').status_code == 200
+    before = cache.stats()
+    response = client.get('/find-item?q=gatsby')
+    after = cache.stats()
+    assert response.status_code == 200
+    assert b'The Great Gatsby' in response.data
+    assert after['hits'] == before['hits'] + 1
+    assert after['misses'] == before['misses']
+
+
+def test_etag_revalidates_until_a_write(library, client):
+    first = client.get('/find-events')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+
+    again = client.get('/find-events', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    library.get_writer().run(lambda conn: conn.execute("UPDATE Event SET EventName = EventName WHERE EventID = 1"))
+    changed = client.get('/find-events', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert client.get('/find-events', headers={'If-None-Match': changed.headers['ETag']}).status_code == 304
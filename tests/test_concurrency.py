@@ -0,0 +1,69 @@
+import random
+import threading
+
+import main
+
+THREADS = 16
+
+
+def run_concurrently(library, requests, post):
+    # Each thread posts its share of requests through its own test client,
+    # all starting together; returns the responses
+    start = threading.Barrier(THREADS)
+    responses = []
+
+    def worker(count):
+        client = library.app.test_client()
+        start.wait()
+        for _ in range(count):
+            responses.append(post(client))
+
+    threads = [threading.Thread(target=worker, args=(requests // THREADS,)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def test_concurrent_borrows_never_lend_an_item_twice(library):
+    def add_items(conn):
+        first = conn.execute("SELECT COALESCE(MAX(ItemID), 0) + 1 FROM Item").fetchone()[0]
+        main.bulk_insert(conn, 'Item', main.ITEM_COLUMNS,
+                         ((f'Race Item {i}', 'Book', 'Author', 1, f'race-{i}', 2000) for i in range(5)), commit=False)
+        return list(range(first, first + 5))
+
+    items = library.get_writer().run(add_items)
+    members = [row[0] for row in library.get_writer().run(
+        lambda conn: conn.execute("SELECT MemberID FROM Member").fetchall())]
+    responses = run_concurrently(library, 320, lambda client: client.post('/borrow-item', data={
+        'member_id': random.choice(members), 'item_id': random.choice(items)}))
+    borrowed = sum(response.status_code == 302 for response in responses)
+
+    loans = library.get_writer().run(lambda conn: conn.execute(f"""
+        SELECT ItemID, COUNT(*) FROM BorrowingRecord
+        WHERE ReturnDate IS NULL AND ItemID IN ({', '.join('?' * len(items))})
+        GROUP BY ItemID
+    """, items).fetchall())
+    assert borrowed == len(items)
+    assert sorted(map(tuple, loans)) == [(item, 1) for item in items]
+
+
+def test_concurrent_registrations_never_overfill_an_event(library):
+    event_id = library.get_writer().run(lambda conn: conn.execute("""
+        INSERT INTO Event (EventName, EventDate, Attendance, MaxCapacity, RoomID)
+        VALUES ('Race Event', '2099-01-01', 0, 5, NULL)
+    """).lastrowid)
+    members = [row[0] for row in library.get_writer().run(
+        lambda conn: conn.execute("SELECT MemberID FROM Member").fetchall())]
+    assert len(members) > 5
+    run_concurrently(library, 320, lambda client: client.post('/find-events', data={
+        'member_id': random.choice(members), 'event_id': event_id,
+        'action': 'unregister' if random.random() < 0.2 else 'register'}))
+
+    attendance, capacity, registrations = library.get_writer().run(lambda conn: conn.execute("""
+        SELECT Attendance, MaxCapacity, (SELECT COUNT(*) FROM EventRegistration WHERE EventID = ?)
+        FROM Event WHERE EventID = ?
+    """, (event_id, event_id)).fetchone())
+    assert attendance <= capacity
+    assert attendance == registrations
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+from db import BATCH_SIZE_BUCKETS, Writer, batch_size_buckets
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / 'writes.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Note (NoteID INTEGER PRIMARY KEY, Body TEXT NOT NULL)")
+    conn.close()
+    writer = Writer(path, batch_size=64, batch_wait=0.1)
+    yield writer
+    writer.close()
+
+
+def add_note(conn, body):
+    return conn.execute("INSERT INTO Note (Body) VALUES (?)", (body,)).lastrowid
+
+
+def notes(writer):
+    conn = sqlite3.connect(writer.path)
+    try:
+        return [row[0] for row in conn.execute("SELECT Body FROM Note ORDER BY NoteID")]
+    finally:
+        conn.close()
+
+
+def test_grouped_writes_share_a_commit(writer):
+    futures = [writer.submit(add_note, f'note {i}', group=True) for i in range(20)]
+    ids = [future.result(5) for future in futures]
+    assert ids == list(range(1, 21))
+    assert notes(writer) == [f'note {i}' for i in range(20)]
+    stats = writer.stats()
+    assert stats['writes'] == 20
+    assert stats['batches'] < 20
+
+
+def test_failing_write_is_rolled_back_alone(writer):
+    def add_then_fail(conn, body):
+        add_note(conn, body)
+        conn.execute("INSERT INTO Note (Body) VALUES (NULL)")
+
+    futures = [writer.submit(add_note, 'before', group=True),
+               writer.submit(add_then_fail, 'half done', group=True),
+               writer.submit(add_note, 'after', group=True)]
+    assert futures[0].result(5) and futures[2].result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(5)
+    assert notes(writer) == ['before', 'after']
+    stats = writer.stats()
+    assert (stats['batches'], stats['failures']) == (1, 1)
+
+
+def test_size_buckets_cover_the_largest_batch(tmp_path):
+    assert batch_size_buckets(64) == BATCH_SIZE_BUCKETS
+    assert batch_size_buckets(1000)[-2:] == (512, 1024)
+    path = str(tmp_path / 'big.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Note (NoteID INTEGER PRIMARY KEY, Body TEXT NOT NULL)")
+    conn.close()
+    writer = Writer(path, batch_size=1000, batch_wait=0.2)
+    try:
+        futures = [writer.submit(add_note, f'note {i}', group=True) for i in range(300)]
+        for future in futures:
+            future.result(5)
+        stats = writer.stats()
+    finally:
+        writer.close()
+    buckets = dict(stats['batch_size_buckets'])
+    assert buckets[1024] == stats['batches']
+    assert buckets[256] < stats['batches']
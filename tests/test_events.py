@@ -0,0 +1,23 @@
+def test_register_for_missing_event(library, client):
+    response = client.post('/find-events', data={'action': 'register', 'member_id': 1, 'event_id': 9999},
+                           follow_redirects=True)
+    assert b'Event not found.' in response.data
+    assert b'maximum capacity' not in response.data
+
+
+def event_version(conn):
+    return conn.execute("SELECT Version FROM DataVersion WHERE Name = 'Event'").fetchone()[0]
+
+
+def test_rejected_registrations_write_nothing(library, empty_db):
+    empty_db.execute("INSERT INTO Event (EventName, EventDate, Attendance, MaxCapacity, RoomID) "
+                     "VALUES ('One place', '2025-01-01', 0, 1, 1)")
+    event_id = empty_db.execute("SELECT MAX(EventID) FROM Event").fetchone()[0]
+    assert library.register_for_event(empty_db, event_id, 1) == 'registered'
+    version = event_version(empty_db)
+    assert library.register_for_event(empty_db, event_id, 1) == 'already registered'
+    assert library.register_for_event(empty_db, event_id, 2) == 'full'
+    assert library.register_for_event(empty_db, 9999, 2) == 'no such event'
+    assert event_version(empty_db) == version
+    assert empty_db.execute("SELECT Attendance FROM Event WHERE EventID = ?", (event_id,)).fetchone()[0] == 1
+    assert empty_db.execute("SELECT COUNT(*) FROM EventRegistration").fetchone()[0] == 1
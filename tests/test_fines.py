@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import lend
+
+import fines
+
+
+def statuses(conn):
+    members = dict(conn.execute("SELECT MemberID, MembershipStatus FROM Member"))
+    items = dict(conn.execute("SELECT ItemID, AvailabilityStatus FROM Item"))
+    return members, items
+
+
+def test_fines_run_leaves_member_and_item_status_alone(empty_db):
+    # Member 1 returned item 1 late and still has item 2 out; item 1 has
+    # since been borrowed again by member 2
+    late = lend(empty_db, 1, 1, due='2024-01-01', returned='2024-03-01')
+    lend(empty_db, 1, 2, returned=None)
+    lend(empty_db, 2, 1, returned=None)
+    before = statuses(empty_db)
+    assert before == ({1: 'Active', 2: 'Active', 3: 'Active'}, {1: 0, 2: 0, 3: 1, 4: 1, 5: 1})
+
+    report = fines.compute_fines(empty_db, fines.load_schedule(), today='2025-01-01')
+
+    assert report['changed'] == 1
+    assert empty_db.execute("SELECT FineAmount FROM BorrowingRecord WHERE RecordID = ?",
+                            (late,)).fetchone()[0] > 0
+    assert statuses(empty_db) == before
+
+
+def test_last_return_makes_member_inactive(empty_db):
+    first = lend(empty_db, 1, 1, returned=None)
+    second = lend(empty_db, 1, 2, returned=None)
+    empty_db.execute("UPDATE BorrowingRecord SET ReturnDate = DATE('now') WHERE RecordID = ?", (first,))
+    assert statuses(empty_db)[0][1] == 'Active'
+    empty_db.execute("UPDATE BorrowingRecord SET ReturnDate = DATE('now') WHERE RecordID = ?", (second,))
+    assert statuses(empty_db)[0][1] == 'Inactive'
+
+
+def test_cli_exit_codes(db, tmp_path):
+    path = db.execute("PRAGMA database_list").fetchone()[2]
+    assert fines.cli(['--db', path, '--dry-run']) == 0
+    assert fines.cli(['--db', path, '--daily-rate', '-1']) == 1
+    assert fines.cli(['--db', str(tmp_path / 'missing' / 'library.db')]) == 1
+
+
+@pytest.mark.parametrize('size', ['0', '-5', 'ten'])
+def test_cli_rejects_bad_chunk_size(db, size):
+    path = db.execute("PRAGMA database_list").fetchone()[2]
+    with pytest.raises(SystemExit) as exit:
+        fines.cli(['--db', path, '--chunk-size', size])
+    assert exit.value.code == 2
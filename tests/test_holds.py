@@ -0,0 +1,43 @@
+def open_loan(conn, item_id):
+    return conn.execute("SELECT RecordID FROM BorrowingRecord WHERE ItemID = ? AND ReturnDate IS NULL",
+                        (item_id,)).fetchone()[0]
+
+
+def hold_statuses(conn, item_id):
+    return dict(conn.execute("SELECT MemberID, Status FROM Hold WHERE ItemID = ?", (item_id,)))
+
+
+def test_return_readies_the_oldest_hold_for_that_member_only(library, empty_db):
+    assert library.borrow(empty_db, 1, 1)
+    assert library.place_hold(empty_db, 2, 1) == ('placed', 1)
+    assert library.place_hold(empty_db, 3, 1) == ('placed', 2)
+    assert library.place_hold(empty_db, 2, 1) == ('already held', 1)
+
+    assert library.return_loan(empty_db, open_loan(empty_db, 1)) == 2
+    assert hold_statuses(empty_db, 1) == {2: 'Ready', 3: 'Waiting'}
+    assert empty_db.execute("SELECT AvailabilityStatus FROM Item WHERE ItemID = 1").fetchone()[0] == 0
+    assert library.place_hold(empty_db, 2, 1) == ('ready', 0)
+
+    assert not library.borrow(empty_db, 3, 1)
+    assert library.borrow(empty_db, 2, 1)
+    assert hold_statuses(empty_db, 1) == {2: 'Fulfilled', 3: 'Waiting'}
+
+    # the next return goes to the next in the queue
+    assert library.return_loan(empty_db, open_loan(empty_db, 1)) == 3
+    assert hold_statuses(empty_db, 1)[3] == 'Ready'
+
+
+def test_priority_hold_jumps_the_queue(library, empty_db):
+    assert library.borrow(empty_db, 1, 2)
+    library.place_hold(empty_db, 2, 2)
+    assert library.place_hold(empty_db, 3, 2, priority=1) == ('placed', 1)
+    assert library.return_loan(empty_db, open_loan(empty_db, 2)) == 3
+
+
+def test_return_without_holds_makes_item_available(library, empty_db):
+    assert library.borrow(empty_db, 1, 3)
+    assert library.place_hold(empty_db, 2, 3) == ('placed', 1)
+    empty_db.execute("UPDATE Hold SET Status = 'Cancelled' WHERE ItemID = 3")
+    assert library.return_loan(empty_db, open_loan(empty_db, 3)) is None
+    assert empty_db.execute("SELECT AvailabilityStatus FROM Item WHERE ItemID = 3").fetchone()[0] == 1
+    assert library.place_hold(empty_db, 2, 3) == ('available', None)
@@ -0,0 +1,23 @@
+import sqlite3
+
+import importer
+import main
+
+
+def test_import_needs_a_current_schema(tmp_path, capsys):
+    catalogue = tmp_path / 'catalogue.csv'
+    catalogue.write_text("Title,Type,AuthorPublisher\nImported,Book,Someone\n")
+    db = str(tmp_path / 'new.db')
+
+    assert importer.cli(['items', str(catalogue), '--db', db]) == 1
+    assert 'python main.py init' in capsys.readouterr().err
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    conn.close()
+
+    main.init_db(db, sample_data=False)
+    assert importer.cli(['items', str(catalogue), '--db', db]) == 0
+    assert importer.cli(['items', str(tmp_path / 'missing.csv'), '--db', db]) == 1
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT Title FROM Item").fetchall() == [('Imported',)]
+    conn.close()
@@ -0,0 +1,19 @@
+import sqlite3
+
+import main
+
+
+def test_duplicate_registrations_come_off_attendance(tmp_path):
+    # A database from before versioning, where a member could register twice
+    conn = sqlite3.connect(str(tmp_path / 'old.db'))
+    for statement in main.sql_statements + main.triggers:
+        conn.execute(statement)
+    conn.executemany("INSERT INTO Event (EventName, EventDate, Attendance, MaxCapacity, RoomID) VALUES (?, ?, ?, ?, 1)",
+                     [('Walk-ins and a double', '2025-01-01', 5, 10), ('No doubles', '2025-01-02', 2, 10)])
+    conn.executemany("INSERT INTO EventRegistration (EventID, MemberID) VALUES (?, ?)",
+                     [(1, 1), (1, 1), (1, 2), (2, 1), (2, 2)])
+    conn.commit()
+    main.migrate(conn)
+    assert conn.execute("SELECT Attendance FROM Event ORDER BY EventID").fetchall() == [(4,), (2,)]
+    assert conn.execute("SELECT COUNT(*) FROM EventRegistration").fetchone()[0] == 4
+    conn.close()
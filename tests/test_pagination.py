@@ -0,0 +1,86 @@
+import html
+import re
+import sqlite3
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def catalogue(empty_db):
+    # 5 items from empty_db plus 40 whose titles repeat "atlas" 1-4 times,
+    # so search scores vary and many of them tie
+    main.bulk_add_items(empty_db, ((' '.join(['Atlas'] * (1 + i % 4)) + f' {i}', 'Book', 'Author', 1,
+                                    f'atlas-{i}', 2000) for i in range(40)))
+    empty_db.row_factory = sqlite3.Row
+    return empty_db
+
+
+def cursor_of(library, row, query):
+    searching = query is not None
+    return library.parse_cursor(library.format_cursor(row, searching), searching)
+
+
+def walk(library, conn, query, per_page, before=None):
+    # Follow the next links from the first page, or the prev links from the
+    # page before the cursor `before`; returns the pages in display order
+    pages, cursor = [], before
+    while True:
+        after = None if before else cursor
+        rows, has_prev, has_next = library.get_item_page(conn, query, after, cursor if before else None, per_page)
+        pages.append([row['ItemID'] for row in rows])
+        if not (has_prev if before else has_next):
+            break
+        cursor = cursor_of(library, rows[0] if before else rows[-1], query)
+    return pages[::-1] if before else pages
+
+
+@pytest.mark.parametrize('query', [None, '"atlas"*'])
+def test_next_and_prev_pages_cover_every_item_once(library, catalogue, query):
+    everything = [row['ItemID'] for row in library.get_item_page(catalogue, query, None, None, 1000)[0]]
+    assert len(everything) == (45 if query is None else 40)
+
+    forward = walk(library, catalogue, query, per_page=7)
+    assert [item for page in forward for item in page] == everything
+    assert all(len(page) == 7 for page in forward[:-1])
+
+    # following prev links back from the last item reaches every other item
+    last = library.get_item_page(catalogue, query, None, None, 1000)[0][-1]
+    backward = walk(library, catalogue, query, per_page=7, before=cursor_of(library, last, query))
+    assert [item for page in backward for item in page] == everything[:-1]
+    assert all(len(page) == 7 for page in backward[1:])
+
+def test_search_order_breaks_score_ties_by_item_id(library, catalogue):
+    rows = library.get_item_page(catalogue, '"atlas"*', None, None, 1000)[0]
+    keys = [(row['Score'], row['ItemID']) for row in rows]
+    assert keys == sorted(keys)
+    assert len({row['Score'] for row in rows}) < len(rows)
+
+
+def titles_and_links(client, url):
+    page = client.get(url).data.decode()
+    titles = re.findall(r'<tr>\s*<td>(.*?)</td>', page)
+    links = {label: html.unescape(href)
+             for href, label in re.findall(r'<a href="([^"]*)">(?:&\w+; )?(Previous|Next)', page)}
+    return titles, links
+
+
+@pytest.mark.parametrize('q', ['', 'the'])
+def test_find_item_links_walk_the_results(client, q):
+    everything, _ = titles_and_links(client, f'/find-item?q={q}&per_page=200')
+    assert len(everything) > 6
+    seen, url, pages = [], f'/find-item?q={q}&per_page=3', []
+    while url:
+        titles, links = titles_and_links(client, url)
+        seen += titles
+        pages.append(url)
+        url = links.get('Next')
+    assert seen == everything
+    # and back again from the last page
+    titles, links = titles_and_links(client, pages[-1])
+    back = titles
+    while 'Previous' in links:
+        titles, links = titles_and_links(client, links['Previous'])
+        back = titles + back
+    assert back == everything
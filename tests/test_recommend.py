@@ -0,0 +1,31 @@
+from conftest import lend
+
+import recommend
+
+
+def neighbours(conn):
+    return dict(((item, other), count) for item, other, count in conn.execute(
+        "SELECT ItemID, NeighborID, CoBorrows FROM ItemNeighbor"))
+
+
+def test_loans_are_queued_and_counted_later(empty_db):
+    for member in (1, 2):
+        lend(empty_db, member, 1)
+        lend(empty_db, member, 2)
+    lend(empty_db, 1, 1)  # borrowed again: not a new co-borrow
+    assert neighbours(empty_db) == {}
+    assert recommend.pending(empty_db) == 5
+
+    assert recommend.apply_pending(empty_db) == 5
+    assert recommend.pending(empty_db) == 0
+    assert neighbours(empty_db) == {(1, 2): 2, (2, 1): 2}
+
+
+def test_incremental_counts_match_a_build(empty_db):
+    for member, item in [(1, 1), (1, 2), (1, 3), (2, 2), (2, 3), (3, 1), (3, 3), (3, 4)]:
+        lend(empty_db, member, item)
+    recommend.apply_pending(empty_db)
+    incremental = neighbours(empty_db)
+    recommend.build(empty_db)
+    assert neighbours(empty_db) == incremental
+    assert recommend.pending(empty_db) == 0
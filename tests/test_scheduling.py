@@ -0,0 +1,19 @@
+import pytest
+
+from scheduling import BookingError, slot
+
+
+@pytest.mark.parametrize('start, end', [('25:30', '26:00'), ('10:00', '9:60')])
+def test_bad_time_is_reported_as_a_time(start, end):
+    with pytest.raises(BookingError, match='Invalid time'):
+        slot('2025-06-01', start, end)
+
+
+def test_bad_date_is_reported_as_a_date():
+    with pytest.raises(BookingError, match='Invalid date'):
+        slot('2025-13-01', '10:00', '11:00')
+
+
+def test_events_export_has_times(client):
+    header = client.get('/export/events.csv').data.decode().splitlines()[0]
+    assert 'StartTime,EndTime' in header
@@ -0,0 +1,15 @@
+def test_rank_limit_bounds_matches_ranked(library, empty_db, monkeypatch):
+    query = library.fts_query('item')
+    monkeypatch.setitem(library.app.config, 'SEARCH_RANK_LIMIT', 3)
+    items, _, _ = library.get_item_page(empty_db, query, None, None, 50)
+    assert len(items) == 3
+    assert library.search_capped(empty_db, query)
+    monkeypatch.setitem(library.app.config, 'SEARCH_RANK_LIMIT', 0)
+    items, _, _ = library.get_item_page(empty_db, query, None, None, 50)
+    assert len(items) == 5
+    assert not library.search_capped(empty_db, query)
+
+
+def test_one_letter_search_is_not_a_prefix(library):
+    assert library.fts_query('i') == '"i"'
+    assert library.fts_query('gatsby it') == '"gatsby" "it"*'